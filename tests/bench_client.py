@@ -0,0 +1,769 @@
+#!/usr/bin/env python3
+"""
+bench_client.py - Microbenchmarks for the Python client helpers.
+
+Benchmarks that only exercise client-side encoding/decoding run without
+/dev/draw. Benchmarks that talk to the device say so in their header; pass
+--fake to run those against the userspace stand-in in drawfs_fake.py.
+"""
+
+import os
+import sys
+import mmap
+import time
+import select
+import struct
+import argparse
+
+# Add tests directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from drawfs_test import (
+    DrawSession, FrameBuilder, FrameDecoder, make_frame, make_msg, drain_batch, CODECS, ERROR_NAMES,
+    REQ_SURFACE_CREATE, REQ_SURFACE_DESTROY, REQ_SURFACE_PRESENT, RPL_SURFACE_CREATE,
+    RPL_SURFACE_DESTROY, RPL_SURFACE_PRESENT, RPL_ERROR, EVT_SURFACE_PRESENTED,
+    ERR_INVALID_HANDLE, FMT_XRGB8888, READ_SIZE
+)
+
+
+def _rate(count: int, elapsed: float) -> float:
+    return count / elapsed if elapsed > 0 else 0.0
+
+
+class _Session:
+    """Open a DrawSession on /dev/draw, or on a FakeDevice when fake=True."""
+
+    def __init__(self, fake: bool = False, **kwargs):
+        self.fake = fake
+        self.kwargs = kwargs
+        self.dev = None
+        self.session = None
+
+    def __enter__(self) -> DrawSession:
+        if not self.fake:
+            self.session = DrawSession(**self.kwargs).__enter__()
+            return self.session
+        from drawfs_fake import FakeDevice
+        self.dev = FakeDevice()
+        self.session = DrawSession(**self.kwargs)
+        self.session.fd = self.dev.fd
+        return self.session
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.dev is not None:
+            self.dev.close()
+            self.session.fd = None
+        else:
+            self.session.__exit__(exc_type, exc_val, exc_tb)
+        return False
+
+
+def _bar(value: float, peak: float, width: int = 40) -> str:
+    return "#" * max(1, int(width * value / peak)) if peak > 0 else ""
+
+
+def bench_frame_build(iterations: int, sizes=(1, 8, 64)):
+    """Compare make_frame against FrameBuilder for present-only frames."""
+    print(f"== Bench: frame build ({iterations} frames per size) ==")
+
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        for nmsgs in sizes:
+            start = time.perf_counter()
+            for i in range(iterations):
+                msgs = [
+                    make_msg(REQ_SURFACE_PRESENT, j, struct.pack("<IIQ", 1, 0, i))
+                    for j in range(nmsgs)
+                ]
+                os.write(devnull, make_frame(i, msgs))
+            old = _rate(iterations, time.perf_counter() - start)
+
+            fb = FrameBuilder()
+            start = time.perf_counter()
+            for i in range(iterations):
+                fb.begin(i)
+                for j in range(nmsgs):
+                    fb.add_surface_present(j, 1, i)
+                fb.write(devnull)
+            new = _rate(iterations, time.perf_counter() - start)
+
+            print(f"  {nmsgs:3d} msgs/frame: make_frame {old:10.0f} frames/s, "
+                  f"FrameBuilder {new:10.0f} frames/s ({new / old:.2f}x)")
+    finally:
+        os.close(devnull)
+
+
+def bench_window(iterations: int, fake: bool = False, depths=(1, 2, 4, 8, 16, 32, 64)):
+    """Sweep the pipelined in-flight window (device)."""
+    print(f"== Bench: pipelined window sweep ({iterations} presents per depth) ==")
+
+    rates = []
+    for depth in depths:
+        with _Session(fake, window=depth) as s:
+            s.hello()
+            s.display_open()
+            creates = [s.submit_surface_create(64, 64) for _ in range(depth)]
+            sids = [p.result()[1] for p in creates if p.result()[0] == 0]
+            if not sids:
+                print("  ERROR: no surfaces created")
+                return
+
+            start = time.perf_counter()
+            pending = []
+            for i in range(iterations):
+                pending.append(s.submit_surface_present(sids[i % len(sids)], i))
+                if len(pending) >= 1024:
+                    for p in pending:
+                        p.result()
+                    pending.clear()
+                    s.events.clear()
+            for p in pending:
+                p.result()
+            rate = _rate(iterations, time.perf_counter() - start)
+            rates.append((depth, rate))
+
+            for p in [s.submit_surface_destroy(sid) for sid in sids]:
+                p.result()
+
+    peak = max(r for _, r in rates)
+    for depth, rate in rates:
+        print(f"  window {depth:3d}: {rate:9.0f} ops/s {_bar(rate, peak)}")
+
+
+def bench_batch(iterations: int, fake: bool = False, count: int = 64):
+    """Create and destroy `count` surfaces one at a time vs. in batches (device)."""
+    rounds = max(1, iterations // (count * 2))
+    print(f"== Bench: surface churn, {count} surfaces x {rounds} rounds ==")
+
+    with _Session(fake) as s:
+        s.hello()
+        s.display_open()
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            sids = [s.surface_create(16, 16)[1] for _ in range(count)]
+            for sid in sids:
+                s.surface_destroy(sid)
+        single = _rate(rounds * count * 2, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            with s.batch() as b:
+                creates = [b.surface_create(16, 16) for _ in range(count)]
+            with s.batch() as b:
+                destroys = [b.surface_destroy(p.result()[1]) for p in creates]
+            for p in destroys:
+                p.result()
+        batched = _rate(rounds * count * 2, time.perf_counter() - start)
+        s.events.clear()
+
+    print(f"  one per write: {single:9.0f} ops/s")
+    print(f"  batched:       {batched:9.0f} ops/s ({batched / single:.2f}x)")
+
+
+def _drain_select_per_read(fd: int) -> int:
+    """The pre-bulk drain_all loop: one select() before every read()."""
+    dec = FrameDecoder()
+    drained = 0
+    while True:
+        readable, _, _ = select.select([fd], [], [], 0.1)
+        if fd not in readable:
+            return drained
+        dec.feed(os.read(fd, READ_SIZE))
+        for _ in dec:
+            drained += 1
+
+
+def bench_drain(iterations: int, fake: bool = False, burst: int = 64):
+    """Drain a burst of queued replies: select per read vs. one select (device)."""
+    rounds = max(1, iterations // burst)
+    print(f"== Bench: drain {burst}-present bursts x {rounds} rounds ==")
+
+    # 64 presents queue 64 * 96 bytes, inside the default max_evq_bytes.
+    with _Session(fake) as s:
+        s.hello()
+        s.display_open()
+        _, sid, _, _ = s.surface_create(64, 64)
+
+        results = []
+        for name, drain in (("select per read", lambda: _drain_select_per_read(s.fd)),
+                            ("drain_batch", lambda: len(drain_batch(s.fd, 100)))):
+            elapsed = 0.0
+            drained = 0
+            for i in range(rounds):
+                with s.batch() as b:
+                    for j in range(burst):
+                        b.surface_present(sid, j)
+                time.sleep(0.001)
+                start = time.perf_counter()
+                drained += drain()
+                elapsed += time.perf_counter() - start
+                # The handles were consumed by the raw drain above.
+                s._inflight.clear()
+            results.append((name, drained, elapsed))
+
+        s.surface_destroy(sid)
+
+    for name, drained, elapsed in results:
+        print(f"  {name:16s} {drained:7d} msgs  {_rate(drained, elapsed):10.0f} msgs/s")
+
+
+def bench_fill(iterations: int, width: int = 1920, height: int = 1080):
+    """Full-frame fills: per-pixel slices, per-row slices, numpy (no device)."""
+    from drawfs_pixels import SurfacePixels, xrgb
+
+    stride = width * 4
+    total = stride * height
+    print(f"== Bench: {width}x{height} XRGB8888 fill ==")
+
+    # An anonymous mapping has the same layout as a mapped surface.
+    mm = mmap.mmap(-1, total)
+    try:
+        color = struct.pack("<I", xrgb(0x20, 0x40, 0x80))
+        results = []
+
+        start = time.perf_counter()
+        for i in range(0, total, 4):
+            mm[i:i + 4] = color
+        results.append(("mm[i:i+4] per pixel", 1, time.perf_counter() - start))
+
+        frames = max(1, iterations // 1000)
+        row = color * width
+        start = time.perf_counter()
+        for _ in range(frames):
+            for y in range(height):
+                off = y * stride
+                mm[off:off + stride] = row
+        results.append(("mm[row] per row", frames, time.perf_counter() - start))
+
+        px = SurfacePixels(mm, stride, total)
+        frames = max(1, iterations // 100)
+        start = time.perf_counter()
+        for i in range(frames):
+            px.fill(i)
+        results.append(("numpy fill", frames, time.perf_counter() - start))
+        del px
+    finally:
+        mm.close()
+
+    base = _rate(results[0][1], results[0][2])
+    for name, frames, elapsed in results:
+        fps = _rate(frames, elapsed)
+        print(f"  {name:20s} {fps:10.1f} frames/s  {fps * total / 1e9:6.2f} GB/s  ({fps / base:.0f}x)")
+
+
+def bench_pacing(iterations: int, fake: bool = False, biases=(0.0, 0.5, 0.9, 1.0)):
+    """Unpaced present bursts vs. PresentPacer at several latency biases (device)."""
+    from drawfs_pacing import PresentPacer
+
+    count = min(iterations, 5000)
+    print(f"== Bench: present pacing ({count} presents per run) ==")
+
+    with _Session(fake, window=1024) as s:
+        s.hello()
+        s.display_open()
+        _, sid, _, _ = s.surface_create(64, 64)
+
+        # Unpaced: keep up to 1024 presents in flight and see what the
+        # kernel rejects once the event queue is full.
+        failed = 0
+        start = time.perf_counter()
+        pending = []
+        for i in range(count):
+            try:
+                pending.append(s.submit_surface_present(sid, i))
+            except OSError:
+                failed += 1
+                s.flush()
+        ok = sum(1 for p in pending if p.result()[0] == 0)
+        elapsed = time.perf_counter() - start
+        s.events.clear()
+        print(f"  unpaced            {_rate(ok, elapsed):9.0f} presents/s  "
+              f"failed writes {failed}")
+
+        for bias in biases:
+            pacer = PresentPacer(s, latency_bias=bias, headroom=1.0)
+            for i in range(count):
+                pacer.present(sid, i)
+            pacer.flush()
+            r = pacer.report()
+            print(f"  paced bias {bias:.1f}    {r['fps']:9.0f} presents/s  "
+                  f"in flight <= {r['inflight_high_water']:3d}  "
+                  f"queue high water {r['evq_high_water']:5d}B  "
+                  f"ENOSPC avoided {r['enospc_avoided']}  hit {r['enospc_hit']}")
+
+        pacer = PresentPacer(s, target_fps=240)
+        for i in range(min(count, 480)):
+            pacer.present(sid, i)
+        pacer.flush()
+        r = pacer.report()
+        print(f"  target 240 fps     {r['fps']:9.0f} presents/s achieved")
+
+        s.surface_destroy(sid)
+
+
+def bench_stats(iterations: int, fake: bool = False, interval_s: float = 0.001):
+    """get_stats() vs. StatsSampler.sample(), then sampling under load (device)."""
+    from drawfs_stats import StatsSampler
+
+    print(f"== Bench: stats sampling ({iterations} samples) ==")
+    if fake:
+        print("  skipped: DRAWFSGIOC_STATS needs /dev/draw")
+        return
+
+    with _Session(window=64) as s:
+        s.hello()
+        s.display_open()
+        _, sid, _, _ = s.surface_create(64, 64)
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            s.get_stats()
+        per_call = (time.perf_counter() - start) / iterations * 1e9
+        print(f"  get_stats()        {per_call:8.0f} ns/sample")
+
+        sampler = StatsSampler(s, capacity=iterations)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            sampler.sample()
+        per_sample = (time.perf_counter() - start) / iterations * 1e9
+        print(f"  sampler.sample()   {per_sample:8.0f} ns/sample")
+
+        start = time.perf_counter()
+        w = sampler.window()
+        decode = time.perf_counter() - start
+        print(f"  window decode      {decode * 1000:8.2f} ms for {w['samples']} samples")
+
+        sampler = StatsSampler(s, capacity=8192)
+        sampler.start(interval_s)
+        start = time.perf_counter()
+        for i in range(min(iterations, 5000)):
+            s.surface_present(sid, i)
+            s.read_presented_event()
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+        w = sampler.window()
+        o = sampler.overhead()
+        print(f"  under load: {w['samples']} samples at {1 / interval_s:.0f} Hz over {elapsed:.2f}s")
+        print(f"    frames/s {w['frames_per_s']:9.0f}  (peak {w['peak_frames_per_s']:9.0f})")
+        print(f"    msgs/s   {w['messages_per_s']:9.0f}  (peak {w['peak_messages_per_s']:9.0f})")
+        print(f"    in B/s   {w['bytes_in_per_s']:9.0f}  out B/s {w['bytes_out_per_s']:9.0f}  "
+              f"dropped/s {w['events_dropped_per_s']:.0f}")
+        print(f"    overhead {o['mean_ns']:.0f} ns mean, {o['max_ns']} ns max per sample, "
+              f"{o['mean_ns'] * o['samples'] / (elapsed * 1e9) * 100:.2f}% of wall time")
+
+        s.surface_destroy(sid)
+
+
+def _decode_payload_chain(msg_type: int, payload) -> list:
+    """The pre-registry drawfs_dump.decode_payload: an if/elif chain of format strings."""
+    def st(status):
+        return f"status: {status} ({os.strerror(status) if status else 'OK'})"
+    n = len(payload)
+    if msg_type == 0x0001 and n >= 12:
+        major, minor, flags, max_reply = struct.unpack_from("<HHII", payload, 0)
+        return [f"client_version: {major}.{minor}", f"flags: 0x{flags:08x}",
+                f"max_reply_bytes: {max_reply}"]
+    elif msg_type == 0x8001 and n >= 16:
+        status, major, minor, flags, max_reply = struct.unpack_from("<iHHII", payload, 0)
+        return [st(status), f"server_version: {major}.{minor}", f"flags: 0x{flags:08x}",
+                f"max_reply_bytes: {max_reply}"]
+    elif msg_type == 0x0011 and n >= 4:
+        return [f"display_id: {struct.unpack_from('<I', payload, 0)[0]}"]
+    elif msg_type == 0x8010 and n >= 8:
+        status, count = struct.unpack_from("<iI", payload, 0)
+        lines = [st(status), f"display_count: {count}"]
+        off = 8
+        for i in range(count):
+            if off + 20 <= n:
+                did, w, h, refresh, flags = struct.unpack_from("<IIIII", payload, off)
+                lines.append(f"  display[{i}]: id={did} {w}x{h} @ {refresh/1000:.1f}Hz flags=0x{flags:x}")
+                off += 20
+        return lines
+    elif msg_type == 0x8011 and n >= 12:
+        status, handle, active_id = struct.unpack_from("<iII", payload, 0)
+        return [st(status), f"display_handle: {handle}", f"active_display_id: {active_id}"]
+    elif msg_type == 0x0020 and n >= 16:
+        w, h, fmt, flags = struct.unpack_from("<IIII", payload, 0)
+        return [f"size: {w}x{h}", f"format: {'XRGB8888' if fmt == 1 else f'unknown({fmt})'}",
+                f"flags: 0x{flags:08x}"]
+    elif msg_type == 0x8020 and n >= 16:
+        status, sid, stride, total = struct.unpack_from("<iIII", payload, 0)
+        return [st(status), f"surface_id: {sid}", f"stride_bytes: {stride}", f"bytes_total: {total}"]
+    elif msg_type == 0x0021 and n >= 4:
+        return [f"surface_id: {struct.unpack_from('<I', payload, 0)[0]}"]
+    elif msg_type == 0x8021 and n >= 8:
+        status, sid = struct.unpack_from("<iI", payload, 0)
+        return [st(status), f"surface_id: {sid}"]
+    elif msg_type == 0x0022 and n >= 16:
+        sid, reserved, cookie = struct.unpack_from("<IIQ", payload, 0)
+        return [f"surface_id: {sid}", f"cookie: 0x{cookie:016x}"]
+    elif msg_type == 0x8022 and n >= 16:
+        status, sid, cookie = struct.unpack_from("<iIQ", payload, 0)
+        return [st(status), f"surface_id: {sid}", f"cookie: 0x{cookie:016x}"]
+    elif msg_type == 0x9002 and n >= 16:
+        sid, reserved, cookie = struct.unpack_from("<IIQ", payload, 0)
+        return [f"surface_id: {sid}", f"cookie: 0x{cookie:016x}"]
+    elif msg_type == 0x8FFF and n >= 12:
+        err_code, err_detail, err_offset = struct.unpack_from("<III", payload, 0)
+        err_name = ERROR_NAMES.get(err_code, f"unknown({err_code})")
+        return [f"err_code: {err_code} ({err_name})", f"err_detail: {err_detail}",
+                f"err_offset: {err_offset}"]
+    return []
+
+
+def _synthetic_capture(frames: int) -> bytes:
+    """A mixed client/kernel byte stream: create, present+event, destroy, errors."""
+    fb = FrameBuilder()
+    out = bytearray()
+    for i in range(frames):
+        fb.begin(i)
+        kind = i % 8
+        if kind == 0:
+            fb.add(REQ_SURFACE_CREATE, i, 256, 256, FMT_XRGB8888, 0)
+            fb.add(RPL_SURFACE_CREATE, i, 0, i, 1024, 262144)
+        elif kind == 7:
+            fb.add(REQ_SURFACE_DESTROY, i, i - 7)
+            fb.add(RPL_SURFACE_DESTROY, i, 0, i - 7)
+            fb.add(RPL_ERROR, i, ERR_INVALID_HANDLE, 0, 16)
+        else:
+            fb.add(REQ_SURFACE_PRESENT, i, i - kind, 0, i)
+            fb.add(RPL_SURFACE_PRESENT, i, 0, i - kind, i)
+            fb.add(EVT_SURFACE_PRESENTED, i, i - kind, 0, i)
+        out += fb.finish()
+    return bytes(out)
+
+
+def bench_codec(iterations: int):
+    """Decode a synthetic capture: if/elif chain vs. the CODECS registry (no device)."""
+    from drawfs_dump import decode_payload
+
+    capture = _synthetic_capture(iterations)
+    dec = FrameDecoder()
+    dec.feed(capture)
+    msgs = [(mh[0], bytes(payload)) for _, mh, payload in dec]
+    print(f"== Bench: payload decode ({len(msgs)} msgs, {len(capture)} bytes) ==")
+
+    def registry_values(msg_type, payload):
+        codec = CODECS.get(msg_type)
+        return codec.decode(payload) if codec is not None else None
+
+    rates = []
+    for name, decode in (("if/elif chain", _decode_payload_chain),
+                         ("CODECS + format", decode_payload),
+                         ("CODECS decode only", registry_values)):
+        start = time.perf_counter()
+        for msg_type, payload in msgs:
+            decode(msg_type, payload)
+        rates.append((name, _rate(len(msgs), time.perf_counter() - start)))
+
+    base = rates[0][1]
+    for name, rate in rates:
+        print(f"  {name:20s} {rate:10.0f} msgs/s ({rate / base:.2f}x)")
+
+
+def bench_record(iterations: int, fake: bool = False, rate: int = 100000):
+    """TrafficRecorder cost per frame, at 100k frames/s, and on a present loop (device)."""
+    import socket
+    import tempfile
+    from drawfs_capture import TrafficRecorder
+
+    print(f"== Bench: traffic recorder ({iterations} frames) ==")
+    fb = FrameBuilder()
+    fb.begin(1)
+    fb.add_surface_present(1, 1, 0)
+    frame = bytes(fb.finish())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Raw cost: one frame through a socket in each direction, with and
+        # without recording both copies.
+        a, b = socket.socketpair()
+        try:
+            results = []
+            for recorded in (False, True):
+                rec = TrafficRecorder(os.path.join(tmp, "raw.dfcap")) if recorded else None
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    a.send(frame)
+                    if rec is not None:
+                        rec.outbound(frame)
+                    data = b.recv(READ_SIZE)
+                    if rec is not None:
+                        rec.inbound(data)
+                results.append((time.perf_counter() - start) / iterations * 1e9)
+                if rec is not None:
+                    rec.close()
+                    dropped = rec.dropped
+        finally:
+            a.close()
+            b.close()
+        plain, recorded = results
+        print(f"  send+recv          {plain:8.0f} ns/frame pair")
+        print(f"  send+recv+record   {recorded:8.0f} ns/frame pair "
+              f"(+{(recorded - plain) / plain * 100:.1f}%, dropped {dropped})")
+
+        # Sustained: producer paced at `rate` frames/s for the writer thread to keep up with.
+        rec = TrafficRecorder(os.path.join(tmp, "rate.dfcap"))
+        interval = 1e9 / rate
+        put = rec.outbound
+        start = time.perf_counter_ns()
+        for i in range(iterations):
+            due = start + i * interval
+            while time.perf_counter_ns() < due:
+                pass
+            put(frame)
+        elapsed = (time.perf_counter_ns() - start) / 1e9
+        rec.close()
+        r = rec.report()
+        print(f"  paced {rate} fps: {_rate(iterations, elapsed):9.0f} frames/s recorded, "
+              f"written {r['written']}, dropped {r['dropped_outbound']}, "
+              f"ring high water {r['ring_high_water']}")
+
+        count = min(iterations, 20000)
+        for recorded in (False, True):
+            rec = TrafficRecorder(os.path.join(tmp, "session.dfcap")) if recorded else None
+            with _Session(fake, window=32, recorder=rec) as s:
+                s.hello()
+                s.display_open()
+                _, sid, _, _ = s.surface_create(64, 64)
+                start = time.perf_counter()
+                for i in range(count):
+                    s.submit_surface_present(sid, i)
+                    if s.events:
+                        s.events.clear()
+                s.flush()
+                elapsed = time.perf_counter() - start
+                s.events.clear()
+                s.surface_destroy(sid)
+            name = "recorded" if recorded else "plain"
+            extra = ""
+            if rec is not None:
+                rec.close()
+                extra = f"  ({rec.written} frames written, {rec.dropped} dropped)"
+            print(f"  presents {name:9s} {_rate(count, elapsed):9.0f} presents/s{extra}")
+
+
+def bench_pool(iterations: int, fake: bool = False,
+               sizes=((64, 64), (128, 128), (256, 64), (320, 240))):
+    """Surface churn: create/destroy every time vs. SurfacePool (device)."""
+    import random
+    from drawfs_latency import LatencyHistogram
+    from drawfs_pool import SurfacePool
+
+    count = min(iterations, 20000)
+    print(f"== Bench: surface churn, {len(sizes)} sizes, 4 live ({count} acquires) ==")
+    rng = random.Random(16)
+    plan = [sizes[rng.randrange(len(sizes))] for _ in range(count)]
+
+    with _Session(fake) as s:
+        s.hello()
+        s.display_open()
+
+        hist = LatencyHistogram()
+        live = []
+        start = time.perf_counter()
+        for w, h in plan:
+            t0 = time.perf_counter_ns()
+            _, sid, _, _ = s.surface_create(w, h)
+            hist.record(time.perf_counter_ns() - t0)
+            live.append(sid)
+            if len(live) > 4:
+                s.surface_destroy(live.pop(0))
+        elapsed = time.perf_counter() - start
+        for sid in live:
+            s.surface_destroy(sid)
+        print(f"  create/destroy  {_rate(count, elapsed):9.0f} surfaces/s  "
+              f"create p50 {hist.percentile(50) / 1000:7.1f}us  p99 {hist.percentile(99) / 1000:7.1f}us")
+
+        hist = LatencyHistogram()
+        live = []
+        with SurfacePool(s) as pool:
+            start = time.perf_counter()
+            for w, h in plan:
+                t0 = time.perf_counter_ns()
+                surf = pool.acquire(w, h)
+                hist.record(time.perf_counter_ns() - t0)
+                live.append(surf)
+                if len(live) > 4:
+                    pool.release(live.pop(0))
+            elapsed = time.perf_counter() - start
+            for surf in live:
+                pool.release(surf)
+            r = pool.report()
+        print(f"  SurfacePool     {_rate(count, elapsed):9.0f} surfaces/s  "
+              f"create p50 {hist.percentile(50) / 1000:7.1f}us  p99 {hist.percentile(99) / 1000:7.1f}us")
+        print(f"  hit rate {r['hit_rate'] * 100:.1f}%, creates saved {r['creates_saved']}, "
+              f"trimmed {r['trimmed']}")
+
+
+def _first_present(s: DrawSession) -> None:
+    _, sid, _, _ = s.surface_create(64, 64)
+    s.surface_present(sid, 1)
+    s.read_presented_event()
+    s.surface_destroy(sid)
+
+
+def bench_warm(iterations: int, fake: bool = False, size: int = 4):
+    """
+    Time to first present: cold sessions vs. SessionPool (device).  Under
+    --fake the get_stats() check on return always fails, so every pooled
+    session is discarded and refilled rather than reused.
+    """
+    from drawfs_latency import LatencyHistogram
+    from drawfs_pool import SessionPool
+
+    class Pool(SessionPool):
+        def _open(self):
+            ctx = _Session(fake)
+            s = ctx.__enter__()
+            s._bench_ctx = ctx
+            return s
+
+        def _close(self, session):
+            session._bench_ctx.__exit__(None, None, None)
+
+    count = min(iterations, 500)
+    print(f"== Bench: time to first present ({count} clients, pool of {size}) ==")
+
+    cold = LatencyHistogram()
+    start = time.perf_counter()
+    for _ in range(count):
+        t0 = time.perf_counter_ns()
+        with _Session(fake) as s:
+            s.hello()
+            s.display_open()
+            _first_present(s)
+            cold.record(time.perf_counter_ns() - t0)
+    cold_elapsed = time.perf_counter() - start
+
+    pooled = LatencyHistogram()
+    with Pool(size) as pool:
+        pool.fill()
+        start = time.perf_counter()
+        for _ in range(count):
+            t0 = time.perf_counter_ns()
+            with pool.session(timeout_s=1.0) as s:
+                _first_present(s)
+                pooled.record(time.perf_counter_ns() - t0)
+        pooled_elapsed = time.perf_counter() - start
+        r = pool.report()
+
+    for name, hist, elapsed in (("cold", cold, cold_elapsed), ("pooled", pooled, pooled_elapsed)):
+        print(f"  {name:7s} p50 {hist.percentile(50) / 1000:8.1f}us  "
+              f"p99 {hist.percentile(99) / 1000:8.1f}us  {_rate(count, elapsed):8.0f} clients/s")
+    print(f"  pool hit rate {r['hit_rate'] * 100:.1f}%, reused {r['reused']}, "
+          f"opened {r['opened']}, discarded {r['discarded']}")
+
+
+def bench_decode(size_mb: int = 2048, workers=(1, 2, 4, 8)):
+    """--summary of a synthetic multi-GB .dfcap across 1, 2, 4 and 8 worker processes."""
+    import tempfile
+    from drawfs_capture import (CAPTURE_MAGIC, CAPTURE_VERSION, HEADER_SIZE, HEADER_STRUCT,
+                                RECORD_STRUCT, TO_KERNEL, FROM_KERNEL)
+    from drawfs_dump import summarize_parallel
+
+    print(f"== Bench: parallel capture summary ({size_mb} MiB, {os.cpu_count()} CPUs) ==")
+    # One block of request/reply record pairs, repeated to the target size.
+    # The capture has no trailer, as if its writer never reached close().
+    fb = FrameBuilder()
+    block = bytearray()
+    for i in range(4096):
+        for direction, ts in ((TO_KERNEL, 1000 * i), (FROM_KERNEL, 1000 * i + 200 + i % 64)):
+            fb.begin(i)
+            if direction == TO_KERNEL:
+                fb.add_surface_present(i, 1, i)
+            else:
+                fb.add_msg(RPL_SURFACE_PRESENT, i, struct.pack("<iIQ", 0, 1, i))
+                fb.add_msg(EVT_SURFACE_PRESENTED, 0, struct.pack("<IIQ", 1, 0, i))
+            frame = fb.finish()
+            block += RECORD_STRUCT.pack(ts, 1, len(frame), direction, 0) + frame
+    repeats = max(1, (size_mb << 20) // len(block))
+    records = repeats * 8192
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "big.dfcap")
+        with open(path, "wb") as f:
+            f.write(HEADER_STRUCT.pack(CAPTURE_MAGIC, CAPTURE_VERSION, HEADER_SIZE, 0, 0))
+            for _ in range(repeats):
+                f.write(block)
+
+        base = elapsed = None
+        for n in workers:
+            start = time.perf_counter()
+            r = summarize_parallel(path, n).report()
+            elapsed_n = time.perf_counter() - start
+            del r['pending_high_water']
+            if base is None:
+                base, elapsed = r, elapsed_n
+            same = "same report" if r == base else "REPORT DIFFERS"
+            print(f"  {n} worker(s)  {elapsed_n:8.2f} s  {_rate(records, elapsed_n):10.0f} records/s"
+                  f"  x{elapsed / elapsed_n:.2f}  {same}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Client helper microbenchmarks")
+    parser.add_argument("--iterations", "-n", type=int, default=20000,
+                        help="Number of iterations per benchmark")
+    parser.add_argument("--test", "-t",
+                        choices=["build", "window", "batch", "drain", "fill", "pacing", "stats", "pool", "warm", "codec", "record", "decode", "all"],
+                        default="all", help="Which benchmark to run")
+    parser.add_argument("--capture-mb", type=int, default=2048,
+                        help="Size of the synthetic capture for -t decode")
+    parser.add_argument("--fake", action="store_true",
+                        help="Run device benchmarks against drawfs_fake.FakeDevice")
+    args = parser.parse_args()
+
+    print("Client helper benchmarks")
+    print()
+
+    if args.test in ("build", "all"):
+        bench_frame_build(args.iterations)
+        print()
+
+    if args.test in ("window", "all"):
+        bench_window(args.iterations, args.fake)
+        print()
+
+    if args.test in ("batch", "all"):
+        bench_batch(args.iterations, args.fake)
+        print()
+
+    if args.test in ("drain", "all"):
+        bench_drain(args.iterations, args.fake)
+        print()
+
+    if args.test in ("fill", "all"):
+        bench_fill(args.iterations)
+        print()
+
+    if args.test in ("pacing", "all"):
+        bench_pacing(args.iterations, args.fake)
+        print()
+
+    if args.test in ("stats", "all"):
+        bench_stats(args.iterations, args.fake)
+        print()
+
+    if args.test in ("pool", "all"):
+        bench_pool(args.iterations, args.fake)
+        print()
+
+    if args.test in ("warm", "all"):
+        bench_warm(args.iterations, args.fake)
+        print()
+
+    if args.test in ("codec", "all"):
+        bench_codec(args.iterations)
+        print()
+
+    if args.test in ("record", "all"):
+        bench_record(args.iterations, args.fake)
+        print()
+
+    if args.test in ("decode", "all"):
+        bench_decode(args.capture_mb)
+        print()
+
+
+if __name__ == "__main__":
+    main()
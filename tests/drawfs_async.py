@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+drawfs_async.py - asyncio client for drawfs.
+
+AsyncDrawSession opens /dev/draw non-blocking and registers the fd with
+loop.add_reader(), so one event loop can drive many sessions without a
+thread per session.  Replies are matched to per-msg_id futures; events are
+queued and delivered through an async iterator.
+
+    async with AsyncDrawSession() as s:
+        await s.hello()
+        await s.display_open()
+        status, sid, stride, total = await s.surface_create(256, 256)
+        status, _, _ = await s.present(sid, cookie=1)
+        async for msg_type, msg_id, payload in s.events():
+            ...
+
+Return values match the blocking DrawSession methods, except hello() which
+returns (msg_type, payload) like display_open().
+"""
+
+import asyncio
+import os
+import struct
+from collections import deque
+from typing import Optional, Tuple, Dict, Deque, Callable
+
+from drawfs_test import (
+    DEV, FrameBuilder, FrameDecoder, FrameError,
+    REQ_HELLO, REQ_DISPLAY_LIST, REQ_DISPLAY_OPEN,
+    HELLO_REQ, DISPLAY_OPEN_REQ, FMT_XRGB8888, EVT_SURFACE_PRESENTED,
+    is_event, _decode_generic_reply, _decode_create_reply,
+    _decode_destroy_reply, _decode_present_reply,
+)
+
+
+class AsyncDrawSession:
+    """
+    A drawfs session driven by an asyncio event loop.
+
+    Use as an async context manager to open `dev`, or call attach() with an
+    fd that is already open (the session then leaves closing it to the
+    caller).  All methods must be called from the loop's thread.
+
+    Replies nobody is waiting for any more (the request timed out) are
+    dropped and counted in stray_replies; only events reach event_queue.
+    """
+
+    def __init__(self, dev: str = DEV, timeout_ms: int = 2000):
+        self.dev = dev
+        self.timeout_ms = timeout_ms
+        self.fd: Optional[int] = None
+        self.decoder = FrameDecoder()
+        self.event_queue: Deque[Tuple[int, int, bytes]] = deque()
+        self.stray_replies = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._owns_fd = False
+        self._inflight: Dict[int, Tuple[asyncio.Future, Callable, tuple]] = {}
+        self._event_waiter: Optional[asyncio.Future] = None
+        self._error: Optional[BaseException] = None
+        self._builder = FrameBuilder()
+        self._out = bytearray()
+        self._frame_id = 0
+        self._msg_id = 0
+
+    async def __aenter__(self) -> 'AsyncDrawSession':
+        self.attach(os.open(self.dev, os.O_RDWR | os.O_NONBLOCK))
+        self._owns_fd = True
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def attach(self, fd: int) -> None:
+        """Drive an already open fd from the running loop."""
+        os.set_blocking(fd, False)
+        self.fd = fd
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(fd, self._on_readable)
+
+    def close(self) -> None:
+        """Unregister the fd, fail outstanding requests and wake event readers."""
+        if self.fd is None:
+            return
+        self._loop.remove_reader(self.fd)
+        if self._out:
+            self._loop.remove_writer(self.fd)
+            del self._out[:]
+        if self._owns_fd:
+            os.close(self.fd)
+            self._owns_fd = False
+        self.fd = None
+        self._shutdown(ConnectionError("Session closed"))
+
+    @property
+    def inflight(self) -> int:
+        """Number of requests still waiting for a reply."""
+        return len(self._inflight)
+
+    # -------------------------------------------------------------------------
+    # Loop callbacks
+    # -------------------------------------------------------------------------
+
+    def _on_readable(self) -> None:
+        # The kernel hands out one frame per read; keep reading until it
+        # reports EWOULDBLOCK so a single wakeup drains the queue.
+        while True:
+            try:
+                n = self.decoder.readfrom(self.fd)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                self._abort(e)
+                return
+            if n == 0:
+                self._abort(EOFError("End of stream"))
+                return
+            try:
+                for _, mh, payload in self.decoder:
+                    self._dispatch(mh[0], mh[3], payload)
+            except FrameError as e:
+                self._abort(e)
+                return
+
+    def _on_writable(self) -> None:
+        try:
+            n = os.write(self.fd, self._out)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._abort(e)
+            return
+        del self._out[:n]
+        if not self._out:
+            self._loop.remove_writer(self.fd)
+
+    def _dispatch(self, msg_type: int, msg_id: int, payload) -> None:
+        if not is_event(msg_type):
+            entry = self._inflight.pop(msg_id, None)
+            if entry is None:
+                # A late reply to a request that timed out.
+                self.stray_replies += 1
+                return
+            fut, decode, request = entry
+            if not fut.done():
+                try:
+                    fut.set_result(decode(msg_type, payload, request))
+                except Exception as e:
+                    fut.set_exception(e)
+            return
+        self.event_queue.append((msg_type, msg_id, bytes(payload)))
+        waiter = self._event_waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _abort(self, error: BaseException) -> None:
+        """Stop reading after a fatal error on the fd."""
+        self._loop.remove_reader(self.fd)
+        self._shutdown(error)
+
+    def _shutdown(self, error: BaseException) -> None:
+        self._error = error
+        inflight, self._inflight = self._inflight, {}
+        for fut, _, _ in inflight.values():
+            if not fut.done():
+                fut.set_exception(error)
+        waiter = self._event_waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    # -------------------------------------------------------------------------
+    # Requests
+    # -------------------------------------------------------------------------
+
+    def _send(self, data) -> None:
+        if self._out:
+            self._out += data
+            return
+        try:
+            n = os.write(self.fd, data)
+        except BlockingIOError:
+            n = 0
+        if n < len(data):
+            self._out += data[n:]
+            self._loop.add_writer(self.fd, self._on_writable)
+
+    async def _request(self, encode: Callable, decode: Callable, request: tuple,
+                       timeout_ms: Optional[int]):
+        if self._error is not None:
+            raise self._error
+        self._frame_id += 1
+        self._msg_id += 1
+        mid = self._msg_id
+        fb = self._builder.begin(self._frame_id)
+        encode(fb, mid)
+        fut = self._loop.create_future()
+        self._inflight[mid] = (fut, decode, request)
+        try:
+            self._send(fb.finish())
+        except OSError:
+            del self._inflight[mid]
+            raise
+        if timeout_ms is None:
+            timeout_ms = self.timeout_ms
+        try:
+            return await asyncio.wait_for(fut, timeout_ms / 1000.0)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No reply for msg_id {mid} ({timeout_ms}ms)") from None
+        finally:
+            self._inflight.pop(mid, None)
+
+    async def hello(self, timeout_ms: Optional[int] = None) -> Tuple[int, bytes]:
+        """Send HELLO. Returns (msg_type, payload)."""
+        return await self._request(
+            lambda fb, mid: fb.add_packed(REQ_HELLO, mid, HELLO_REQ, 1, 0, 0, 65536),
+            _decode_generic_reply, (), timeout_ms)
+
+    async def display_list(self, timeout_ms: Optional[int] = None) -> Tuple[int, bytes]:
+        """Send DISPLAY_LIST. Returns (msg_type, payload)."""
+        return await self._request(lambda fb, mid: fb.add_msg(REQ_DISPLAY_LIST, mid),
+                                   _decode_generic_reply, (), timeout_ms)
+
+    async def display_open(self, display_id: int = 1,
+                           timeout_ms: Optional[int] = None) -> Tuple[int, bytes]:
+        """Send DISPLAY_OPEN. Returns (msg_type, payload)."""
+        return await self._request(
+            lambda fb, mid: fb.add_packed(REQ_DISPLAY_OPEN, mid, DISPLAY_OPEN_REQ, display_id),
+            _decode_generic_reply, (), timeout_ms)
+
+    async def surface_create(self, width: int, height: int, fmt: int = FMT_XRGB8888,
+                             timeout_ms: Optional[int] = None) -> Tuple[int, int, int, int]:
+        """Send SURFACE_CREATE. Returns (status, surface_id, stride, total_bytes)."""
+        return await self._request(
+            lambda fb, mid: fb.add_surface_create(mid, width, height, fmt),
+            _decode_create_reply, (width, height, fmt), timeout_ms)
+
+    async def surface_destroy(self, surface_id: int, timeout_ms: Optional[int] = None) -> int:
+        """Send SURFACE_DESTROY. Returns status."""
+        return await self._request(
+            lambda fb, mid: fb.add_surface_destroy(mid, surface_id),
+            _decode_destroy_reply, (surface_id,), timeout_ms)
+
+    async def present(self, surface_id: int, cookie: int = 0,
+                      timeout_ms: Optional[int] = None) -> Tuple[int, int, int]:
+        """Send SURFACE_PRESENT. Returns (status, surface_id, cookie)."""
+        return await self._request(
+            lambda fb, mid: fb.add_surface_present(mid, surface_id, cookie),
+            _decode_present_reply, (surface_id, cookie), timeout_ms)
+
+    surface_present = present
+
+    # -------------------------------------------------------------------------
+    # Events
+    # -------------------------------------------------------------------------
+
+    async def next_event(self, timeout_ms: Optional[int] = None) -> Tuple[int, int, bytes]:
+        """Return the next event (msg_type, msg_id, payload), waiting if needed."""
+        while not self.event_queue:
+            if self._error is not None:
+                raise self._error
+            self._event_waiter = self._loop.create_future()
+            try:
+                if timeout_ms is None:
+                    await self._event_waiter
+                else:
+                    await asyncio.wait_for(self._event_waiter, timeout_ms / 1000.0)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Timeout waiting for event ({timeout_ms}ms)") from None
+            finally:
+                self._event_waiter = None
+        return self.event_queue.popleft()
+
+    async def events(self):
+        """Yield events as they arrive until the session is closed."""
+        while True:
+            try:
+                yield await self.next_event()
+            except (ConnectionError, EOFError):
+                return
+
+    async def presented(self, timeout_ms: Optional[int] = None) -> Tuple[int, int, int]:
+        """Wait for the next SURFACE_PRESENTED event. Returns (surface_id, reserved, cookie)."""
+        mt, _, payload = await self.next_event(timeout_ms)
+        if mt != EVT_SURFACE_PRESENTED:
+            raise RuntimeError(f"Expected SURFACE_PRESENTED event, got 0x{mt:04x}")
+        return struct.unpack_from("<IIQ", payload, 0)
@@ -0,0 +1,771 @@
+#!/usr/bin/env python3
+"""
+drawfs_capture.py - Timestamped .dfcap capture files of drawfs traffic.
+
+A capture holds whole frames as they crossed /dev/draw, each tagged with
+a time.monotonic_ns() timestamp, its direction and the session it belongs
+to.  CaptureWriter appends records from a background thread through a
+buffered file; close() writes a footer index so CaptureReader can find
+records by time, frame_id or msg_id with a binary search over the mmapped
+file instead of a scan:
+
+    with CaptureWriter("run.dfcap") as cap:
+        cap.write(TO_KERNEL, session_id, frame_bytes)
+        cap.write(FROM_KERNEL, session_id, reply_frame)
+
+    with CaptureReader("run.dfcap") as cap:
+        for rec in cap:                      # file order
+            ...
+        rec = cap.at_time(t_ns)              # first record at or after t_ns
+        reqs = cap.by_msg_id(42)             # request and reply records
+        frames = cap.by_frame_id(7, session_id=1)
+
+File layout (little-endian):
+
+    header   magic 'DFC1', version, header_bytes, wall_ns, mono_ns
+    records  ts_ns, session_id, frame_len, direction, flags, pad
+             followed by the frame, padded to 4 bytes
+    index    time entries, then frame_id entries, then msg_id entries;
+             each entry is (key, record offset), sorted by key
+    trailer  index offset, the three entry counts, record count, magic 'DFCX'
+
+frame_id and msg_id keys are (id << 32) | session_id.  A capture whose
+writer never reached close() has no trailer; the reader rebuilds the index
+in memory with one scan and sets indexed=False.
+
+TrafficRecorder records a DrawSession into a capture through lock-free
+rings that never block the session
+(DrawSession(recorder=TrafficRecorder("run.dfcap", session_id=1))).
+
+Summarise a capture, or decode every frame with --frames (the same as
+drawfs_dump.py --file run.dfcap):
+
+    python3 tests/drawfs_capture.py run.dfcap
+    python3 tests/drawfs_capture.py --frames run.dfcap
+"""
+
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from drawfs_test import DRAWFS_MAGIC, FH_SIZE, FH_STRUCT, MH_SIZE, MH_STRUCT
+
+CAPTURE_MAGIC = b"DFC1"
+TRAILER_MAGIC = b"DFCX"
+CAPTURE_VERSION = 1
+
+# Record directions
+TO_KERNEL = 0       # written by the client
+FROM_KERNEL = 1     # read by the client
+
+DIRECTION_NAMES = {TO_KERNEL: "client->kernel", FROM_KERNEL: "kernel->client"}
+
+HEADER_STRUCT = struct.Struct("<4sHHQQ")     # magic, version, header_bytes, wall_ns, mono_ns
+RECORD_STRUCT = struct.Struct("<QIIBB2x")    # ts_ns, session_id, frame_len, direction, flags
+INDEX_STRUCT = struct.Struct("<QQ")          # key, record offset
+TRAILER_STRUCT = struct.Struct("<QQQQQ4s")   # index offset, time/frame/msg entries, records, magic
+
+HEADER_SIZE = HEADER_STRUCT.size
+RECORD_SIZE = RECORD_STRUCT.size
+INDEX_SIZE = INDEX_STRUCT.size
+TRAILER_SIZE = TRAILER_STRUCT.size
+
+ID_SHIFT = 32
+
+
+def _id_key(ident: int, session_id: int) -> int:
+    return (ident << ID_SHIFT) | session_id
+
+
+def frame_ids(frame) -> Tuple[Optional[int], List[int]]:
+    """frame_id and the msg_ids of a frame, or (None, []) if it is not a drawfs frame."""
+    if len(frame) < FH_SIZE:
+        return None, []
+    magic, _, _, frame_bytes, frame_id = FH_STRUCT.unpack_from(frame, 0)
+    if magic != DRAWFS_MAGIC:
+        return None, []
+    end = min(frame_bytes, len(frame))
+    msg_ids = []
+    pos = FH_SIZE
+    while pos + MH_SIZE <= end:
+        _, _, msg_bytes, msg_id, _ = MH_STRUCT.unpack_from(frame, pos)
+        if msg_bytes < MH_SIZE:
+            break
+        msg_ids.append(msg_id)
+        pos += (msg_bytes + 3) & ~3
+    return frame_id, msg_ids
+
+
+class _IndexBuilder:
+    """The three index tables as flat (key, offset) arrays, 16 bytes per entry."""
+
+    def __init__(self):
+        self.time = array('Q')
+        self.frame = array('Q')
+        self.msg = array('Q')
+        self.records = 0
+        self._last_ts = 0
+        self._time_sorted = True
+
+    def add(self, offset: int, ts_ns: int, session_id: int, frame) -> None:
+        self.records += 1
+        if ts_ns < self._last_ts:
+            self._time_sorted = False
+        self._last_ts = ts_ns
+        self.time.extend((ts_ns, offset))
+        frame_id, msg_ids = frame_ids(frame)
+        if frame_id is not None:
+            self.frame.extend((_id_key(frame_id, session_id), offset))
+            for msg_id in msg_ids:
+                self.msg.extend((_id_key(msg_id, session_id), offset))
+
+    def scan(self, buf, pos: int, end: int) -> int:
+        """Add every complete record in buf[pos:end]. Returns the offset after the last."""
+        view = memoryview(buf)
+        try:
+            while pos + RECORD_SIZE <= end:
+                ts_ns, session_id, n, _, _ = RECORD_STRUCT.unpack_from(buf, pos)
+                start = pos + RECORD_SIZE
+                if start + n > end:
+                    break       # torn final record of an unfinished capture
+                self.add(pos, ts_ns, session_id, view[start:start + n])
+                pos = start + ((n + 3) & ~3)
+        finally:
+            view.release()
+        return pos
+
+    def tables(self) -> List[array]:
+        """time, frame and msg tables, each sorted by key."""
+        out = []
+        for table, presorted in ((self.time, self._time_sorted), (self.frame, False),
+                                 (self.msg, False)):
+            if not presorted:
+                pairs = sorted(zip(table[0::2], table[1::2]))
+                table = array('Q', (v for pair in pairs for v in pair))
+            out.append(table)
+        return out
+
+
+# Queue marker for a run of already-encoded records (CaptureWriter.write_records).
+_RECORDS = -1
+
+
+class CaptureWriter:
+    """
+    Appends records to a .dfcap file.
+
+    With background=True (the default) write() only copies the frame and
+    queues it; a writer thread encodes records into a buffer of
+    buffer_bytes and flushes it with one write.  With background=False
+    write() appends on the calling thread, for callers that already run
+    their own writer thread.
+
+    write_records() appends a run of records that are already encoded
+    (TrafficRecorder's rings hold them that way).  They are not parsed
+    on the way in; close() indexes them with one scan of the file.
+    """
+
+    def __init__(self, path: str, buffer_bytes: int = 1 << 20, background: bool = True):
+        self.path = path
+        self.buffer_bytes = buffer_bytes
+        self.bytes_written = 0
+        self._f = open(path, "wb")
+        self._buf = bytearray()
+        self._offset = 0
+        self._index = _IndexBuilder()
+        self._raw: List[List[int]] = []      # [start, end) of write_records() runs
+        self._closed = False
+        self._emit(HEADER_STRUCT.pack(CAPTURE_MAGIC, CAPTURE_VERSION, HEADER_SIZE,
+                                      time.time_ns(), time.monotonic_ns()))
+
+        self._queue: Deque[Tuple[int, int, bytes, int]] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        if background:
+            self._thread = threading.Thread(target=self._run, name="drawfs-capture", daemon=True)
+            self._thread.start()
+
+    def __enter__(self) -> 'CaptureWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    @property
+    def records(self) -> int:
+        """Records indexed so far; write_records() runs are counted at close()."""
+        return self._index.records
+
+    def _emit(self, data) -> None:
+        self._buf += data
+        self._offset += len(data)
+        if len(self._buf) >= self.buffer_bytes:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buf:
+            self._f.write(self._buf)
+            self.bytes_written += len(self._buf)
+            self._buf = bytearray()
+
+    def append(self, direction: int, session_id: int, frame, ts_ns: int) -> None:
+        """Encode one record on the calling thread (not thread safe)."""
+        offset = self._offset
+        n = len(frame)
+        self._emit(RECORD_STRUCT.pack(ts_ns, session_id, n, direction, 0))
+        self._emit(frame)
+        if n & 3:
+            self._emit(bytes(4 - (n & 3)))
+        self._index.add(offset, ts_ns, session_id, frame)
+
+    def append_records(self, data) -> None:
+        """Append encoded records on the calling thread (not thread safe)."""
+        n = len(data)
+        if not n:
+            return
+        offset = self._offset
+        if n >= self.buffer_bytes:
+            self._flush()
+            self._f.write(data)
+            self.bytes_written += n
+            self._offset += n
+        else:
+            self._emit(data)
+        if self._raw and self._raw[-1][1] == offset:
+            self._raw[-1][1] = self._offset
+        else:
+            self._raw.append([offset, self._offset])
+
+    def _put(self, item: Tuple[int, int, bytes, int]) -> None:
+        with self._cond:
+            self._queue.append(item)
+            self._cond.notify()
+
+    def write(self, direction: int, session_id: int, frame, ts_ns: Optional[int] = None) -> None:
+        """Record a frame (copied before returning). ts_ns defaults to now."""
+        if ts_ns is None:
+            ts_ns = time.monotonic_ns()
+        if self._thread is None:
+            self.append(direction, session_id, frame, ts_ns)
+        else:
+            self._put((direction, session_id, bytes(frame), ts_ns))
+
+    def write_records(self, data) -> None:
+        """Record a run of encoded records (copied before returning)."""
+        if self._thread is None:
+            self.append_records(data)
+        else:
+            self._put((_RECORDS, 0, bytes(data), 0))
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                batch, self._queue = self._queue, deque()
+            for direction, session_id, frame, ts_ns in batch:
+                if direction == _RECORDS:
+                    self.append_records(frame)
+                else:
+                    self.append(direction, session_id, frame, ts_ns)
+
+    def _index_raw(self) -> None:
+        self._flush()
+        self._f.flush()
+        with open(self.path, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for start, end in self._raw:
+                self._index.scan(mm, start, end)
+        self._raw = []
+
+    def _write_index(self) -> None:
+        if self._raw:
+            self._index_raw()
+        index_offset = self._offset
+        tables = self._index.tables()
+        for table in tables:
+            if sys.byteorder != "little":
+                table.byteswap()
+            self._emit(table.tobytes())
+        self._emit(TRAILER_STRUCT.pack(index_offset, *(len(t) // 2 for t in tables),
+                                       self._index.records, TRAILER_MAGIC))
+
+    def close(self) -> None:
+        """Drain the queue, write the index and close the file."""
+        if self._closed:
+            return
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._write_index()
+        self._flush()
+        self._f.close()
+
+
+_PAD = (b"", b"\0\0\0", b"\0\0", b"\0")
+_pack_record = RECORD_STRUCT.pack_into
+_perf_counter_ns = time.perf_counter_ns
+
+
+class _RecordRing:
+    """
+    Single-producer, single-consumer byte ring of encoded capture records.
+
+    put() packs the record header and copies the frame straight into the
+    ring in .dfcap layout, so drain() hands everything queued to the
+    capture as at most two contiguous runs, with no per-record work.
+    head and tail are byte counts that only grow; the producer advances
+    head and the consumer tail, each after its copy is done, so neither
+    side takes a lock (plain attribute stores are atomic under the GIL).
+    A record never wraps: one that does not fit before the end of the
+    buffer starts the next lap and wrap_end marks where this lap stopped.
+    """
+
+    def __init__(self, capacity: int, direction: int, session_id: int):
+        if capacity & (capacity - 1) or capacity < 4096:
+            raise ValueError(f"ring_bytes must be a power of two >= 4096, got {capacity}")
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.direction = direction
+        self.session_id = session_id
+        self.head = 0
+        self.tail = 0
+        self.wrap_end = capacity
+        self.frames = 0
+        self.dropped = 0
+        self.oversize = 0
+        self.high_water = 0
+
+    def put(self, frame) -> None:
+        ts = _perf_counter_ns()
+        n = len(frame)
+        size = RECORD_SIZE + ((n + 3) & ~3)
+        head = self.head
+        pos = head & self.mask
+        if pos + size >= self.capacity or head + size - self.tail > self.capacity:
+            self._put_edge(frame, ts, n, size, head, pos)
+            return
+        _pack_record(self.buf, pos, ts, self.session_id, n, self.direction, 0)
+        start = pos + RECORD_SIZE
+        self.view[start:start + n] = frame
+        if n & 3:
+            self.view[start + n:pos + size] = _PAD[n & 3]
+        self.frames += 1
+        self.head = head + size
+
+    def _put_edge(self, frame, ts: int, n: int, size: int, head: int, pos: int) -> None:
+        """put() for a full ring, an oversize frame or a record at the end of a lap."""
+        self.frames += 1
+        cap = self.capacity
+        if size > cap:
+            self.oversize += 1
+            self.dropped += 1
+            return
+        gap = cap - pos if pos + size > cap else 0
+        used = head + gap + size - self.tail
+        if used > cap:
+            self.high_water = max(self.high_water, head - self.tail)
+            self.dropped += 1
+            return
+        if gap:
+            self.wrap_end = pos
+            pos = 0
+        else:
+            self.wrap_end = cap
+        _pack_record(self.buf, pos, ts, self.session_id, n, self.direction, 0)
+        start = pos + RECORD_SIZE
+        self.view[start:start + n] = frame
+        if n & 3:
+            self.view[start + n:pos + size] = _PAD[n & 3]
+        self.head = head + gap + size
+
+    def drain(self, write) -> int:
+        """Pass everything queued to write() as one or two runs. Returns bytes drained."""
+        head, tail = self.head, self.tail
+        if head == tail:
+            return 0
+        if head - tail > self.high_water:
+            self.high_water = head - tail
+        pos = tail & self.mask
+        lap = tail - pos
+        if head - lap <= self.capacity:
+            write(self.view[pos:head - lap])
+        else:
+            if pos < self.wrap_end:
+                write(self.view[pos:self.wrap_end])
+            write(self.view[:head - lap - self.capacity])
+        self.tail = head
+        return head - tail
+
+
+class TrafficRecorder:
+    """
+    Records every frame a DrawSession writes or reads into a capture.
+
+        rec = TrafficRecorder("run.dfcap", session_id=1)
+        with DrawSession(recorder=rec) as s:
+            ...
+        rec.close()
+        print(rec.report())
+
+    outbound() and inbound() stamp time.perf_counter_ns() (the clock
+    behind time.monotonic_ns() on Linux and FreeBSD), encode the record
+    into a ring of ring_bytes per direction and return; they never block
+    and never allocate.  When a ring is full the frame is dropped and
+    counted.  A writer thread moves both rings into the capture every
+    interval_s, one direction after the other, so the file is in
+    timestamp order per direction and the time index orders the two.
+
+    Each ring has one producer: the thread writing requests and the
+    thread reading replies (the reader thread, if there is one).
+    capture is a path (the recorder owns the CaptureWriter) or a shared
+    CaptureWriter with background=True for several sessions.
+    """
+
+    def __init__(self, capture, session_id: int = 0, ring_bytes: int = 1 << 22,
+                 interval_s: float = 0.002):
+        if isinstance(capture, str):
+            self.writer = CaptureWriter(capture, background=False)
+            self._owns_writer = True
+        else:
+            self.writer = capture
+            self._owns_writer = False
+        self._sink = self.writer.write_records
+        self.session_id = session_id
+        self.interval_s = interval_s
+        self._out = _RecordRing(ring_bytes, TO_KERNEL, session_id)
+        self._in = _RecordRing(ring_bytes, FROM_KERNEL, session_id)
+        self.outbound = self._out.put
+        self.inbound = self._in.put
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = threading.Thread(
+            target=self._run, name="drawfs-recorder", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'TrafficRecorder':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    @property
+    def dropped(self) -> int:
+        return self._out.dropped + self._in.dropped
+
+    @property
+    def written(self) -> int:
+        """Frames recorded (not dropped); all of them are in the capture after close()."""
+        return self._out.frames + self._in.frames - self.dropped
+
+    def _drain(self) -> int:
+        return self._out.drain(self._sink) + self._in.drain(self._sink)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self._drain()
+
+    def close(self) -> None:
+        """Stop the writer thread, write what is left and close an owned capture."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._drain()
+        if self._owns_writer:
+            self.writer.close()
+
+    def report(self) -> Dict[str, int]:
+        out, inb = self._out, self._in
+        return {
+            'outbound': out.frames,
+            'inbound': inb.frames,
+            'written': self.written,
+            'dropped_outbound': out.dropped,
+            'dropped_inbound': inb.dropped,
+            'oversize': out.oversize + inb.oversize,
+            'ring_high_water': max(out.high_water, out.head - out.tail,
+                                   inb.high_water, inb.head - inb.tail),
+        }
+
+
+class CaptureRecord:
+    """One captured frame. frame is a view into the reader's mapping."""
+
+    __slots__ = ("offset", "ts_ns", "session_id", "direction", "flags", "frame")
+
+    def __init__(self, offset: int, ts_ns: int, session_id: int, direction: int, flags: int,
+                 frame: memoryview):
+        self.offset = offset
+        self.ts_ns = ts_ns
+        self.session_id = session_id
+        self.direction = direction
+        self.flags = flags
+        self.frame = frame
+
+    def __repr__(self) -> str:
+        return (f"CaptureRecord(offset={self.offset}, ts_ns={self.ts_ns}, "
+                f"session_id={self.session_id}, "
+                f"direction={DIRECTION_NAMES.get(self.direction, self.direction)}, "
+                f"frame={len(self.frame)} bytes)")
+
+
+class CaptureReader:
+    """mmapped, read-only view of a .dfcap file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER_SIZE:
+                raise ValueError(f"{path}: too short for a capture header")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        # Clocks read when the capture was opened, for wall_ns().
+        magic, version, header_bytes, self.start_wall_ns, self.start_mono_ns = \
+            HEADER_STRUCT.unpack_from(self._mm, 0)
+        if magic != CAPTURE_MAGIC:
+            self.close()
+            raise ValueError(f"{path}: not a drawfs capture (magic {magic!r})")
+        if version != CAPTURE_VERSION:
+            self.close()
+            raise ValueError(f"{path}: unsupported capture version {version}")
+        self.header_bytes = header_bytes
+        self.indexed = self._load_index(size)
+        if not self.indexed:
+            self._rebuild_index(size)
+
+    def __enter__(self) -> 'CaptureReader':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def __len__(self) -> int:
+        return self.records
+
+    def close(self) -> bool:
+        """Unmap. False if record frames handed out are still alive."""
+        if self._mm is None:
+            return True
+        self._view.release()
+        try:
+            self._mm.close()
+        except BufferError:
+            return False
+        self._mm = None
+        return True
+
+    # -------------------------------------------------------------------------
+    # Index
+    # -------------------------------------------------------------------------
+
+    def _load_index(self, size: int) -> bool:
+        if size < self.header_bytes + TRAILER_SIZE:
+            return False
+        index_offset, n_time, n_frame, n_msg, records, magic = \
+            TRAILER_STRUCT.unpack_from(self._mm, size - TRAILER_SIZE)
+        if (magic != TRAILER_MAGIC or
+                index_offset + (n_time + n_frame + n_msg) * INDEX_SIZE + TRAILER_SIZE != size):
+            return False
+        self.records = records
+        self.records_end = index_offset
+        self._tables = {}
+        self._index: Optional[List[array]] = None
+        base = index_offset
+        for name, n in (("time", n_time), ("frame", n_frame), ("msg", n_msg)):
+            self._tables[name] = (base, n)
+            base += n * INDEX_SIZE
+        return True
+
+    def _rebuild_index(self, size: int) -> None:
+        """Scan the records of an unfinished capture and index them in memory."""
+        builder = _IndexBuilder()
+        self.records_end = builder.scan(self._mm, self.header_bytes, size)
+        self.records = builder.records
+        self._index = builder.tables()
+        self._tables = {name: (i, len(t) // 2)
+                        for i, (name, t) in enumerate(zip(("time", "frame", "msg"), self._index))}
+
+    def _entry(self, table: str, i: int) -> Tuple[int, int]:
+        base, _ = self._tables[table]
+        if self._index is not None:
+            t = self._index[base]
+            return t[2 * i], t[2 * i + 1]
+        return INDEX_STRUCT.unpack_from(self._mm, base + i * INDEX_SIZE)
+
+    def index_view(self, table: str = "time") -> memoryview:
+        """
+        An index table as raw (key, offset) pairs of little-endian u64,
+        sorted by key: "time" has one entry per record.  The view pins
+        the mapping until it is released.
+        """
+        base, n = self._tables[table]
+        if self._index is not None:
+            t = self._index[base]
+            if sys.byteorder != "little":
+                t = array('Q', t)
+                t.byteswap()
+            return memoryview(t).cast('B')
+        return self._view[base:base + n * INDEX_SIZE]
+
+    def _lower_bound(self, table: str, key: int) -> int:
+        lo, hi = 0, self._tables[table][1]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(table, mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _range(self, table: str, lo_key: int, hi_key: int) -> Iterator[int]:
+        """Record offsets with lo_key <= key < hi_key, in index order, one at a time."""
+        n = self._tables[table][1]
+        i = self._lower_bound(table, lo_key)
+        while i < n:
+            key, offset = self._entry(table, i)
+            if key >= hi_key:
+                return
+            yield offset
+            i += 1
+
+    # -------------------------------------------------------------------------
+    # Records
+    # -------------------------------------------------------------------------
+
+    def record_at(self, offset: int) -> CaptureRecord:
+        ts_ns, session_id, n, direction, flags = RECORD_STRUCT.unpack_from(self._mm, offset)
+        start = offset + RECORD_SIZE
+        return CaptureRecord(offset, ts_ns, session_id, direction, flags,
+                             self._view[start:start + n])
+
+    def _scan(self, pos: int, end: int) -> Iterator[CaptureRecord]:
+        while pos + RECORD_SIZE <= end:
+            n = RECORD_STRUCT.unpack_from(self._mm, pos)[2]
+            if pos + RECORD_SIZE + n > end:
+                return          # torn final record of an unfinished capture
+            yield self.record_at(pos)
+            pos += RECORD_SIZE + ((n + 3) & ~3)
+
+    def __iter__(self) -> Iterator[CaptureRecord]:
+        return self._scan(self.header_bytes, self.records_end)
+
+    def at_time(self, ts_ns: int) -> Optional[CaptureRecord]:
+        """The first record (by timestamp) at or after ts_ns."""
+        i = self._lower_bound("time", ts_ns)
+        if i >= self._tables["time"][1]:
+            return None
+        return self.record_at(self._entry("time", i)[1])
+
+    def between(self, start_ns: int, end_ns: int) -> Iterator[CaptureRecord]:
+        """Records with start_ns <= ts_ns < end_ns, in timestamp order (read lazily)."""
+        for offset in self._range("time", start_ns, end_ns):
+            yield self.record_at(offset)
+
+    def _by_id(self, table: str, ident: int, session_id: Optional[int]) -> List[CaptureRecord]:
+        if session_id is None:
+            lo, hi = _id_key(ident, 0), _id_key(ident + 1, 0)
+        else:
+            lo = _id_key(ident, session_id)
+            hi = lo + 1
+        offsets = sorted(set(self._range(table, lo, hi)))
+        return [self.record_at(offset) for offset in offsets]
+
+    def by_frame_id(self, frame_id: int, session_id: Optional[int] = None) -> List[CaptureRecord]:
+        """Records of frames with this frame_id, in file order."""
+        return self._by_id("frame", frame_id, session_id)
+
+    def by_msg_id(self, msg_id: int, session_id: Optional[int] = None) -> List[CaptureRecord]:
+        """Records of frames carrying a message with this msg_id (requests and replies)."""
+        return self._by_id("msg", msg_id, session_id)
+
+    def wall_ns(self, ts_ns: int) -> int:
+        """Convert a record timestamp to wall-clock nanoseconds."""
+        return self.start_wall_ns + (ts_ns - self.start_mono_ns)
+
+    @property
+    def start_ns(self) -> int:
+        return self._entry("time", 0)[0] if self.records else 0
+
+    @property
+    def end_ns(self) -> int:
+        return self._entry("time", self.records - 1)[0] if self.records else 0
+
+
+def is_capture(path: str) -> bool:
+    """True if path starts with the .dfcap magic."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(CAPTURE_MAGIC)) == CAPTURE_MAGIC
+    except OSError:
+        return False
+
+
+def record_span(path: str) -> Tuple[int, int]:
+    """
+    (offset of the first record, end of the records) of a capture, read
+    from its header and trailer without loading the index.  For a capture
+    with no trailer the end is the file size.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        magic, version, header_bytes, _, _ = HEADER_STRUCT.unpack(f.read(HEADER_SIZE))
+        if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+            raise ValueError(f"{path}: not a version {CAPTURE_VERSION} drawfs capture")
+        if size < header_bytes + TRAILER_SIZE:
+            return header_bytes, size
+        f.seek(size - TRAILER_SIZE)
+        index_offset, n_time, n_frame, n_msg, _, magic = TRAILER_STRUCT.unpack(f.read(TRAILER_SIZE))
+    if (magic != TRAILER_MAGIC or
+            index_offset + (n_time + n_frame + n_msg) * INDEX_SIZE + TRAILER_SIZE != size):
+        return header_bytes, size
+    return header_bytes, index_offset
+
+
+def main(argv: List[str]) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Describe a .dfcap capture")
+    parser.add_argument("path")
+    parser.add_argument("--frames", action="store_true", help="Decode every frame")
+    args = parser.parse_args(argv)
+
+    if args.frames:
+        from drawfs_dump import dump_capture
+        dump_capture(args.path)
+        return
+
+    with CaptureReader(args.path) as cap:
+        span = (cap.end_ns - cap.start_ns) / 1e9
+        print(f"{args.path}: {len(cap)} records over {span:.3f}s"
+              f"{'' if cap.indexed else ' (no index, rebuilt by scan)'}")
+        counts = {}
+        nbytes = {}
+        for rec in cap:
+            counts[rec.direction] = counts.get(rec.direction, 0) + 1
+            nbytes[rec.direction] = nbytes.get(rec.direction, 0) + len(rec.frame)
+            rec.frame.release()
+        for direction in sorted(counts):
+            print(f"  {DIRECTION_NAMES.get(direction, direction):16s} "
+                  f"{counts[direction]:10d} records {nbytes[direction]:12d} bytes")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -6,7 +6,19 @@ Usage:
     # Dump hex-encoded frame from command line
     ./drawfs_dump.py 44525731000110002c00000001000000...
 
-    # Dump binary frame from stdin
+    # Dump every frame of a binary capture (mmapped, constant memory)
+    ./drawfs_dump.py --file capture.bin
+
+    # Dump a timestamped .dfcap capture (see drawfs_capture.py)
+    ./drawfs_dump.py --file run.dfcap
+
+    # Summarise a capture in one streaming pass (table, or --json)
+    ./drawfs_dump.py --file run.dfcap --summary
+
+    # ... or in 64 MiB sections across 8 processes
+    ./drawfs_dump.py --file run.dfcap --summary --workers 8
+
+    # Dump binary frames from stdin
     cat frame.bin | ./drawfs_dump.py
 
     # Dump hex from stdin
@@ -19,64 +31,61 @@ This tool decodes drawfs protocol frames and displays:
 - Frame header (magic, version, size, frame_id)
 - Each message header (type, flags, size, msg_id)
 - Decoded payload for known message types
+
+Binary and hex input may hold any number of concatenated frames (what
+successive read()s of a session return).  Frames are delimited by their
+frame_bytes; when a frame header is corrupt the dump skips ahead to the
+next 'DRW1' magic and reports how many bytes it dropped.
+
+--summary replaces the dump with one streaming pass of statistics (see
+CaptureSummary): frames and bytes per direction, messages per type,
+request->reply latency percentiles per request type, error codes and the
+SURFACE_PRESENTED coalescing ratio.  Raw captures have no timestamps or
+directions, so they get counts and pairing but no latency.  With
+--workers N a --file capture is split into 64 MiB sections summarised by
+N processes (see summarize_parallel); the report is the same for any N.
 """
 
 import sys
+import errno
+import json
+import mmap
 import struct
 import os
-import select
-from typing import Optional, Tuple, List
+import stat
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple, List
+
+# Add tests directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from drawfs_test import (
+    FrameDecoder, FrameError, read_frame, FH_SIZE, MH_SIZE, FH_STRUCT, MH_STRUCT,
+    CODECS, MSG_NAMES, ERROR_NAMES, FORMAT_NAMES, DRAWFS_MAX_FRAME_BYTES,
+    RPL_ERROR, RPL_SURFACE_PRESENT, EVT_SURFACE_PRESENTED, is_event, reply_status,
+)
+from drawfs_capture import (
+    CaptureReader, DIRECTION_NAMES, RECORD_SIZE, RECORD_STRUCT, TO_KERNEL, FROM_KERNEL,
+    is_capture, record_span,
+)
+from drawfs_latency import LatencyHistogram
 
 # Protocol constants
 DRAWFS_MAGIC = 0x31575244   # 'DRW1' little-endian
 DRAWFS_VERSION = 0x0100     # 1.0
+MAGIC_BYTES = struct.pack("<I", DRAWFS_MAGIC)
+
+# Kinds yielded by FrameScanner.scan()
+FRAME = 0
+SKIPPED = 1
 
-# Message type names
-MSG_TYPES = {
-    0x0001: "REQ_HELLO",
-    0x0010: "REQ_DISPLAY_LIST",
-    0x0011: "REQ_DISPLAY_OPEN",
-    0x0020: "REQ_SURFACE_CREATE",
-    0x0021: "REQ_SURFACE_DESTROY",
-    0x0022: "REQ_SURFACE_PRESENT",
-    0x8000: "RPL_OK",
-    0x8001: "RPL_HELLO",
-    0x8010: "RPL_DISPLAY_LIST",
-    0x8011: "RPL_DISPLAY_OPEN",
-    0x8020: "RPL_SURFACE_CREATE",
-    0x8021: "RPL_SURFACE_DESTROY",
-    0x8022: "RPL_SURFACE_PRESENT",
-    0x8FFF: "RPL_ERROR",
-    0x9002: "EVT_SURFACE_PRESENTED",
-}
-
-# Error codes (from drawfs_proto.h enum drawfs_err_code)
-ERROR_CODES = {
-    0: "OK",
-    1: "INVALID_FRAME",
-    2: "INVALID_MSG",
-    3: "UNSUPPORTED_VERSION",
-    4: "UNSUPPORTED_CAP",
-    5: "PERMISSION",
-    6: "NOT_FOUND",
-    7: "BUSY",
-    8: "NO_MEMORY",
-    9: "INVALID_HANDLE",
-    10: "INVALID_STATE",
-    11: "INVALID_ARG",
-    12: "OVERFLOW",
-    13: "IO",
-    14: "INTERNAL",
-}
-
-# Pixel formats
-PIXEL_FORMATS = {
-    1: "XRGB8888",
-}
-
-# Header sizes
-FH_SIZE = 20  # Frame header
-MH_SIZE = 16  # Message header
+STREAM_CHUNK = 1 << 20
+PARALLEL_CHUNK = 64 << 20       # bytes of capture per --workers task
+
+# Name tables, shared with the client
+MSG_TYPES = MSG_NAMES
+ERROR_CODES = ERROR_NAMES
+PIXEL_FORMATS = FORMAT_NAMES
 
 
 def hex_dump(data: bytes, prefix: str = "    ") -> str:
@@ -94,150 +103,60 @@ def decode_frame_header(data: bytes) -> Tuple[int, int, int, int, int]:
     """Decode frame header: magic, version, header_bytes, frame_bytes, frame_id."""
     if len(data) < FH_SIZE:
         raise ValueError(f"Data too short for frame header: {len(data)} < {FH_SIZE}")
-    return struct.unpack_from("<IHHII", data, 0)
+    return FH_STRUCT.unpack_from(data, 0)
 
 
 def decode_msg_header(data: bytes, offset: int) -> Tuple[int, int, int, int, int]:
     """Decode message header: msg_type, msg_flags, msg_bytes, msg_id, reserved."""
     if len(data) < offset + MH_SIZE:
         raise ValueError(f"Data too short for msg header at offset {offset}")
-    return struct.unpack_from("<HHIII", data, offset)
+    return MH_STRUCT.unpack_from(data, offset)
 
 
 def decode_payload(msg_type: int, payload: bytes) -> List[str]:
     """Decode known payload types and return description lines."""
-    lines = []
-
+    codec = CODECS.get(msg_type)
+    if codec is None:
+        return []
     try:
-        if msg_type == 0x0001:  # REQ_HELLO
-            if len(payload) >= 12:
-                major, minor, flags, max_reply = struct.unpack_from("<HHII", payload, 0)
-                lines.append(f"client_version: {major}.{minor}")
-                lines.append(f"flags: 0x{flags:08x}")
-                lines.append(f"max_reply_bytes: {max_reply}")
-
-        elif msg_type == 0x8001:  # RPL_HELLO
-            if len(payload) >= 16:
-                status, major, minor, flags, max_reply_bytes = struct.unpack_from("<iHHII", payload, 0)
-                lines.append(f"status: {status} ({os.strerror(status) if status else 'OK'})")
-                lines.append(f"server_version: {major}.{minor}")
-                lines.append(f"flags: 0x{flags:08x}")
-                lines.append(f"max_reply_bytes: {max_reply_bytes}")
-
-        elif msg_type == 0x0011:  # REQ_DISPLAY_OPEN
-            if len(payload) >= 4:
-                display_id, = struct.unpack_from("<I", payload, 0)
-                lines.append(f"display_id: {display_id}")
-
-        elif msg_type == 0x8010:  # RPL_DISPLAY_LIST
-            if len(payload) >= 8:
-                status, count = struct.unpack_from("<iI", payload, 0)
-                lines.append(f"status: {status} ({os.strerror(status) if status else 'OK'})")
-                lines.append(f"display_count: {count}")
-                off = 8
-                for i in range(count):
-                    if off + 20 <= len(payload):
-                        did, w, h, refresh, flags = struct.unpack_from("<IIIII", payload, off)
-                        lines.append(f"  display[{i}]: id={did} {w}x{h} @ {refresh/1000:.1f}Hz flags=0x{flags:x}")
-                        off += 20
-
-        elif msg_type == 0x8011:  # RPL_DISPLAY_OPEN
-            if len(payload) >= 12:
-                status, handle, active_id = struct.unpack_from("<iII", payload, 0)
-                lines.append(f"status: {status} ({os.strerror(status) if status else 'OK'})")
-                lines.append(f"display_handle: {handle}")
-                lines.append(f"active_display_id: {active_id}")
-
-        elif msg_type == 0x0020:  # REQ_SURFACE_CREATE
-            if len(payload) >= 16:
-                w, h, fmt, flags = struct.unpack_from("<IIII", payload, 0)
-                fmt_name = PIXEL_FORMATS.get(fmt, f"unknown({fmt})")
-                lines.append(f"size: {w}x{h}")
-                lines.append(f"format: {fmt_name}")
-                lines.append(f"flags: 0x{flags:08x}")
-
-        elif msg_type == 0x8020:  # RPL_SURFACE_CREATE
-            if len(payload) >= 16:
-                status, sid, stride, total = struct.unpack_from("<iIII", payload, 0)
-                lines.append(f"status: {status} ({os.strerror(status) if status else 'OK'})")
-                lines.append(f"surface_id: {sid}")
-                lines.append(f"stride_bytes: {stride}")
-                lines.append(f"bytes_total: {total}")
-
-        elif msg_type == 0x0021:  # REQ_SURFACE_DESTROY
-            if len(payload) >= 4:
-                sid, = struct.unpack_from("<I", payload, 0)
-                lines.append(f"surface_id: {sid}")
-
-        elif msg_type == 0x8021:  # RPL_SURFACE_DESTROY
-            if len(payload) >= 8:
-                status, sid = struct.unpack_from("<iI", payload, 0)
-                lines.append(f"status: {status} ({os.strerror(status) if status else 'OK'})")
-                lines.append(f"surface_id: {sid}")
-
-        elif msg_type == 0x0022:  # REQ_SURFACE_PRESENT
-            if len(payload) >= 16:
-                sid, reserved, cookie = struct.unpack_from("<IIQ", payload, 0)
-                lines.append(f"surface_id: {sid}")
-                lines.append(f"cookie: 0x{cookie:016x}")
-
-        elif msg_type == 0x8022:  # RPL_SURFACE_PRESENT
-            if len(payload) >= 16:
-                status, sid, cookie = struct.unpack_from("<iIQ", payload, 0)
-                lines.append(f"status: {status} ({os.strerror(status) if status else 'OK'})")
-                lines.append(f"surface_id: {sid}")
-                lines.append(f"cookie: 0x{cookie:016x}")
-
-        elif msg_type == 0x9002:  # EVT_SURFACE_PRESENTED
-            if len(payload) >= 16:
-                sid, reserved, cookie = struct.unpack_from("<IIQ", payload, 0)
-                lines.append(f"surface_id: {sid}")
-                lines.append(f"cookie: 0x{cookie:016x}")
-
-        elif msg_type == 0x8FFF:  # RPL_ERROR
-            if len(payload) >= 12:
-                err_code, err_detail, err_offset = struct.unpack_from("<III", payload, 0)
-                err_name = ERROR_CODES.get(err_code, f"unknown({err_code})")
-                lines.append(f"err_code: {err_code} ({err_name})")
-                lines.append(f"err_detail: {err_detail}")
-                lines.append(f"err_offset: {err_offset}")
-
+        return codec.format(payload)
     except struct.error as e:
-        lines.append(f"(decode error: {e})")
-
-    return lines
+        return [f"(decode error: {e})"]
 
 
-def dump_frame(data: bytes, frame_num: int = 1) -> None:
-    """Dump a single frame with all messages."""
-    print(f"=== Frame {frame_num} ({len(data)} bytes) ===")
-    print()
+def format_frame(data, frame_num: int = 1, offset: Optional[int] = None) -> List[str]:
+    """Describe a single frame with all messages, one list entry per output line."""
+    out = []
+    add = out.append
+    at = "" if offset is None else f" at offset {offset}"
+    add(f"=== Frame {frame_num} ({len(data)} bytes){at} ===")
+    add("")
 
     if len(data) < FH_SIZE:
-        print(f"ERROR: Data too short for frame header ({len(data)} < {FH_SIZE})")
-        print(hex_dump(data))
-        return
+        add(f"ERROR: Data too short for frame header ({len(data)} < {FH_SIZE})")
+        add(hex_dump(data))
+        return out
 
     magic, version, hdr_bytes, frame_bytes, frame_id = decode_frame_header(data)
 
     magic_ok = "OK" if magic == DRAWFS_MAGIC else "INVALID"
     magic_str = struct.pack("<I", magic).decode('ascii', errors='replace')
 
-    print(f"Frame Header:")
-    print(f"  magic:        0x{magic:08x} ('{magic_str}') [{magic_ok}]")
-    print(f"  version:      0x{version:04x} ({version >> 8}.{version & 0xff})")
-    print(f"  header_bytes: {hdr_bytes}")
-    print(f"  frame_bytes:  {frame_bytes}")
-    print(f"  frame_id:     {frame_id}")
-    print()
+    add(f"Frame Header:")
+    add(f"  magic:        0x{magic:08x} ('{magic_str}') [{magic_ok}]")
+    add(f"  version:      0x{version:04x} ({version >> 8}.{version & 0xff})")
+    add(f"  header_bytes: {hdr_bytes}")
+    add(f"  frame_bytes:  {frame_bytes}")
+    add(f"  frame_id:     {frame_id}")
+    add("")
 
     if magic != DRAWFS_MAGIC:
-        print("ERROR: Invalid magic - cannot parse messages")
-        print(hex_dump(data))
-        return
+        add("ERROR: Invalid magic - cannot parse messages")
+        add(hex_dump(data))
+        return out
 
     if frame_bytes > len(data):
-        print(f"WARNING: frame_bytes ({frame_bytes}) > data length ({len(data)})")
+        add(f"WARNING: frame_bytes ({frame_bytes}) > data length ({len(data)})")
         frame_bytes = len(data)
 
     # Parse messages
@@ -249,15 +168,15 @@ def dump_frame(data: bytes, frame_num: int = 1) -> None:
 
         type_name = MSG_TYPES.get(msg_type, "UNKNOWN")
 
-        print(f"Message {msg_num}:")
-        print(f"  offset:     {pos}")
-        print(f"  msg_type:   0x{msg_type:04x} ({type_name})")
-        print(f"  msg_flags:  0x{msg_flags:04x}")
-        print(f"  msg_bytes:  {msg_bytes}")
-        print(f"  msg_id:     {msg_id}")
+        add(f"Message {msg_num}:")
+        add(f"  offset:     {pos}")
+        add(f"  msg_type:   0x{msg_type:04x} ({type_name})")
+        add(f"  msg_flags:  0x{msg_flags:04x}")
+        add(f"  msg_bytes:  {msg_bytes}")
+        add(f"  msg_id:     {msg_id}")
 
         if msg_bytes < MH_SIZE:
-            print(f"  ERROR: msg_bytes < header size")
+            add(f"  ERROR: msg_bytes < header size")
             break
 
         payload_start = pos + MH_SIZE
@@ -266,14 +185,13 @@ def dump_frame(data: bytes, frame_num: int = 1) -> None:
         payload = data[payload_start:payload_end]
 
         if payload_len > 0:
-            print(f"  payload ({len(payload)} bytes):")
+            add(f"  payload ({len(payload)} bytes):")
             decoded = decode_payload(msg_type, payload)
             if decoded:
-                for line in decoded:
-                    print(f"    {line}")
+                out.extend(f"    {line}" for line in decoded)
             else:
-                print(hex_dump(payload, "    "))
-        print()
+                add(hex_dump(payload, "    "))
+        add("")
 
         # Advance to next message (4-byte aligned)
         pos = ((pos + msg_bytes) + 3) & ~3
@@ -281,7 +199,595 @@ def dump_frame(data: bytes, frame_num: int = 1) -> None:
             break
 
     if msg_num == 0:
-        print("No messages found in frame")
+        add("No messages found in frame")
+    return out
+
+
+def dump_frame(data, frame_num: int = 1, offset: Optional[int] = None) -> None:
+    """Dump a single frame with all messages."""
+    sys.stdout.write("\n".join(format_frame(data, frame_num, offset)) + "\n")
+
+
+# =============================================================================
+# Multi-frame input
+# =============================================================================
+
+class FrameScanner:
+    """
+    Splits a buffer of concatenated frames at each header's frame_bytes.
+
+    A header with the wrong magic, header_bytes or an impossible
+    frame_bytes is treated as corruption: the scanner skips to the next
+    'DRW1' and reports the dropped bytes as a SKIPPED run.  pos is the
+    offset of the first byte not yet reported; scan() can be called again
+    after more bytes arrive.
+    """
+
+    def __init__(self):
+        self.pos = 0
+        self.frames = 0
+        self.resyncs = 0
+        self.skipped_bytes = 0
+
+    def _skip(self, start: int, end: int) -> Tuple[int, int, int]:
+        self.resyncs += 1
+        self.skipped_bytes += end - start
+        return (start, end - start, SKIPPED)
+
+    def scan(self, buf, end: int, eof: bool = True) -> Iterator[Tuple[int, int, int]]:
+        """
+        Yield (offset, length, kind) for buf[pos:end].  Without eof, stops
+        at the first frame that is not complete yet.  At eof a truncated
+        frame or a tail shorter than a header is yielded as a FRAME so it
+        gets dumped with its warning.
+        """
+        pos = self.pos
+        unpack_from = FH_STRUCT.unpack_from
+        while pos < end:
+            avail = end - pos
+            if avail < FH_SIZE:
+                if not eof:
+                    break
+                self.frames += 1
+                yield (pos, avail, FRAME)
+                pos = end
+                break
+            magic, _, hdr_bytes, frame_bytes, _ = unpack_from(buf, pos)
+            if (magic != DRAWFS_MAGIC or hdr_bytes != FH_SIZE or frame_bytes < FH_SIZE
+                    or frame_bytes > DRAWFS_MAX_FRAME_BYTES or frame_bytes & 3):
+                nxt = buf.find(MAGIC_BYTES, pos + 1, end)
+                if nxt < 0:
+                    # Keep a possible partial magic at the end for the next call.
+                    nxt = end if eof else max(pos + 1, end - len(MAGIC_BYTES) + 1)
+                yield self._skip(pos, nxt)
+                pos = nxt
+                continue
+            if frame_bytes > avail:
+                if not eof:
+                    break
+                frame_bytes = avail
+            self.frames += 1
+            yield (pos, frame_bytes, FRAME)
+            pos += frame_bytes
+        self.pos = pos
+
+
+def iter_buffer_frames(data, scanner: Optional[FrameScanner] = None
+                       ) -> Iterator[Tuple[int, memoryview, int]]:
+    """Yield (offset, view, kind) for every frame or skipped run in data."""
+    if scanner is None:
+        scanner = FrameScanner()
+    with memoryview(data) as view:
+        for off, n, kind in scanner.scan(data, len(data)):
+            frame = view[off:off + n]
+            try:
+                yield off, frame, kind
+            finally:
+                # Lets an mmap be closed even if the consumer stops early.
+                frame.release()
+
+
+def iter_file_frames(f, scanner: Optional[FrameScanner] = None
+                     ) -> Iterator[Tuple[int, memoryview, int]]:
+    """
+    Yield (offset, view, kind) for a capture file, given as a path or an
+    open regular file.  The file is mmapped and frames are views into the
+    mapping, so nothing is copied and memory use does not grow with the
+    file; a view is only valid until the next one is yielded.
+    """
+    if isinstance(f, str):
+        with open(f, "rb") as fobj:
+            yield from iter_file_frames(fobj, scanner)
+        return
+    if os.fstat(f.fileno()).st_size == 0:
+        return
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if hasattr(mm, "madvise"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        yield from iter_buffer_frames(mm, scanner)
+    finally:
+        mm.close()
+
+
+def iter_stream_frames(f, scanner: Optional[FrameScanner] = None,
+                       chunk_size: int = STREAM_CHUNK) -> Iterator[Tuple[int, memoryview, int]]:
+    """
+    Yield (offset, view, kind) from a binary file object or pipe.  Reads
+    go into one fixed buffer of DRAWFS_MAX_FRAME_BYTES + chunk_size, which
+    always holds a whole valid frame; views are only valid until the next
+    one is yielded.
+    """
+    if scanner is None:
+        scanner = FrameScanner()
+    buf = bytearray(DRAWFS_MAX_FRAME_BYTES + chunk_size)
+    view = memoryview(buf)
+    base = 0                    # stream offset of buf[0]
+    end = 0
+    eof = False
+    while not eof:
+        if end + chunk_size > len(buf):
+            keep = scanner.pos
+            view[:end - keep] = view[keep:end]
+            end -= keep
+            base += keep
+            scanner.pos = 0
+        n = f.readinto(view[end:end + chunk_size])
+        if not n:
+            eof = True
+        else:
+            end += n
+        for off, length, kind in scanner.scan(buf, end, eof):
+            yield base + off, view[off:off + length], kind
+
+
+def dump_frames(frames: Iterator[Tuple[int, memoryview, int]],
+                scanner: FrameScanner, count: Optional[int] = None) -> int:
+    """Dump every frame from one of the iter_*_frames generators. Returns frames dumped."""
+    write = sys.stdout.write
+    dumped = 0
+    for offset, data, kind in frames:
+        if kind == SKIPPED:
+            write(f"--- resync: skipped {len(data)} bytes at offset {offset} ---\n\n")
+            continue
+        dumped += 1
+        write("\n".join(format_frame(data, dumped, offset)) + "\n")
+        if count is not None and dumped >= count:
+            break
+    write(f"=== {dumped} frame(s), {scanner.resyncs} resync(s), "
+          f"{scanner.skipped_bytes} byte(s) skipped ===\n")
+    return dumped
+
+
+def dump_capture(path: str, count: Optional[int] = None) -> int:
+    """Dump the frames of a .dfcap capture with their time, direction and session."""
+    write = sys.stdout.write
+    dumped = 0
+    with CaptureReader(path) as cap:
+        start = cap.start_ns
+        for rec in cap:
+            dumped += 1
+            direction = DIRECTION_NAMES.get(rec.direction, str(rec.direction))
+            write(f"--- +{(rec.ts_ns - start) / 1e9:.6f}s {direction} "
+                  f"session {rec.session_id} ---\n")
+            write("\n".join(format_frame(rec.frame, dumped, rec.offset + RECORD_SIZE)) + "\n")
+            rec.frame.release()
+            if count is not None and dumped >= count:
+                break
+        write(f"=== {dumped} of {len(cap)} record(s) ===\n")
+    return dumped
+
+
+# =============================================================================
+# Summary
+# =============================================================================
+
+# Stands in for "no reply seen yet" (a reply may carry ts None).
+_MISSING = object()
+
+
+class CaptureSummary:
+    """
+    One-pass statistics over a capture: frames and bytes per direction,
+    messages per type, request->reply latency per request type, reply
+    error codes and the SURFACE_PRESENTED coalescing ratio.
+
+    Memory does not grow with the capture: latencies go into fixed-size
+    LatencyHistograms and only requests still waiting for their reply
+    (or replies recorded ahead of their request) are held, at most
+    max_pending of each; the oldest are evicted and counted as
+    unanswered or orphaned.  Replies are paired with requests by
+    (session_id, msg_id).
+    """
+
+    def __init__(self, max_pending: int = 65536):
+        self.max_pending = max_pending
+        self.frames = [0, 0]
+        self.bytes = [0, 0]
+        self.messages: Dict[int, int] = {}
+        self.latency: Dict[int, LatencyHistogram] = {}
+        self.statuses: Dict[Tuple[int, int], int] = {}     # (reply type, status) -> count
+        self.errors: Dict[int, int] = {}                   # RPL_ERROR err_code -> count
+        self.paired = 0
+        self.unanswered = 0
+        self.orphaned = 0
+        self.presents_ok = 0
+        self.presented_events = 0
+        self.malformed = 0
+        self.pending_high_water = 0
+        self.first_ns: Optional[int] = None
+        self.last_ns: Optional[int] = None
+        self._pending: Dict[int, Tuple[int, Optional[int]]] = {}   # key -> (request type, ts)
+        self._early: Dict[int, Optional[int]] = {}                 # key -> reply ts
+
+    def _hold(self, table: dict, key: int, value) -> bool:
+        """Add to a bounded table. True if the oldest entry was evicted to make room."""
+        evicted = len(table) >= self.max_pending and key not in table
+        if evicted:
+            del table[next(iter(table))]
+        table[key] = value
+        if len(table) > self.pending_high_water:
+            self.pending_high_water = len(table)
+        return evicted
+
+    def _record_latency(self, msg_type: int, sent_ns: Optional[int],
+                        reply_ns: Optional[int]) -> None:
+        self.paired += 1
+        if sent_ns is None or reply_ns is None:
+            return
+        h = self.latency.get(msg_type)
+        if h is None:
+            h = self.latency[msg_type] = LatencyHistogram()
+        h.record(reply_ns - sent_ns)
+
+    def add(self, frame, direction: Optional[int] = None, ts_ns: Optional[int] = None,
+            session_id: int = 0) -> None:
+        """
+        Count one frame.  direction is TO_KERNEL or FROM_KERNEL, or None to
+        infer it from the message types; without ts_ns requests and
+        replies are still paired but no latency is recorded.
+        """
+        if ts_ns is not None:
+            if self.first_ns is None or ts_ns < self.first_ns:
+                self.first_ns = ts_ns
+            if self.last_ns is None or ts_ns > self.last_ns:
+                self.last_ns = ts_ns
+        n = len(frame)
+        if n < FH_SIZE:
+            self.malformed += 1
+            return
+        frame_bytes = FH_STRUCT.unpack_from(frame, 0)[3]
+        end = min(frame_bytes, n)
+        pos = FH_SIZE
+        base = session_id << 32
+        messages = self.messages
+        unpack_from = MH_STRUCT.unpack_from
+        first_type = None
+        while pos + MH_SIZE <= end:
+            msg_type, _, msg_bytes, msg_id, _ = unpack_from(frame, pos)
+            if msg_bytes < MH_SIZE or pos + msg_bytes > end:
+                self.malformed += 1
+                break
+            if first_type is None:
+                first_type = msg_type
+            messages[msg_type] = messages.get(msg_type, 0) + 1
+            key = base | msg_id
+            if msg_type < 0x8000:
+                early = self._early.pop(key, _MISSING)
+                if early is not _MISSING:
+                    self._record_latency(msg_type, ts_ns, early)
+                elif self._hold(self._pending, key, (msg_type, ts_ns)):
+                    self.unanswered += 1
+            elif is_event(msg_type):
+                if msg_type == EVT_SURFACE_PRESENTED:
+                    self.presented_events += 1
+            else:
+                payload = frame[pos + MH_SIZE:pos + msg_bytes]
+                status = reply_status(msg_type, payload)
+                if msg_type == RPL_ERROR:
+                    self.errors[status] = self.errors.get(status, 0) + 1
+                elif status:
+                    k = (msg_type, status)
+                    self.statuses[k] = self.statuses.get(k, 0) + 1
+                elif msg_type == RPL_SURFACE_PRESENT:
+                    self.presents_ok += 1
+                req = self._pending.pop(key, None)
+                if req is not None:
+                    self._record_latency(req[0], req[1], ts_ns)
+                elif self._hold(self._early, key, ts_ns):
+                    self.orphaned += 1
+            pos += (msg_bytes + 3) & ~3
+
+        if direction is None:
+            direction = TO_KERNEL if first_type is not None and first_type < 0x8000 else FROM_KERNEL
+        self.frames[direction] += 1
+        self.bytes[direction] += n
+
+    def merge(self, later: 'CaptureSummary') -> 'CaptureSummary':
+        """
+        Fold in the summary of the part of the capture that follows this
+        one.  Requests still pending here are paired with the replies
+        `later` saw without their request, and replies held here with
+        the requests `later` left unanswered.  Returns self.
+        """
+        for d in (TO_KERNEL, FROM_KERNEL):
+            self.frames[d] += later.frames[d]
+            self.bytes[d] += later.bytes[d]
+        for table, other in ((self.messages, later.messages), (self.statuses, later.statuses),
+                             (self.errors, later.errors)):
+            for k, n in other.items():
+                table[k] = table.get(k, 0) + n
+        for msg_type, h in later.latency.items():
+            mine = self.latency.get(msg_type)
+            if mine is None:
+                mine = self.latency[msg_type] = LatencyHistogram(h.precision_bits, h.max_value)
+            mine.merge(h)
+        self.paired += later.paired
+        self.unanswered += later.unanswered
+        self.orphaned += later.orphaned
+        self.presents_ok += later.presents_ok
+        self.presented_events += later.presented_events
+        self.malformed += later.malformed
+        self.pending_high_water = max(self.pending_high_water, later.pending_high_water)
+        if later.first_ns is not None:
+            if self.first_ns is None or later.first_ns < self.first_ns:
+                self.first_ns = later.first_ns
+            if self.last_ns is None or later.last_ns > self.last_ns:
+                self.last_ns = later.last_ns
+
+        early = {}
+        for key, reply_ns in later._early.items():
+            req = self._pending.pop(key, None)
+            if req is not None:
+                self._record_latency(req[0], req[1], reply_ns)
+            else:
+                early[key] = reply_ns
+        for key, req in later._pending.items():
+            reply_ns = self._early.pop(key, _MISSING)
+            if reply_ns is not _MISSING:
+                self._record_latency(req[0], req[1], reply_ns)
+            elif self._hold(self._pending, key, req):
+                self.unanswered += 1
+        for key, reply_ns in early.items():
+            if self._hold(self._early, key, reply_ns):
+                self.orphaned += 1
+        return self
+
+    def finish(self) -> None:
+        """Count requests still unanswered and replies never paired at the end of the capture."""
+        self.unanswered += len(self._pending)
+        self.orphaned += len(self._early)
+        self._pending.clear()
+        self._early.clear()
+
+    @property
+    def coalescing_ratio(self) -> float:
+        """Share of successful presents whose SURFACE_PRESENTED event was coalesced away."""
+        if not self.presents_ok:
+            return 0.0
+        return max(self.presents_ok - self.presented_events, 0) / self.presents_ok
+
+    def report(self) -> Dict[str, object]:
+        span = (self.last_ns - self.first_ns) / 1e9 if self.first_ns is not None else 0.0
+        return {
+            'elapsed_s': span,
+            'frames': {'client_to_kernel': self.frames[TO_KERNEL],
+                       'kernel_to_client': self.frames[FROM_KERNEL]},
+            'bytes': {'client_to_kernel': self.bytes[TO_KERNEL],
+                      'kernel_to_client': self.bytes[FROM_KERNEL]},
+            'messages': {MSG_NAMES.get(t, f"0x{t:04x}"): n for t, n in sorted(self.messages.items())},
+            'paired': self.paired,
+            'unanswered': self.unanswered,
+            'orphaned_replies': self.orphaned,
+            'pending_high_water': self.pending_high_water,
+            'latency_ns': {MSG_NAMES.get(t, f"0x{t:04x}"): h.summary()
+                           for t, h in sorted(self.latency.items())},
+            'errors': {ERROR_NAMES.get(c, str(c)): n for c, n in sorted(self.errors.items())},
+            'reply_statuses': {f"{MSG_NAMES.get(t, f'0x{t:04x}')} "
+                               f"{errno.errorcode.get(s, s)}": n
+                               for (t, s), n in sorted(self.statuses.items())},
+            'presents_ok': self.presents_ok,
+            'presented_events': self.presented_events,
+            'coalescing_ratio': self.coalescing_ratio,
+            'malformed': self.malformed,
+        }
+
+    def format_report(self) -> str:
+        r = self.report()
+        lines = [f"  {'':28s} {'frames':>10s} {'bytes':>12s}"]
+        for name, key in (("client->kernel", 'client_to_kernel'),
+                          ("kernel->client", 'kernel_to_client')):
+            lines.append(f"  {name:28s} {r['frames'][key]:10d} {r['bytes'][key]:12d}")
+        lines.append("")
+        lines.append(f"  {'message':28s} {'count':>10s}")
+        for name, n in r['messages'].items():
+            lines.append(f"  {name:28s} {n:10d}")
+        lines.append("")
+        lines.append(f"  {'latency (us)':28s} {'count':>10s} {'p50':>9s} {'p99':>9s} "
+                     f"{'p99.9':>9s} {'max':>9s}")
+        for name, h in r['latency_ns'].items():
+            lines.append(f"  {name:28s} {h['count']:10d} {h['p50'] / 1000:9.1f} "
+                         f"{h['p99'] / 1000:9.1f} {h['p99.9'] / 1000:9.1f} {h['max'] / 1000:9.1f}")
+        lines.append(f"  {r['paired']} paired, {r['unanswered']} unanswered, "
+                     f"{r['orphaned_replies']} orphaned replies")
+        if r['errors'] or r['reply_statuses']:
+            lines.append("")
+            lines.append(f"  {'error':28s} {'count':>10s}")
+            for name, n in r['errors'].items():
+                lines.append(f"  {'RPL_ERROR ' + name:28s} {n:10d}")
+            for name, n in r['reply_statuses'].items():
+                lines.append(f"  {name:28s} {n:10d}")
+        lines.append("")
+        lines.append(f"  presents ok {r['presents_ok']}, SURFACE_PRESENTED {r['presented_events']}, "
+                     f"coalesced {r['coalescing_ratio'] * 100:.1f}%")
+        if r['malformed']:
+            lines.append(f"  {r['malformed']} malformed frame(s) or message(s)")
+        return "\n".join(lines)
+
+
+def summarize_capture(path: str, max_pending: int = 65536) -> CaptureSummary:
+    """Summarise a .dfcap capture, streaming its records in file order."""
+    summary = CaptureSummary(max_pending)
+    with CaptureReader(path) as cap:
+        for rec in cap:
+            summary.add(rec.frame, rec.direction, rec.ts_ns, rec.session_id)
+            rec.frame.release()
+    summary.finish()
+    return summary
+
+
+def summarize_frames(frames: Iterator[Tuple[int, memoryview, int]],
+                     max_pending: int = 65536) -> CaptureSummary:
+    """Summarise frames from one of the iter_*_frames generators (no timestamps)."""
+    summary = CaptureSummary(max_pending)
+    for _, data, kind in frames:
+        if kind == FRAME:
+            summary.add(data)
+        else:
+            summary.malformed += 1
+    summary.finish()
+    return summary
+
+
+# =============================================================================
+# Parallel summary
+# =============================================================================
+
+def _plausible(buf, pos: int, limit: int, capture: bool) -> bool:
+    """True if a frame header (or a .dfcap record header and its frame) could start at pos."""
+    at = pos + RECORD_SIZE if capture else pos
+    if at + FH_SIZE > limit:
+        return False
+    magic, _, hdr_bytes, frame_bytes, _ = FH_STRUCT.unpack_from(buf, at)
+    if (magic != DRAWFS_MAGIC or hdr_bytes != FH_SIZE or frame_bytes < FH_SIZE
+            or frame_bytes > DRAWFS_MAX_FRAME_BYTES or frame_bytes & 3):
+        return False
+    if not capture:
+        return True
+    _, _, n, direction, _ = RECORD_STRUCT.unpack_from(buf, pos)
+    return direction in DIRECTION_NAMES and frame_bytes <= n and at + n <= limit
+
+
+def _resync(buf, pos: int, limit: int, capture: bool, first: int) -> int:
+    """
+    First offset at or after pos where a frame, or a record for a
+    .dfcap capture, plausibly starts: a 'DRW1' magic with a sane header.
+    Records are 4-byte aligned from first.  limit if there is none.
+    """
+    skip = RECORD_SIZE if capture else 0
+    at = buf.find(MAGIC_BYTES, pos + skip, limit)
+    while at >= 0:
+        start = at - skip
+        if (not capture or not (start - first) & 3) and _plausible(buf, start, limit, capture):
+            return start
+        at = buf.find(MAGIC_BYTES, at + 1, limit)
+    return limit
+
+
+def _summarize_records(summary: 'CaptureSummary', buf, pos: int, end: int, limit: int) -> int:
+    unpack_from = RECORD_STRUCT.unpack_from
+    with memoryview(buf) as view:
+        while pos < end:
+            if pos + RECORD_SIZE > limit:
+                return limit
+            ts_ns, session_id, n, direction, _ = unpack_from(buf, pos)
+            start = pos + RECORD_SIZE
+            if start + n > limit or direction not in DIRECTION_NAMES:
+                # Torn final record of an unfinished capture, or a section
+                # that resynced on a false start and will be decoded again.
+                return limit
+            with view[start:start + n] as frame:
+                summary.add(frame, direction, ts_ns, session_id)
+            pos = start + ((n + 3) & ~3)
+    return pos
+
+
+def _summarize_raw(summary: 'CaptureSummary', buf, pos: int, end: int, limit: int) -> int:
+    scanner = FrameScanner()
+    scanner.pos = pos
+    with memoryview(buf) as view:
+        for off, n, kind in scanner.scan(buf, limit):
+            if off >= end:
+                return off
+            if kind == FRAME:
+                with view[off:off + n] as frame:
+                    summary.add(frame)
+            else:
+                summary.malformed += 1
+    return limit
+
+
+def _summarize_section(path: str, capture: bool, start: int, end: int, limit: int,
+                      resync: bool = True, first: int = 0,
+                      max_pending: int = 65536) -> Tuple[int, int, 'CaptureSummary']:
+    """
+    Summarise the frames (or .dfcap records) of path that start in
+    [start, end), reading up to limit for the last one.  With resync the
+    section begins at the first plausible frame at or after start instead
+    of at start itself.  Returns (where it began, where the next frame
+    after it starts, summary), the summary not yet finish()ed.
+    """
+    summary = CaptureSummary(max_pending)
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if hasattr(mm, "madvise"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        if resync:
+            start = _resync(mm, start, limit, capture, first)
+        walk = _summarize_records if capture else _summarize_raw
+        stop = walk(summary, mm, start, end, limit)
+    finally:
+        mm.close()
+    return start, stop, summary
+
+
+def summarize_parallel(path: str, workers: Optional[int] = None,
+                       chunk_bytes: int = PARALLEL_CHUNK,
+                       max_pending: int = 65536) -> CaptureSummary:
+    """
+    summarize_capture() or summarize_frames() for a capture file, split
+    into chunk_bytes sections decoded by a pool of worker processes.
+
+    Each section after the first resynchronises on the next 'DRW1' frame
+    (or record) header.  Sections are merged in file order, and a section
+    that did not begin where the one before it ended (a 'DRW1' inside a
+    payload) is decoded again from that point, so the result does not
+    depend on the number of workers.
+    """
+    capture = is_capture(path)
+    if capture:
+        first, limit = record_span(path)
+    else:
+        first, limit = 0, os.path.getsize(path)
+    sections = [(path, capture, s, min(s + chunk_bytes, limit), limit, s != first, first,
+                 max_pending) for s in range(first, limit, chunk_bytes)]
+    summary = CaptureSummary(max_pending)
+
+    def merge(results) -> None:
+        expected = first
+        for section, (start, stop, part) in zip(sections, results):
+            if start != expected:
+                start, stop, part = _summarize_section(path, capture, expected, section[3],
+                                                      limit, False, first, max_pending)
+            summary.merge(part)
+            expected = stop
+
+    if workers == 1 or len(sections) < 2:
+        merge(_summarize_section(*section) for section in sections)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            merge(pool.map(_summarize_section, *zip(*sections)))
+    summary.finish()
+    return summary
+
+
+def print_summary(summary: CaptureSummary, source: str, as_json: bool = False) -> None:
+    if as_json:
+        print(json.dumps(summary.report(), indent=2))
+    else:
+        print(f"Summary of {source}")
+        print(summary.format_report())
 
 
 def parse_hex(hex_str: str) -> bytes:
@@ -293,12 +799,15 @@ def parse_hex(hex_str: str) -> bytes:
     return bytes.fromhex(hex_str)
 
 
-def read_live_frame(fd: int, timeout_s: float = 5.0) -> Optional[bytes]:
+def read_live_frame(fd: int, timeout_s: float = 5.0,
+                    decoder: Optional[FrameDecoder] = None) -> Optional[bytes]:
     """Read a frame from the device with timeout."""
-    readable, _, _ = select.select([fd], [], [], timeout_s)
-    if fd not in readable:
+    if decoder is None:
+        decoder = FrameDecoder()
+    try:
+        return read_frame(fd, int(timeout_s * 1000), decoder)
+    except TimeoutError:
         return None
-    return os.read(fd, 4096)
 
 
 def main():
@@ -312,27 +821,47 @@ Examples:
   # Dump hex from command line
   %(prog)s 44525731000110002c00000001000000018000001c00000065...
 
+  # Dump every frame of a binary capture, or of a .dfcap capture
+  %(prog)s --file capture.bin
+  %(prog)s --file run.dfcap
+
   # Dump binary from stdin
   cat frame.bin | %(prog)s
 
   # Dump hex from stdin
   echo "44525731..." | %(prog)s --hex
 
+  # Counts, request latency and errors of a whole capture, as a table or JSON
+  %(prog)s --file run.dfcap --summary
+  %(prog)s --file run.dfcap --summary --json
+
+  # The same, decoded in parallel by 8 worker processes
+  %(prog)s --file run.dfcap --summary --workers 8
+
   # Live capture from device
   sudo %(prog)s --live --count 5
 """
     )
     parser.add_argument("hexdata", nargs="?", help="Hex-encoded frame data")
+    parser.add_argument("--file", "-f",
+                        help="Binary or .dfcap capture file to dump (mmapped)")
     parser.add_argument("--hex", action="store_true",
                         help="Treat stdin as hex (not binary)")
     parser.add_argument("--live", action="store_true",
                         help="Read live frames from /dev/draw")
     parser.add_argument("--device", default="/dev/draw",
                         help="Device path for --live mode")
-    parser.add_argument("--count", type=int, default=1,
-                        help="Number of frames to read in --live mode")
+    parser.add_argument("--count", type=int, default=None,
+                        help="Number of frames to dump (default: 1 in --live mode, all otherwise)")
     parser.add_argument("--timeout", type=float, default=5.0,
                         help="Timeout in seconds for --live mode")
+    parser.add_argument("--summary", action="store_true",
+                        help="Print counts, pairing, latency and errors instead of frames")
+    parser.add_argument("--json", action="store_true",
+                        help="Print the --summary report as JSON")
+    parser.add_argument("--workers", "-j", type=int, default=1,
+                        help="Worker processes for --summary of a --file capture "
+                             "(0: one per CPU)")
 
     args = parser.parse_args()
 
@@ -349,8 +878,13 @@ Examples:
             print(f"Reading from {args.device}...")
             print(f"(waiting for frames, timeout={args.timeout}s)")
             print()
-            for i in range(args.count):
-                data = read_live_frame(fd, args.timeout)
+            decoder = FrameDecoder()
+            for i in range(args.count or 1):
+                try:
+                    data = read_live_frame(fd, args.timeout, decoder)
+                except FrameError as e:
+                    print(f"ERROR: invalid frame {i+1}: {e} (err_offset={e.err_offset})")
+                    continue
                 if data is None:
                     print(f"Timeout waiting for frame {i+1}")
                     break
@@ -358,33 +892,56 @@ Examples:
         finally:
             os.close(fd)
 
+    elif args.file:
+        scanner = FrameScanner()
+        try:
+            if args.summary:
+                if args.workers != 1:
+                    summary = summarize_parallel(args.file, args.workers or None)
+                elif is_capture(args.file):
+                    summary = summarize_capture(args.file)
+                else:
+                    summary = summarize_frames(iter_file_frames(args.file, scanner))
+                print_summary(summary, args.file, args.json)
+            elif is_capture(args.file):
+                dump_capture(args.file, args.count)
+            else:
+                dump_frames(iter_file_frames(args.file, scanner), scanner, args.count)
+        except (OSError, ValueError) as e:
+            print(f"Cannot read {args.file}: {e}", file=sys.stderr)
+            sys.exit(1)
+
     elif args.hexdata:
         # Hex data from command line
         try:
             data = parse_hex(args.hexdata)
-            dump_frame(data)
         except ValueError as e:
             print(f"Invalid hex data: {e}", file=sys.stderr)
             sys.exit(1)
+        scanner = FrameScanner()
+        dump_frames(iter_buffer_frames(data, scanner), scanner, args.count)
 
     elif not sys.stdin.isatty():
         # Read from stdin
+        scanner = FrameScanner()
         if args.hex:
-            hex_str = sys.stdin.read()
             try:
-                data = parse_hex(hex_str)
+                data = parse_hex(sys.stdin.read())
             except ValueError as e:
                 print(f"Invalid hex data: {e}", file=sys.stderr)
                 sys.exit(1)
+            frames = iter_buffer_frames(data, scanner)
+        elif stat.S_ISREG(os.fstat(sys.stdin.fileno()).st_mode):
+            frames = iter_file_frames(sys.stdin.buffer, scanner)
         else:
-            data = sys.stdin.buffer.read()
+            frames = iter_stream_frames(sys.stdin.buffer, scanner)
 
-        if not data:
+        if args.summary:
+            print_summary(summarize_frames(frames), "stdin", args.json)
+        elif not dump_frames(frames, scanner, args.count) and not scanner.skipped_bytes:
             print("No data received", file=sys.stderr)
             sys.exit(1)
 
-        dump_frame(data)
-
     else:
         parser.print_help()
         sys.exit(1)
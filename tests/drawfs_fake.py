@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+drawfs_fake.py - Userspace stand-in for /dev/draw.
+
+FakeDevice serves one drawfs session over a socketpair from a background
+thread, answering requests the way sys/dev/drawfs does (one reply frame per
+message, SURFACE_PRESENTED event after each successful present).  Like
+hw.drawfs.coalesce_events=1, a present whose surface already has a
+SURFACE_PRESENTED event waiting to be sent updates that event's cookie
+instead of queueing another (FakeDevice(coalesce_events=False) turns
+this off), so clients see at least the newest cookie but not every one.
+It lets
+the client helpers be exercised on hosts without the kernel module:
+
+    dev = FakeDevice()
+    s = DrawSession()
+    s.fd = dev.fd
+    s.hello()
+    ...
+    dev.close()
+
+It does not implement mmap, ioctls or queue limits.
+"""
+
+import errno
+import socket
+import struct
+import threading
+
+from drawfs_test import (
+    FrameBuilder, FrameDecoder, FrameError,
+    REQ_HELLO, REQ_DISPLAY_LIST, REQ_DISPLAY_OPEN,
+    REQ_SURFACE_CREATE, REQ_SURFACE_DESTROY, REQ_SURFACE_PRESENT,
+    RPL_HELLO, RPL_DISPLAY_LIST, RPL_DISPLAY_OPEN,
+    RPL_SURFACE_CREATE, RPL_SURFACE_DESTROY, RPL_SURFACE_PRESENT, RPL_ERROR,
+    EVT_SURFACE_PRESENTED, FMT_XRGB8888,
+    ERR_INVALID_MSG, ERR_UNSUPPORTED_CAP,
+)
+
+MAX_SURFACES = 64
+MAX_SURFACE_BYTES = 64 * 1024 * 1024
+
+
+class FakeDevice:
+    """One drawfs session served over a socketpair."""
+
+    def __init__(self, coalesce_events: bool = True):
+        self.coalesce_events = coalesce_events
+        self._client, self._server = socket.socketpair()
+        self.fd = self._client.fileno()
+        self.requests = 0
+        self._decoder = FrameDecoder()
+        self._builder = FrameBuilder()
+        self._out = bytearray()
+        self._presented = {}        # surface_id -> cookie offset of its unsent event in _out
+        self._frame_id = 0
+        self._display_id = 0
+        self._surfaces = {}
+        self._next_surface_id = 1
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Close the client end and wait for the server thread to exit."""
+        self._client.close()
+        self._thread.join(timeout=2.0)
+        self._server.close()
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                data = self._server.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            self._decoder.feed(data)
+            try:
+                for _, mh, payload in self._decoder:
+                    self.requests += 1
+                    self._handle(mh[0], mh[3], payload)
+            except FrameError as e:
+                self._reply(RPL_ERROR, 0, struct.pack("<III", e.err_code, 0, e.err_offset))
+            if self._out:
+                try:
+                    self._server.sendall(self._out)
+                except OSError:
+                    return
+                del self._out[:]
+                self._presented.clear()
+
+    def _reply(self, msg_type: int, msg_id: int, payload: bytes) -> None:
+        self._frame_id += 1
+        fb = self._builder.begin(self._frame_id)
+        fb.add_msg(msg_type, msg_id, payload)
+        self._out += fb.finish()
+
+    def _handle(self, msg_type: int, msg_id: int, payload) -> None:
+        if msg_type == REQ_HELLO:
+            if len(payload) < 12:
+                self._reply(RPL_ERROR, msg_id, struct.pack("<III", ERR_INVALID_MSG, 0, 0))
+                return
+            self._reply(RPL_HELLO, msg_id, struct.pack("<iHHII", 0, 1, 0, 0, 0))
+
+        elif msg_type == REQ_DISPLAY_LIST:
+            self._reply(RPL_DISPLAY_LIST, msg_id,
+                        struct.pack("<iIIIIII", 0, 1, 1, 1920, 1080, 60000, 0))
+
+        elif msg_type == REQ_DISPLAY_OPEN:
+            display_id, = struct.unpack_from("<I", payload, 0)
+            if display_id != 1:
+                self._reply(RPL_DISPLAY_OPEN, msg_id, struct.pack("<iII", errno.ENODEV, 0, 0))
+                return
+            self._display_id = display_id
+            self._reply(RPL_DISPLAY_OPEN, msg_id, struct.pack("<iII", 0, 1, display_id))
+
+        elif msg_type == REQ_SURFACE_CREATE:
+            w, h, fmt, _ = struct.unpack_from("<IIII", payload, 0)
+            status, sid, stride, total = self._create(w, h, fmt)
+            self._reply(RPL_SURFACE_CREATE, msg_id, struct.pack("<iIII", status, sid, stride, total))
+
+        elif msg_type == REQ_SURFACE_DESTROY:
+            sid, = struct.unpack_from("<I", payload, 0)
+            status = 0 if self._surfaces.pop(sid, None) is not None else errno.ENOENT
+            self._reply(RPL_SURFACE_DESTROY, msg_id, struct.pack("<iI", status, sid))
+
+        elif msg_type == REQ_SURFACE_PRESENT:
+            sid, _, cookie = struct.unpack_from("<IIQ", payload, 0)
+            if self._display_id == 0 or sid == 0:
+                status = errno.EINVAL
+            elif sid not in self._surfaces:
+                status = errno.ENOENT
+            else:
+                status = 0
+            self._reply(RPL_SURFACE_PRESENT, msg_id,
+                        struct.pack("<iIQ", status, sid if status == 0 else 0, cookie))
+            if status == 0:
+                self._presented_event(sid, cookie)
+
+        else:
+            self._reply(RPL_ERROR, msg_id, struct.pack("<III", ERR_UNSUPPORTED_CAP, 0, 0))
+
+    def _presented_event(self, sid: int, cookie: int) -> None:
+        at = self._presented.get(sid)
+        if at is not None and self.coalesce_events:
+            struct.pack_into("<Q", self._out, at, cookie)
+            return
+        # Cookie offset: frame header, message header, surface_id, reserved.
+        self._presented[sid] = len(self._out) + 40
+        self._reply(EVT_SURFACE_PRESENTED, 0, struct.pack("<IIQ", sid, 0, cookie))
+
+    def _create(self, w: int, h: int, fmt: int):
+        if self._display_id == 0 or w == 0 or h == 0:
+            return errno.EINVAL, 0, 0, 0
+        if fmt != FMT_XRGB8888:
+            return errno.EPROTONOSUPPORT, 0, 0, 0
+        stride = w * 4
+        total = stride * h
+        if total > MAX_SURFACE_BYTES:
+            return errno.EFBIG, 0, 0, 0
+        if len(self._surfaces) >= MAX_SURFACES:
+            return errno.ENOSPC, 0, 0, 0
+        sid = self._next_surface_id
+        self._next_surface_id += 1
+        self._surfaces[sid] = (w, h, stride, total)
+        return 0, sid, stride, total
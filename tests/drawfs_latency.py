@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+drawfs_latency.py - Request and present latency histograms.
+
+LatencyHistogram is a log-linear (HDR-style) histogram of nanosecond
+values: exact below 2**precision_bits, then 2**(precision_bits - 1)
+linear sub-buckets per power of two, so every recorded value is kept to
+within 1/2**(precision_bits - 1) of its true value in a fixed-size
+array('Q') regardless of how many values are recorded.  Histograms with
+the same layout merge by adding counts, and dump()/load() round-trip them
+through JSON so runs in different processes can be combined.
+
+LatencyRecorder plugs into DrawSession(latency=...).  The session stamps
+time.perf_counter_ns() for each msg_id it sends and for each
+(surface_id, cookie) it presents, and records request->reply per request
+type and present->SURFACE_PRESENTED:
+
+    rec = LatencyRecorder()
+    with DrawSession(latency=rec) as s:
+        ...
+    print(rec.format_report())               # p50 / p99 / p99.9 per type
+    rec.dump_file("run1.json")
+
+msg_ids and surface ids are per session, so give each session its own
+recorder and merge() them for an aggregate report.
+
+Merge and print dumps from several runs:
+
+    python3 tests/drawfs_latency.py run1.json run2.json
+"""
+
+import json
+import math
+import sys
+from array import array
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from drawfs_test import MSG_NAMES
+
+DEFAULT_PRECISION_BITS = 7      # 64 sub-buckets per power of two, < 1.6% error
+DEFAULT_MAX_NS = 1 << 36        # ~68 s; larger values land in the top bucket
+
+
+class LatencyHistogram:
+    """Fixed-memory log-linear histogram of non-negative integer values (ns)."""
+
+    def __init__(self, precision_bits: int = DEFAULT_PRECISION_BITS,
+                 max_value: int = DEFAULT_MAX_NS):
+        if precision_bits < 2:
+            raise ValueError(f"precision_bits must be at least 2, got {precision_bits}")
+        self.precision_bits = precision_bits
+        self.max_value = max_value
+        self._sub = 1 << precision_bits
+        self._half = self._sub >> 1
+        self.counts = array('Q', bytes(8 * (self._index(max_value) + 1)))
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        if value < self._sub:
+            return value
+        shift = value.bit_length() - self.precision_bits
+        return self._sub + (shift - 1) * self._half + (value >> shift) - self._half
+
+    def _upper(self, index: int) -> int:
+        """Largest value that lands in bucket index."""
+        if index < self._sub:
+            return index
+        shift, sub = divmod(index - self._sub, self._half)
+        shift += 1
+        return ((sub + self._half + 1) << shift) - 1
+
+    def record(self, value: int, n: int = 1) -> None:
+        if value < 0:
+            value = 0
+        clipped = value if value <= self.max_value else self.max_value
+        self.counts[self._index(clipped)] += n
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += n
+        self.total += value * n
+
+    def _compatible(self, other: 'LatencyHistogram') -> None:
+        if (other.precision_bits, other.max_value) != (self.precision_bits, self.max_value):
+            raise ValueError("Histograms have different layouts and cannot be merged")
+
+    def merge(self, other: 'LatencyHistogram') -> 'LatencyHistogram':
+        """Add other's counts into this histogram. Returns self."""
+        self._compatible(other)
+        if other.count == 0:
+            return self
+        counts = self.counts
+        for i, n in enumerate(other.counts):
+            if n:
+                counts[i] += n
+        if self.count == 0 or other.min < self.min:
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    def percentile(self, p: float) -> int:
+        """Value at percentile p (0-100): the top of the bucket holding it."""
+        if self.count == 0:
+            return 0
+        rank = max(1, math.ceil(round(p * self.count / 100.0, 6)))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n:
+                seen += n
+                if seen >= rank:
+                    return min(self._upper(i), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self, percentiles: Iterable[float] = (50, 99, 99.9)) -> Dict[str, float]:
+        """Count, min, mean, max and the given percentiles, in nanoseconds."""
+        out: Dict[str, float] = {'count': self.count, 'min': self.min,
+                                 'mean': self.mean(), 'max': self.max}
+        for p in percentiles:
+            out[f"p{p:g}"] = self.percentile(p)
+        return out
+
+    def dump(self) -> dict:
+        """JSON-serialisable form; only non-empty buckets are kept."""
+        return {
+            'precision_bits': self.precision_bits,
+            'max_value': self.max_value,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'buckets': [[i, n] for i, n in enumerate(self.counts) if n],
+        }
+
+    @classmethod
+    def load(cls, data: dict) -> 'LatencyHistogram':
+        h = cls(data['precision_bits'], data['max_value'])
+        for i, n in data['buckets']:
+            h.counts[i] = n
+        h.count = data['count']
+        h.total = data['total']
+        h.min = data['min']
+        h.max = data['max']
+        return h
+
+
+class LatencyRecorder:
+    """
+    Per-request-type and present latency histograms for one session.
+
+    Sent timestamps are held only until their reply or event arrives.  At
+    most max_pending requests are remembered; beyond that the oldest is
+    forgotten and counted in requests_evicted.  At most
+    max_pending_presents cookies are remembered per surface, and a
+    surface's cookies are dropped when its destroy is answered: with
+    hw.drawfs.coalesce_events=1 the kernel only reports the newest cookie,
+    so older ones are dropped when a later cookie's event arrives and
+    counted in presents_coalesced.
+    """
+
+    def __init__(self, precision_bits: int = DEFAULT_PRECISION_BITS,
+                 max_value: int = DEFAULT_MAX_NS, max_pending_presents: int = 1024,
+                 max_pending: int = 65536):
+        self.precision_bits = precision_bits
+        self.max_value = max_value
+        self.max_pending_presents = max_pending_presents
+        self.max_pending = max_pending
+        self.requests: Dict[int, LatencyHistogram] = {}
+        self.present = LatencyHistogram(precision_bits, max_value)
+        self.presents_coalesced = 0
+        self.presents_unmatched = 0
+        self.requests_evicted = 0
+        self._sent: Dict[int, Tuple[int, int]] = {}
+        self._presents: Dict[int, Deque[Tuple[int, int]]] = {}
+
+    def _histogram(self, msg_type: int) -> LatencyHistogram:
+        h = self.requests.get(msg_type)
+        if h is None:
+            h = self.requests[msg_type] = LatencyHistogram(self.precision_bits, self.max_value)
+        return h
+
+    def request_sent(self, msg_id: int, msg_type: int, t_ns: int) -> None:
+        sent = self._sent
+        if len(sent) >= self.max_pending and msg_id not in sent:
+            del sent[next(iter(sent))]
+            self.requests_evicted += 1
+        sent[msg_id] = (msg_type, t_ns)
+
+    def reply_received(self, msg_id: int, t_ns: int) -> None:
+        sent = self._sent.pop(msg_id, None)
+        if sent is not None:
+            self._histogram(sent[0]).record(t_ns - sent[1])
+
+    def request_abandoned(self, msg_id: int) -> None:
+        self._sent.pop(msg_id, None)
+
+    def record_request(self, msg_type: int, elapsed_ns: int) -> None:
+        """Record a request timed by the caller (blocking calls)."""
+        self._histogram(msg_type).record(elapsed_ns)
+
+    def present_sent(self, surface_id: int, cookie: int, t_ns: int) -> None:
+        q = self._presents.get(surface_id)
+        if q is None:
+            q = self._presents[surface_id] = deque()
+        elif len(q) >= self.max_pending_presents:
+            q.popleft()
+            self.presents_unmatched += 1
+        q.append((cookie, t_ns))
+
+    def surface_destroyed(self, surface_id: int) -> None:
+        """Forget a destroyed surface's cookies; their events will not come."""
+        q = self._presents.pop(surface_id, None)
+        if q:
+            self.presents_unmatched += len(q)
+
+    def presented(self, surface_id: int, cookie: int, t_ns: int) -> None:
+        q = self._presents.get(surface_id)
+        if not q:
+            return
+        for k, (c, _) in enumerate(q):
+            if c == cookie:
+                break
+        else:
+            return
+        for _ in range(k):
+            q.popleft()
+        self.presents_coalesced += k
+        self.present.record(t_ns - q.popleft()[1])
+        if not q:
+            del self._presents[surface_id]
+
+    def merge(self, other: 'LatencyRecorder') -> 'LatencyRecorder':
+        """Add other's histograms into this recorder. Returns self."""
+        for msg_type, h in other.requests.items():
+            self._histogram(msg_type).merge(h)
+        self.present.merge(other.present)
+        self.presents_coalesced += other.presents_coalesced
+        self.presents_unmatched += other.presents_unmatched
+        self.requests_evicted += other.requests_evicted
+        return self
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """Summary per histogram, keyed by request name and 'present'."""
+        out = {}
+        for msg_type in sorted(self.requests):
+            out[MSG_NAMES.get(msg_type, f"0x{msg_type:04x}")] = self.requests[msg_type].summary()
+        out['present'] = self.present.summary()
+        return out
+
+    def format_report(self) -> str:
+        lines = [f"  {'':24s} {'count':>8s} {'p50 us':>9s} {'p99 us':>9s} "
+                 f"{'p99.9 us':>9s} {'max us':>9s}"]
+        for name, r in self.report().items():
+            lines.append(f"  {name:24s} {r['count']:8d} {r['p50'] / 1000:9.1f} "
+                         f"{r['p99'] / 1000:9.1f} {r['p99.9'] / 1000:9.1f} {r['max'] / 1000:9.1f}")
+        if self.presents_coalesced or self.presents_unmatched:
+            lines.append(f"  presents coalesced {self.presents_coalesced}, "
+                         f"unmatched {self.presents_unmatched}")
+        if self.requests_evicted:
+            lines.append(f"  requests evicted unanswered {self.requests_evicted}")
+        return "\n".join(lines)
+
+    def dump(self) -> dict:
+        return {
+            'requests': {f"0x{t:04x}": h.dump() for t, h in self.requests.items()},
+            'present': self.present.dump(),
+            'presents_coalesced': self.presents_coalesced,
+            'presents_unmatched': self.presents_unmatched,
+            'requests_evicted': self.requests_evicted,
+        }
+
+    @classmethod
+    def load(cls, data: dict) -> 'LatencyRecorder':
+        present = LatencyHistogram.load(data['present'])
+        rec = cls(present.precision_bits, present.max_value)
+        rec.present = present
+        rec.requests = {int(t, 16): LatencyHistogram.load(h) for t, h in data['requests'].items()}
+        rec.presents_coalesced = data.get('presents_coalesced', 0)
+        rec.presents_unmatched = data.get('presents_unmatched', 0)
+        rec.requests_evicted = data.get('requests_evicted', 0)
+        return rec
+
+    def dump_file(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.dump(), f)
+
+    @classmethod
+    def load_file(cls, path: str) -> 'LatencyRecorder':
+        with open(path) as f:
+            return cls.load(json.load(f))
+
+
+def main(paths: List[str]) -> None:
+    if not paths:
+        print(f"Usage: {sys.argv[0]} DUMP.json [DUMP.json ...]")
+        raise SystemExit(2)
+    merged: Optional[LatencyRecorder] = None
+    for path in paths:
+        rec = LatencyRecorder.load_file(path)
+        merged = rec if merged is None else merged.merge(rec)
+    print(f"Latency over {len(paths)} dump(s)")
+    print(merged.format_report())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
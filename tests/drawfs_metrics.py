@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+drawfs_metrics.py - OpenMetrics exporter for drawfs session stats and sysctls.
+
+MetricsExporter collects get_stats() from every registered session and
+the hw.drawfs.* sysctls (tunables plus the vmobj_allocs/vmobj_deallocs
+counters) on a fixed interval and renders them once into an OpenMetrics
+text snapshot.  Scrapes only ever return the cached snapshot, so they add
+no ioctls or sysctl calls to the sessions' hot path:
+
+    exporter = MetricsExporter(interval_s=5.0)
+    exporter.register(s, "compositor")
+    exporter.start()                          # background refresh
+    exporter.serve(9469)                      # http://127.0.0.1:9469/metrics
+    # or, for node_exporter's textfile collector:
+    exporter.start(textfile="/var/db/node_exporter/drawfs.prom")
+
+Run as a script it opens `-s` sessions of its own (HELLO only) and serves
+their stats, which is mostly useful for checking the scrape setup.
+"""
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from drawfs_test import STATS_FIELDS, read_sysctls
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# struct drawfs_stats fields that only ever increase; the rest are gauges.
+COUNTER_FIELDS = frozenset((
+    'frames_received', 'frames_processed', 'frames_invalid',
+    'messages_processed', 'messages_unsupported',
+    'events_enqueued', 'events_dropped', 'bytes_in', 'bytes_out',
+))
+
+# hw.drawfs sysctls that are counters; every other one is exported as a gauge.
+SYSCTL_COUNTERS = frozenset(('vmobj_allocs', 'vmobj_deallocs'))
+
+HELP = {
+    'frames_received': "Frames written to the session",
+    'frames_processed': "Frames decoded successfully",
+    'frames_invalid': "Frames rejected as malformed",
+    'messages_processed': "Messages handled",
+    'messages_unsupported': "Messages with an unknown type",
+    'events_enqueued': "Replies and events queued for reading",
+    'events_dropped': "Events dropped because the event queue was full",
+    'bytes_in': "Bytes written to the session",
+    'bytes_out': "Bytes read from the session",
+    'evq_depth': "Frames waiting in the event queue",
+    'inbuf_bytes': "Bytes buffered from a partial write",
+    'evq_bytes': "Bytes waiting in the event queue",
+    'surfaces_count': "Live surfaces",
+    'surfaces_bytes': "Bytes held by live surfaces",
+}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsExporter:
+    """
+    Cached OpenMetrics snapshot of registered sessions and hw.drawfs sysctls.
+
+    A session is anything with get_stats(); sessions whose fd has been
+    closed are dropped at the next refresh.  The label defaults to the
+    session's fd.
+    """
+
+    def __init__(self, interval_s: float = 5.0, sysctl_prefix: str = "hw.drawfs"):
+        self.interval_s = interval_s
+        self.sysctl_prefix = sysctl_prefix
+        self.refreshes = 0
+        self.stats_errors = 0
+        self._sessions: List[Tuple[object, str]] = []
+        self._lock = threading.Lock()
+        self._snapshot = b"# EOF\n"
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._textfile: Optional[str] = None
+
+    def register(self, session, label: Optional[str] = None) -> None:
+        with self._lock:
+            self._sessions.append((session, label if label is not None else str(session.fd)))
+
+    def unregister(self, session) -> None:
+        with self._lock:
+            self._sessions = [(s, l) for s, l in self._sessions if s is not session]
+
+    def _read_sysctls(self) -> Dict[str, int]:
+        return read_sysctls(self.sysctl_prefix)
+
+    # -------------------------------------------------------------------------
+    # Snapshot
+    # -------------------------------------------------------------------------
+
+    def collect(self) -> Tuple[Dict[str, Dict[str, int]], Dict[str, int]]:
+        """Read stats from every live session and the sysctls."""
+        with self._lock:
+            sessions = list(self._sessions)
+        per_session: Dict[str, Dict[str, int]] = {}
+        gone = []
+        for session, label in sessions:
+            if getattr(session, 'fd', None) is None:
+                gone.append(session)
+                continue
+            try:
+                per_session[label] = session.get_stats()
+            except OSError:
+                self.stats_errors += 1
+        for session in gone:
+            self.unregister(session)
+        return per_session, self._read_sysctls()
+
+    def render(self, per_session: Dict[str, Dict[str, int]], sysctls: Dict[str, int],
+               duration_s: float = 0.0) -> bytes:
+        """OpenMetrics text for one collection."""
+        out = []
+        out.append("# TYPE drawfs_sessions gauge")
+        out.append("# HELP drawfs_sessions Live sessions in the snapshot")
+        out.append(f"drawfs_sessions {len(per_session)}")
+        for field in STATS_FIELDS:
+            name = f"drawfs_session_{field}"
+            counter = field in COUNTER_FIELDS
+            out.append(f"# TYPE {name} {'counter' if counter else 'gauge'}")
+            out.append(f"# HELP {name} {HELP[field]}")
+            suffix = "_total" if counter else ""
+            for label, stats in per_session.items():
+                out.append(f'{name}{suffix}{{session="{_escape(label)}"}} {stats[field]}')
+
+        prefix = self.sysctl_prefix + "."
+        for key in sorted(sysctls):
+            short = key[len(prefix):] if key.startswith(prefix) else key
+            name = "drawfs_" + short.replace(".", "_")
+            counter = short in SYSCTL_COUNTERS
+            out.append(f"# TYPE {name} {'counter' if counter else 'gauge'}")
+            out.append(f"# HELP {name} sysctl {key}")
+            out.append(f"{name}{'_total' if counter else ''} {sysctls[key]}")
+
+        out.append("# TYPE drawfs_exporter_refresh_seconds gauge")
+        out.append("# HELP drawfs_exporter_refresh_seconds Time taken by the last refresh")
+        out.append(f"drawfs_exporter_refresh_seconds {duration_s:.6f}")
+        out.append("# TYPE drawfs_exporter_refresh_timestamp_seconds gauge")
+        out.append("# HELP drawfs_exporter_refresh_timestamp_seconds Wall clock time of the last refresh")
+        out.append(f"drawfs_exporter_refresh_timestamp_seconds {time.time():.3f}")
+        out.append("# TYPE drawfs_exporter_stats_errors counter")
+        out.append("# HELP drawfs_exporter_stats_errors get_stats calls that failed")
+        out.append(f"drawfs_exporter_stats_errors_total {self.stats_errors}")
+        out.append("# EOF")
+        return ("\n".join(out) + "\n").encode()
+
+    def refresh(self) -> bytes:
+        """Collect, render and publish a new snapshot."""
+        start = time.perf_counter()
+        per_session, sysctls = self.collect()
+        snapshot = self.render(per_session, sysctls, time.perf_counter() - start)
+        self._snapshot = snapshot
+        self.refreshes += 1
+        if self._textfile is not None:
+            self.write_textfile(self._textfile)
+        return snapshot
+
+    def snapshot(self) -> bytes:
+        """The cached snapshot; never touches the device."""
+        return self._snapshot
+
+    def write_textfile(self, path: str) -> None:
+        """Atomically replace path with the cached snapshot."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(self._snapshot)
+        os.replace(tmp, path)
+
+    # -------------------------------------------------------------------------
+    # Background refresh and HTTP
+    # -------------------------------------------------------------------------
+
+    def start(self, textfile: Optional[str] = None) -> None:
+        """Refresh every interval_s, rewriting textfile after each refresh if given."""
+        self._textfile = textfile
+        self.refresh()
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="drawfs-metrics", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self.refresh()
+
+    def serve(self, port: int = 9469, host: str = "127.0.0.1") -> int:
+        """Serve the snapshot at /metrics from a background thread. Returns the port."""
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = exporter.snapshot()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="drawfs-metrics-http",
+                         daemon=True).start()
+        return self._server.server_address[1]
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def main():
+    import argparse
+    from drawfs_test import DrawSession
+
+    parser = argparse.ArgumentParser(description="Serve drawfs stats as OpenMetrics")
+    parser.add_argument("--port", "-p", type=int, default=9469, help="HTTP port (0 disables HTTP)")
+    parser.add_argument("--textfile", help="Also write snapshots to this textfile-collector path")
+    parser.add_argument("--interval", "-i", type=float, default=5.0, help="Refresh interval (s)")
+    parser.add_argument("--sessions", "-s", type=int, default=1, help="Sessions to open and export")
+    args = parser.parse_args()
+
+    sessions = [DrawSession().__enter__() for _ in range(args.sessions)]
+    exporter = MetricsExporter(args.interval)
+    for i, s in enumerate(sessions):
+        s.hello()
+        exporter.register(s, f"exporter-{i}")
+    exporter.start(args.textfile)
+    if args.port:
+        port = exporter.serve(args.port)
+        print(f"Serving http://127.0.0.1:{port}/metrics every {args.interval}s")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        exporter.close()
+        for s in sessions:
+            s.__exit__(None, None, None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+drawfs_pacing.py - Present pacing that keeps the session's event queue
+below hw.drawfs.max_evq_bytes.
+
+Every SURFACE_PRESENT queues a reply frame and a SURFACE_PRESENTED event
+frame (48 bytes each) on the session until the client reads them.  Once
+the queue would exceed max_evq_bytes the kernel drops the reply with
+ENOSPC and the write fails.  PresentPacer counts what its presents have
+put in the queue and holds the next one back (reading replies meanwhile)
+while it would not fit the budget:
+
+    pacer = PresentPacer(s, target_fps=120, latency_bias=0.25)
+    for frame in range(1000):
+        pacer.present(sid, frame)
+    pacer.flush()
+    print(pacer.report())
+
+latency_bias trades throughput for latency: 0.0 lets presents fill the
+whole budget, 1.0 keeps a single present in flight.  With
+use_stats=True the estimate is checked against the live evq_bytes from
+DRAWFSGIOC_STATS before holding a present back.
+
+report() gives the achieved rate, the in-flight and queue-bytes
+high-water marks, how many presents were held back, and how many of
+those holds happened where the present could have pushed the queue past
+max_evq_bytes (enospc_avoided; with headroom=1.0 every hold counts).
+"""
+
+import errno
+import time
+from typing import Dict, Optional
+
+from drawfs_test import (
+    DrawSession, PendingReply, EVT_SURFACE_PRESENTED, DRAWFS_MAX_EVQ_BYTES,
+    FH_SIZE, MH_SIZE, SURFACE_PRESENT_RPL, SURFACE_PRESENTED_EVT, read_sysctl,
+)
+
+# What one present leaves in the kernel's event queue: its reply and its
+# SURFACE_PRESENTED event, one message per frame.
+PRESENT_REPLY_BYTES = FH_SIZE + MH_SIZE + SURFACE_PRESENT_RPL.size
+PRESENTED_EVENT_BYTES = FH_SIZE + MH_SIZE + SURFACE_PRESENTED_EVT.size
+PRESENT_COST = PRESENT_REPLY_BYTES + PRESENTED_EVENT_BYTES
+
+
+class PresentPacer:
+    """
+    Rate- and queue-limited presents on one session.
+
+    max_evq_bytes defaults to hw.drawfs.max_evq_bytes (or the kernel's
+    compiled-in default when the sysctl cannot be read); headroom is the
+    share of it the pacer may use, leaving room for other replies.
+    """
+
+    def __init__(self, session: DrawSession, target_fps: Optional[float] = None,
+                 latency_bias: float = 0.0, max_evq_bytes: Optional[int] = None,
+                 headroom: float = 0.75, use_stats: bool = False,
+                 keep_events: bool = False):
+        if not 0.0 <= latency_bias <= 1.0:
+            raise ValueError(f"latency_bias must be in [0, 1], got {latency_bias}")
+        if max_evq_bytes is None:
+            max_evq_bytes = read_sysctl("hw.drawfs.max_evq_bytes") or DRAWFS_MAX_EVQ_BYTES
+        self.session = session
+        self.max_evq_bytes = max_evq_bytes
+        # One present in flight plus the previous present's unread event is
+        # the least the pacer can work with.
+        self.budget = max(int(max_evq_bytes * headroom * (1.0 - latency_bias)),
+                          PRESENT_COST + PRESENTED_EVENT_BYTES)
+        self.max_inflight = max(1, (self.budget - PRESENTED_EVENT_BYTES) // PRESENT_COST)
+        self.interval = 1.0 / target_fps if target_fps else 0.0
+        self.use_stats = use_stats
+        self.keep_events = keep_events
+
+        self.frames = 0
+        self.errors = 0
+        self.holds = 0
+        self.enospc_avoided = 0
+        self.enospc_hit = 0
+        self.inflight_high_water = 0
+        self.evq_high_water = 0
+        self._inflight: Dict[int, PendingReply] = {}
+        self._next_due = 0.0
+        self._start: Optional[float] = None
+        self._end: Optional[float] = None
+
+    def queued_bytes(self) -> int:
+        """
+        Conservative estimate of what our presents hold in the kernel queue:
+        every present whose reply is unread, plus the event of the last
+        answered one (it follows its reply and may not be read yet).
+        """
+        self._reap()
+        answered_tail = PRESENTED_EVENT_BYTES if self.frames > len(self._inflight) else 0
+        return len(self._inflight) * PRESENT_COST + answered_tail
+
+    def _reap(self) -> None:
+        done = [mid for mid, p in self._inflight.items() if p.done()]
+        for mid in done:
+            p = self._inflight.pop(mid)
+            try:
+                status = p.result()[0]
+            except (OSError, TimeoutError, RuntimeError):
+                status = -1
+            if status != 0:
+                self.errors += 1
+        if not self.keep_events and self.session.events:
+            self.session.take_events(lambda msg_type, msg_id, payload:
+                                     msg_type == EVT_SURFACE_PRESENTED)
+
+    def _live_evq_bytes(self) -> int:
+        evq = self.session.get_stats()['evq_bytes']
+        if evq > self.evq_high_water:
+            self.evq_high_water = evq
+        return evq
+
+    def _fits(self) -> bool:
+        queued = self.queued_bytes()
+        if queued > self.evq_high_water:
+            self.evq_high_water = queued
+        if not self._inflight:
+            return True
+        if len(self._inflight) < self.max_inflight and queued + PRESENT_COST <= self.budget:
+            return True
+        if self.use_stats:
+            # The estimate is an upper bound; the kernel may already have
+            # coalesced or we may have read more than we know about.
+            evq = self._live_evq_bytes()
+            return len(self._inflight) < self.max_inflight and evq + PRESENT_COST <= self.budget
+        return False
+
+    def present(self, surface_id: int, cookie: int = 0, timeout_ms: int = 2000) -> PendingReply:
+        """Submit a present once the frame interval and queue budget allow it."""
+        now = time.monotonic()
+        if self._start is None:
+            self._start = now
+            self._next_due = now
+
+        s = self.session
+        while now < self._next_due:
+            s.pump(max(int((self._next_due - now) * 1000), 1))
+            now = time.monotonic()
+
+        if not self._fits():
+            self.holds += 1
+            if self.queued_bytes() + PRESENT_COST > self.max_evq_bytes:
+                self.enospc_avoided += 1
+            while not self._fits():
+                s.pump(timeout_ms)
+
+        try:
+            p = s.submit_surface_present(surface_id, cookie, timeout_ms)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                self.enospc_hit += 1
+            raise
+        self._inflight[p.msg_id] = p
+        self.frames += 1
+        if len(self._inflight) > self.inflight_high_water:
+            self.inflight_high_water = len(self._inflight)
+        if self.interval:
+            self._next_due = max(self._next_due + self.interval, now - self.interval)
+        self._end = time.monotonic()
+        return p
+
+    def flush(self) -> None:
+        """Wait for every paced present to be answered."""
+        while self._inflight:
+            self.session.pump()
+            self._reap()
+        self._end = time.monotonic()
+
+    def report(self) -> Dict[str, float]:
+        elapsed = (self._end - self._start) if self._start is not None and self._end else 0.0
+        return {
+            'frames': self.frames,
+            'elapsed': elapsed,
+            'fps': self.frames / elapsed if elapsed > 0 else 0.0,
+            'budget_bytes': self.budget,
+            'max_inflight': self.max_inflight,
+            'inflight_high_water': self.inflight_high_water,
+            'evq_high_water': self.evq_high_water,
+            'holds': self.holds,
+            'enospc_avoided': self.enospc_avoided,
+            'enospc_hit': self.enospc_hit,
+            'errors': self.errors,
+        }
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+drawfs_pixels.py - NumPy views over mapped XRGB8888 surfaces.
+
+SurfacePixels wraps a surface mapping in a zero-copy numpy array of shape
+(height, stride // 4) and dtype uint32, one element per pixel, so whole
+frames can be filled or copied with vectorized operations instead of
+per-pixel byte slices:
+
+    with DrawSession() as s:
+        ...
+        status, sid, stride, total = s.surface_create(1920, 1080)
+        px = pixels(s, sid)
+        px.fill(xrgb(0, 0, 0))
+        px.fill_rect(100, 100, 200, 50, xrgb(255, 0, 0))
+        px.copy_from(frame)          # (h, w) uint32 or (h, w, 4) uint8
+        s.surface_present(sid, 1)
+
+numpy is imported on first use, so importing this module does not need it.
+"""
+
+from typing import Optional
+
+from drawfs_test import MappedSurface
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("drawfs_pixels needs numpy (pip install numpy)") from e
+    return numpy
+
+
+def xrgb(r: int, g: int, b: int) -> int:
+    """Pack a colour as an XRGB8888 pixel value."""
+    return ((r & 0xff) << 16) | ((g & 0xff) << 8) | (b & 0xff)
+
+
+class SurfacePixels:
+    """
+    A (height, stride // 4) uint32 array over a surface's memory.
+
+    `buf` is a MappedSurface or any writable buffer (an mmap.mmap from
+    map_surface, for instance) together with the stride and total_bytes
+    reported by surface_create/map_surface.  `width` defaults to
+    stride // 4; `visible` is the array cropped to it.
+    """
+
+    def __init__(self, buf, stride: Optional[int] = None, total: Optional[int] = None,
+                 width: Optional[int] = None):
+        np = _numpy()
+        if isinstance(buf, MappedSurface):
+            stride = buf.stride if stride is None else stride
+            total = buf.total if total is None else total
+            width = buf.width if width is None else width
+            buf = buf.mmap
+        if stride is None or total is None:
+            raise ValueError("stride and total are required for a raw buffer")
+        if stride % 4:
+            raise ValueError(f"stride {stride} is not a multiple of 4")
+        self.stride = stride
+        self.height = total // stride
+        self.width = stride // 4 if width is None else width
+        self.array = np.frombuffer(buf, dtype=np.uint32,
+                                   count=self.height * (stride // 4)).reshape(self.height, stride // 4)
+        self.visible = self.array[:, :self.width]
+
+    def fill(self, color: int) -> None:
+        """Set every visible pixel to color."""
+        self.visible.fill(color)
+
+    def fill_rect(self, x: int, y: int, w: int, h: int, color: int) -> None:
+        """Fill a rectangle, clipped to the visible area."""
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, self.width), min(y + h, self.height)
+        if x0 < x1 and y0 < y1:
+            self.visible[y0:y1, x0:x1] = color
+
+    def copy_from(self, src, x: int = 0, y: int = 0) -> None:
+        """
+        Copy an image into the surface at (x, y), clipped to the visible
+        area.  src is a (h, w) uint32 array of XRGB pixels or a (h, w, 4)
+        uint8 array in memory order (B, G, R, X).
+        """
+        np = _numpy()
+        src = np.asarray(src)
+        if src.ndim == 3:
+            if src.shape[2] != 4 or src.dtype != np.uint8:
+                raise ValueError("3-D source must be (h, w, 4) uint8")
+            src = np.ascontiguousarray(src).view(np.uint32)[:, :, 0]
+        elif src.ndim != 2:
+            raise ValueError(f"source must be 2-D or (h, w, 4), got shape {src.shape}")
+        sx, sy = max(-x, 0), max(-y, 0)
+        x0, y0 = max(x, 0), max(y, 0)
+        w = min(src.shape[1] - sx, self.width - x0)
+        h = min(src.shape[0] - sy, self.height - y0)
+        if w > 0 and h > 0:
+            self.visible[y0:y0 + h, x0:x0 + w] = src[sy:sy + h, sx:sx + w]
+
+
+def pixels(session, surface_id: int) -> SurfacePixels:
+    """SurfacePixels over the session's cached mapping of surface_id."""
+    return SurfacePixels(session.mapped(surface_id))
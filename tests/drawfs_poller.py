@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+drawfs_poller.py - Drive many DrawSession fds from one selectors loop.
+
+SessionPoller registers sessions with the platform's best selector (epoll
+on Linux, kqueue on FreeBSD), so one thread can service thousands of
+sessions without the 1024-fd ceiling of select().  Each wakeup reads the
+whole burst a session has queued and hands every message to that
+session's handlers:
+
+    poller = SessionPoller()
+    for s in sessions:
+        poller.register(s, on_reply=handle_reply, on_event=handle_event)
+        s.submit_surface_create(64, 64)
+    while busy():
+        poller.poll(100)
+
+on_reply(session, pending) runs after a pipelined request's PendingReply
+has been resolved, or has failed with TimeoutError at its deadline; every
+poll() expires overdue requests of all registered sessions, not only of
+those that became readable.  Sessions report their deadlines as they
+submit, and a heap holding each session's earliest one means only
+sessions with a request due are looked at.  on_event(session, msg_type,
+msg_id, payload) gets events.  Without a handler, messages are dispatched
+to the session as pump() would; replies no request is waiting for are
+counted in the session's stray_replies.  A session whose fd fails or
+reaches end of stream is unregistered and listed in errors.
+
+Only the poller reads a registered session's fd: handlers may submit
+requests, but a submit into a full window raises BlockingIOError instead
+of waiting, and pump(), flush() and the blocking helpers raise.
+"""
+
+import heapq
+import itertools
+import os
+import selectors
+import time
+from typing import Optional, Callable, Dict, List, Tuple
+
+from drawfs_test import DrawSession, FrameError, is_event
+
+
+class _Entry:
+    __slots__ = ("session", "on_reply", "on_event", "ready", "was_blocking", "scheduled")
+
+    def __init__(self, session: DrawSession, on_reply: Optional[Callable],
+                 on_event: Optional[Callable]):
+        self.session = session
+        self.on_reply = on_reply
+        self.on_event = on_event
+        self.ready = 0
+        self.was_blocking = True
+        self.scheduled: Optional[float] = None     # this session's live deadline in the heap
+
+
+class SessionPoller:
+    """Dispatches replies and events for many sessions from one thread."""
+
+    def __init__(self, selector: Optional[selectors.BaseSelector] = None):
+        self._sel = selector if selector is not None else selectors.DefaultSelector()
+        self._entries: Dict[int, _Entry] = {}
+        self._deadlines: List[Tuple[float, int, _Entry]] = []
+        self._seq = itertools.count()
+        self.wakeups = 0
+        self.messages = 0
+        self.errors: List[tuple] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __enter__(self) -> 'SessionPoller':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    @property
+    def selector_name(self) -> str:
+        return type(self._sel).__name__
+
+    def register(self, session: DrawSession, on_reply: Optional[Callable] = None,
+                 on_event: Optional[Callable] = None) -> None:
+        """
+        Start polling an open session (which must not run a reader thread).
+        The fd is non-blocking while registered so each wakeup can read
+        until EWOULDBLOCK; the session's own helpers still select first.
+        """
+        if session._reader is not None:
+            raise ValueError("Session already has a reader thread")
+        if session._poller is not None:
+            raise ValueError("Session is already registered with a SessionPoller")
+        entry = _Entry(session, on_reply, on_event)
+        entry.was_blocking = os.get_blocking(session.fd)
+        os.set_blocking(session.fd, False)
+        self._sel.register(session.fd, selectors.EVENT_READ, entry)
+        self._entries[session.fd] = entry
+        session._poller = self
+        if session._inflight:
+            self._schedule(session, min(p.deadline for p in session._inflight.values()))
+
+    def unregister(self, session: DrawSession) -> None:
+        self._sel.unregister(session.fd)
+        entry = self._entries.pop(session.fd)
+        entry.scheduled = None
+        session._poller = None
+        if entry.was_blocking:
+            os.set_blocking(session.fd, True)
+
+    def readiness(self) -> Dict[int, int]:
+        """Number of times each registered fd was reported readable."""
+        return {fd: e.ready for fd, e in self._entries.items()}
+
+    def poll(self, timeout_ms: Optional[int] = 0) -> int:
+        """
+        Wait up to timeout_ms (None blocks) for any session to become
+        readable, or until the earliest request deadline, then drain and
+        dispatch every ready session and expire overdue requests on all of
+        them.  Returns the number of messages dispatched.
+        """
+        timeout_s = None if timeout_ms is None else timeout_ms / 1000.0
+        deadline = self._next_deadline()
+        if deadline is not None:
+            until_deadline = max(deadline - time.monotonic(), 0.0)
+            if timeout_s is None or until_deadline < timeout_s:
+                timeout_s = until_deadline
+        ready = self._sel.select(timeout_s)
+        if ready:
+            self.wakeups += 1
+        dispatched = 0
+        for key, _ in ready:
+            entry = key.data
+            entry.ready += 1
+            dispatched += self._service(entry)
+        self._expire_due(time.monotonic())
+        self.messages += dispatched
+        return dispatched
+
+    def run(self, until: Callable[[], bool], timeout_ms: int = 5000) -> bool:
+        """
+        Poll until until() is true.  Returns False if timeout_ms pass
+        without a complete message (a partial frame does not count).
+        """
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        while not until():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if self.poll(remaining * 1000.0):
+                deadline = time.monotonic() + timeout_ms / 1000.0
+        return True
+
+    def close(self) -> None:
+        """Unregister every session (the sessions stay open)."""
+        for entry in list(self._entries.values()):
+            self.unregister(entry.session)
+        self._sel.close()
+
+    def _schedule(self, session: DrawSession, deadline: float) -> None:
+        """Wake by deadline to expire session's requests (called as they are sent)."""
+        entry = self._entries.get(session.fd)
+        if entry is None or (entry.scheduled is not None and entry.scheduled <= deadline):
+            return
+        entry.scheduled = deadline
+        heapq.heappush(self._deadlines, (deadline, next(self._seq), entry))
+
+    def _next_deadline(self) -> Optional[float]:
+        heap = self._deadlines
+        # Entries superseded by an earlier deadline or an unregister are stale.
+        while heap and heap[0][2].scheduled != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def _expire_due(self, now: float) -> None:
+        heap = self._deadlines
+        while heap and heap[0][0] <= now:
+            deadline, _, entry = heapq.heappop(heap)
+            if entry.scheduled != deadline:
+                continue
+            entry.scheduled = None
+            s = entry.session
+            for pending in s._expire():
+                if entry.on_reply is not None:
+                    entry.on_reply(s, pending)
+            if s._inflight and self._entries.get(s.fd) is entry:
+                self._schedule(s, min(p.deadline for p in s._inflight.values()))
+
+    def _service(self, entry: _Entry) -> int:
+        s = entry.session
+        try:
+            s.decoder.readall(s.fd)
+            msgs = [(mh[0], mh[3], bytes(payload)) for _, mh, payload in s.decoder]
+        except (OSError, FrameError) as e:
+            self.errors.append((s, e))
+            self.unregister(s)
+            return 0
+        self._dispatch(entry, msgs)
+        if s.decoder.eof:
+            self.errors.append((s, EOFError("End of stream")))
+            if self._entries.get(s.fd) is entry:
+                self.unregister(s)
+        return len(msgs)
+
+    def _dispatch(self, entry: _Entry, msgs: List[Tuple[int, int, bytes]]) -> None:
+        s = entry.session
+        for mt, mid, payload in msgs:
+            if is_event(mt):
+                if entry.on_event is not None:
+                    s._event_arrived(mt, payload)
+                    entry.on_event(s, mt, mid, payload)
+                else:
+                    s._dispatch(mt, mid, payload)
+                continue
+            pending = s._take_reply(mt, mid)
+            if pending is None:
+                continue
+            pending._resolve(mt, payload)
+            if entry.on_reply is not None:
+                entry.on_reply(s, pending)
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+drawfs_pool.py - Client-side surface and session recycling.
+
+Every SURFACE_CREATE allocates a swap-backed vm_object in the kernel and
+every SURFACE_DESTROY frees it again, which makes create/destroy churn the
+most expensive pattern stress_surface_lifecycle.py exercises.  SurfacePool
+keeps released surfaces per (width, height, format) and hands them out
+again instead of creating new ones:
+
+    pool = SurfacePool(s)
+    surf = pool.acquire(256, 256)          # a PooledSurface
+    render(s.mapped(surf.surface_id))
+    s.surface_present(surf.surface_id, 1)
+    pool.release(surf)                     # kept for the next 256x256 acquire
+    ...
+    print(pool.report())                   # hits, misses, hit_rate, creates_saved, ...
+    pool.close()
+
+The pool never lets the session's surfaces (in use plus idle) exceed
+hw.drawfs.max_surfaces or hw.drawfs.max_session_surface_bytes: it destroys
+the least recently released idle surfaces first to make room, and
+max_idle / max_idle_bytes bound what it keeps.  A recycled surface still
+holds whatever was drawn into it last.
+
+SessionPool keeps sessions open and already past HELLO and DISPLAY_OPEN,
+so a short-lived client starts at surface_create:
+
+    pool = SessionPool(size=4)
+    with pool.session() as s:
+        status, sid, stride, total = s.surface_create(64, 64)
+        ...
+        s.surface_destroy(sid)
+    pool.close()
+
+A background thread tops the pool back up to `size`; a failed warm-up is
+counted in open_errors (the exception is kept in last_error) and retried.
+Returned sessions are checked with get_stats() and reused only if they
+hold no surfaces and nothing is queued in either direction or left
+unread in the session's decoder; anything else is closed.
+"""
+
+import contextlib
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from drawfs_test import (
+    DrawSession, FMT_XRGB8888, DRAWFS_MAX_SURFACES, DRAWFS_MAX_SESSION_SURFACE_BYTES,
+    RPL_DISPLAY_OPEN, read_sysctl,
+)
+
+PoolKey = Tuple[int, int, int]
+
+
+class PooledSurface:
+    """A surface handed out by SurfacePool."""
+
+    __slots__ = ("surface_id", "width", "height", "fmt", "stride", "total")
+
+    def __init__(self, surface_id: int, width: int, height: int, fmt: int, stride: int, total: int):
+        self.surface_id = surface_id
+        self.width = width
+        self.height = height
+        self.fmt = fmt
+        self.stride = stride
+        self.total = total
+
+    @property
+    def key(self) -> PoolKey:
+        return (self.width, self.height, self.fmt)
+
+
+class SurfacePool:
+    """
+    Recycles surfaces of one session, keyed by (width, height, format).
+
+    max_surfaces and max_session_bytes default to the hw.drawfs sysctls
+    (or the kernel defaults when they cannot be read) and should cover
+    every surface the session owns, pooled or not.
+    """
+
+    def __init__(self, session: DrawSession, max_surfaces: Optional[int] = None,
+                 max_session_bytes: Optional[int] = None, max_idle: Optional[int] = None,
+                 max_idle_bytes: Optional[int] = None):
+        if max_surfaces is None:
+            max_surfaces = read_sysctl("hw.drawfs.max_surfaces") or DRAWFS_MAX_SURFACES
+        if max_session_bytes is None:
+            max_session_bytes = (read_sysctl("hw.drawfs.max_session_surface_bytes")
+                                 or DRAWFS_MAX_SESSION_SURFACE_BYTES)
+        self.session = session
+        self.max_surfaces = max_surfaces
+        self.max_session_bytes = max_session_bytes
+        self.max_idle = max_surfaces if max_idle is None else max_idle
+        self.max_idle_bytes = max_session_bytes if max_idle_bytes is None else max_idle_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.trimmed = 0
+        self.in_use_bytes = 0
+        self.idle_bytes = 0
+        self._in_use: Dict[int, PooledSurface] = {}
+        self._idle: 'OrderedDict[int, PooledSurface]' = OrderedDict()   # LRU first
+        self._by_key: Dict[PoolKey, List[int]] = {}
+
+    def __enter__(self) -> 'SurfacePool':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    @property
+    def in_use(self) -> int:
+        return len(self._in_use)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def acquire(self, width: int, height: int, fmt: int = FMT_XRGB8888) -> PooledSurface:
+        """Return an idle surface of this size and format, creating one if there is none."""
+        key = (width, height, fmt)
+        sids = self._by_key.get(key)
+        if sids:
+            surf = self._idle.pop(sids.pop())
+            if not sids:
+                del self._by_key[key]
+            self.idle_bytes -= surf.total
+            self.hits += 1
+        else:
+            # The kernel computes total_bytes as width * 4 * height.
+            self._make_room(1, width * 4 * height)
+            status, sid, stride, total = self.session.surface_create(width, height, fmt)
+            if status != 0:
+                raise OSError(status, f"SurfacePool create failed ({width}x{height})")
+            surf = PooledSurface(sid, width, height, fmt, stride, total)
+            self.misses += 1
+        self._in_use[surf.surface_id] = surf
+        self.in_use_bytes += surf.total
+        return surf
+
+    def release(self, surf: PooledSurface) -> None:
+        """Return surf to the pool. It must not be presented again until re-acquired."""
+        if self._in_use.get(surf.surface_id) is not surf:
+            if surf.surface_id in self._idle:
+                raise RuntimeError(f"Surface {surf.surface_id} was already released")
+            raise ValueError(f"Surface {surf.surface_id} was not acquired from this pool")
+        del self._in_use[surf.surface_id]
+        self.in_use_bytes -= surf.total
+        self._idle[surf.surface_id] = surf
+        self._by_key.setdefault(surf.key, []).append(surf.surface_id)
+        self.idle_bytes += surf.total
+        if len(self._idle) > self.max_idle or self.idle_bytes > self.max_idle_bytes:
+            self.trim(min(self.max_idle, len(self._idle)), self.max_idle_bytes)
+
+    def _make_room(self, count: int, nbytes: int) -> None:
+        over_count = self.in_use + len(self._idle) + count - self.max_surfaces
+        over_bytes = self.in_use_bytes + self.idle_bytes + nbytes - self.max_session_bytes
+        if over_count > 0 or over_bytes > 0:
+            self.trim(max(len(self._idle) - max(over_count, 0), 0),
+                      max(self.idle_bytes - max(over_bytes, 0), 0))
+
+    def trim(self, keep: int = 0, keep_bytes: Optional[int] = None) -> int:
+        """
+        Destroy least recently released idle surfaces until at most `keep`
+        surfaces and `keep_bytes` bytes are idle. Returns surfaces destroyed.
+        """
+        victims = []
+        while self._idle and (len(self._idle) > keep or
+                              (keep_bytes is not None and self.idle_bytes > keep_bytes)):
+            sid, surf = self._idle.popitem(last=False)
+            sids = self._by_key[surf.key]
+            sids.remove(sid)
+            if not sids:
+                del self._by_key[surf.key]
+            self.idle_bytes -= surf.total
+            victims.append(sid)
+        if victims:
+            with self.session.batch() as b:
+                destroys = [b.surface_destroy(sid) for sid in victims]
+            for p in destroys:
+                p.result()
+            self.trimmed += len(victims)
+        return len(victims)
+
+    def close(self) -> None:
+        """Destroy every idle surface. Surfaces still in use stay the caller's."""
+        self.trim(0)
+
+    def report(self) -> Dict[str, float]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+            'creates_saved': self.hits,
+            'trimmed': self.trimmed,
+            'in_use': self.in_use,
+            'idle': len(self._idle),
+            'idle_bytes': self.idle_bytes,
+        }
+
+
+class SessionPool:
+    """
+    `size` warm sessions on display_id, opened with DrawSession(**session_kwargs).
+
+    acquire() returns a warm session when one is ready (a hit) and opens
+    one on the spot otherwise (a miss).  Override _open/_close/_stats to
+    pool something other than /dev/draw sessions.
+    """
+
+    def __init__(self, size: int = 4, display_id: int = 1, refill: bool = True,
+                 **session_kwargs: Any):
+        self.size = size
+        self.display_id = display_id
+        self.session_kwargs = session_kwargs
+        self.hits = 0
+        self.misses = 0
+        self.opened = 0
+        self.reused = 0
+        self.discarded = 0
+        self.open_errors = 0
+        self.last_error: Optional[BaseException] = None
+        self._idle: Deque[DrawSession] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        if refill:
+            self._thread = threading.Thread(target=self._refill_loop, name="drawfs-session-pool",
+                                            daemon=True)
+            self._thread.start()
+
+    def __enter__(self) -> 'SessionPool':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def _open(self) -> DrawSession:
+        return DrawSession(**self.session_kwargs).__enter__()
+
+    def _close(self, session: DrawSession) -> None:
+        session.__exit__(None, None, None)
+
+    def _stats(self, session: DrawSession) -> Dict[str, int]:
+        return session.get_stats()
+
+    def _warm(self) -> DrawSession:
+        """Open a session and take it through HELLO and DISPLAY_OPEN."""
+        session = self._open()
+        try:
+            session.hello()
+            mt, payload = session.display_open(self.display_id)
+            status = struct.unpack_from("<i", payload, 0)[0] if mt == RPL_DISPLAY_OPEN else -1
+            if status != 0:
+                raise OSError(status, f"DISPLAY_OPEN {self.display_id} failed (reply 0x{mt:04x})")
+        except BaseException:
+            self._close(session)
+            raise
+        self.opened += 1
+        return session
+
+    def fill(self) -> int:
+        """Open sessions until `size` are idle. Returns how many were opened."""
+        opened = 0
+        while len(self._idle) < self.size and not self._closed:
+            session = self._warm()
+            with self._cond:
+                if self._closed:
+                    self._close(session)
+                    break
+                self._idle.append(session)
+                self._cond.notify_all()
+            opened += 1
+        return opened
+
+    def _refill_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and len(self._idle) >= self.size:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            try:
+                self.fill()
+            except Exception as e:
+                # Keep refilling; a dead thread would leave the pool empty for good.
+                self.open_errors += 1
+                self.last_error = e
+                time.sleep(0.1)
+
+    def acquire(self, timeout_s: float = 0.0) -> DrawSession:
+        """
+        Return a warm session, waiting up to timeout_s for the refill
+        thread before opening one directly.
+        """
+        with self._cond:
+            if not self._idle and timeout_s > 0:
+                self._cond.wait_for(lambda: self._idle or self._closed, timeout_s)
+            if self._idle:
+                session = self._idle.popleft()
+                self.hits += 1
+                self._cond.notify_all()
+                return session
+            self.misses += 1
+            self._cond.notify_all()
+        return self._warm()
+
+    def _reusable(self, session: DrawSession) -> bool:
+        if (session.fd is None or session.inflight or session.events or len(session.decoder)
+                or session._reader is not None):
+            return False
+        try:
+            stats = self._stats(session)
+        except OSError:
+            return False
+        return (stats['surfaces_count'] == 0 and stats['evq_bytes'] == 0
+                and stats['inbuf_bytes'] == 0)
+
+    def release(self, session: DrawSession) -> bool:
+        """Give a session back. Returns True if it was kept for reuse."""
+        keep = not self._closed and len(self._idle) < self.size and self._reusable(session)
+        if keep:
+            session.mapper.close()
+            with self._cond:
+                keep = not self._closed
+                if keep:
+                    self._idle.append(session)
+                    self.reused += 1
+                    self._cond.notify_all()
+        if not keep:
+            self.discarded += 1
+            self._close(session)
+        return keep
+
+    @contextlib.contextmanager
+    def session(self, timeout_s: float = 0.0):
+        """acquire() a session for the duration of a with block."""
+        s = self.acquire(timeout_s)
+        try:
+            yield s
+        finally:
+            self.release(s)
+
+    def close(self) -> None:
+        """Stop refilling and close every idle session."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for session in idle:
+            self._close(session)
+
+    def report(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'opened': self.opened,
+            'reused': self.reused,
+            'discarded': self.discarded,
+            'open_errors': self.open_errors,
+            'idle': len(self._idle),
+        }
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+drawfs_replay.py - Replay the client side of a .dfcap capture.
+
+Replayer re-sends one session's client->kernel frames from a capture to a
+live session (or a FakeDevice) and checks every reply against the one
+that was recorded for the same msg_id:
+
+    with CaptureReader("run.dfcap") as cap, DrawSession() as s:
+        r = Replayer(cap, pacing="original")
+        r.run(s)
+        print(r.format_report())
+
+Pacing:
+
+    original   send each frame at its recorded offset from the first one
+    scaled     the same schedule run `speed` times faster (2.0 = twice as fast)
+    none       as fast as the window of unanswered requests allows
+
+surface_ids handed out by the new run's RPL_SURFACE_CREATE replies are
+mapped onto the recorded ones, and SURFACE_DESTROY / SURFACE_PRESENT
+payloads are rewritten before they are sent; a frame that refers to a
+surface whose create is still unanswered waits for that reply first.
+frame_ids and msg_ids are sent as recorded.
+
+report() gives the sustained request rate of the replay and of the
+recording, reply type/status matches and mismatches, and per request
+type p50/p99 latency of the recording next to the replay.
+
+    python3 tests/drawfs_replay.py run.dfcap --pacing none
+    python3 tests/drawfs_replay.py run.dfcap --pacing scaled --speed 4 --fake --json
+"""
+
+import errno
+import json
+import os
+import struct
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from drawfs_capture import CaptureReader, FROM_KERNEL, TO_KERNEL
+from drawfs_latency import LatencyHistogram
+from drawfs_test import (
+    DRAWFS_MAGIC, FH_SIZE, FH_STRUCT, MH_SIZE, MH_STRUCT, MSG_NAMES,
+    REQ_SURFACE_CREATE, REQ_SURFACE_DESTROY, REQ_SURFACE_PRESENT,
+    RPL_SURFACE_CREATE, FrameDecoder, FrameError, is_event, read_available, reply_status,
+)
+
+PACING_MODES = ("original", "scaled", "none")
+
+# Requests whose payload starts with a surface_id that has to be remapped.
+SURFACE_REQUESTS = frozenset((REQ_SURFACE_DESTROY, REQ_SURFACE_PRESENT))
+
+_u32 = struct.Struct("<I")
+
+
+def _messages(frame) -> Iterator[Tuple[int, int, int, int]]:
+    """(msg_type, msg_id, payload offset, payload length) of each message in frame."""
+    if len(frame) < FH_SIZE:
+        return
+    magic, _, _, frame_bytes, _ = FH_STRUCT.unpack_from(frame, 0)
+    if magic != DRAWFS_MAGIC:
+        return
+    end = min(frame_bytes, len(frame))
+    pos = FH_SIZE
+    while pos + MH_SIZE <= end:
+        msg_type, _, msg_bytes, msg_id, _ = MH_STRUCT.unpack_from(frame, pos)
+        if msg_bytes < MH_SIZE or pos + msg_bytes > end:
+            return
+        yield msg_type, msg_id, pos + MH_SIZE, msg_bytes - MH_SIZE
+        pos += (msg_bytes + 3) & ~3
+
+
+def _name(msg_type: int) -> str:
+    return MSG_NAMES.get(msg_type, f"0x{msg_type:04x}")
+
+
+class RecordedReply:
+    """What the recording saw for one request."""
+
+    __slots__ = ("request_type", "reply_type", "status", "surface_id", "latency_ns")
+
+    def __init__(self, request_type: int, reply_type: int, status: int, surface_id: int,
+                 latency_ns: int):
+        self.request_type = request_type
+        self.reply_type = reply_type
+        self.status = status
+        self.surface_id = surface_id
+        self.latency_ns = latency_ns
+
+
+class Replayer:
+    """
+    Replays session_id's requests from an open CaptureReader.
+
+    session_id defaults to the session of the first client->kernel
+    record.  window bounds the requests sent but not yet answered (keep
+    it below what hw.drawfs.max_evq_bytes can hold); timeout_s is how
+    long to wait for replies before counting them missing.
+    """
+
+    def __init__(self, capture: CaptureReader, session_id: Optional[int] = None,
+                 pacing: str = "original", speed: float = 1.0, window: int = 32,
+                 timeout_s: float = 2.0, max_mismatches: int = 20):
+        if pacing not in PACING_MODES:
+            raise ValueError(f"pacing must be one of {PACING_MODES}, got {pacing!r}")
+        if speed <= 0:
+            raise ValueError(f"speed must be positive, got {speed}")
+        self.capture = capture
+        self.pacing = pacing
+        self.speed = speed if pacing == "scaled" else 1.0
+        self.window = window
+        self.timeout_s = timeout_s
+        self.max_mismatches = max_mismatches
+        self.session_id = self._first_session() if session_id is None else session_id
+
+        self.expected: Dict[int, RecordedReply] = {}
+        self.recorded_requests = 0
+        self.recorded_events = 0
+        self.recorded_span_ns = 0
+        self.recorded_latency: Dict[int, LatencyHistogram] = {}
+        self._load_expected()
+
+        self.frames = 0
+        self.requests = 0
+        self.replies = 0
+        self.events = 0
+        self.matched = 0
+        self.mismatched = 0
+        self.unrecorded = 0
+        self.missing = 0
+        self.remapped = 0
+        self.late = 0
+        self.max_lag_ns = 0
+        self.write_retries = 0
+        self.frame_errors = 0
+        self.elapsed_ns = 0
+        self.mismatches: List[Dict[str, object]] = []
+        self.latency: Dict[int, LatencyHistogram] = {}
+        self.surface_map: Dict[int, int] = {}
+        self._pending: Dict[int, Tuple[int, int]] = {}     # msg_id -> (request type, sent ns)
+        self._awaiting: Dict[int, int] = {}                # recorded surface_id -> create msg_id
+        self._decoder = FrameDecoder()
+        self._fd = -1
+
+    def _records(self):
+        cap = self.capture
+        for rec in cap.between(cap.start_ns, cap.end_ns + 1):
+            if rec.session_id == self.session_id:
+                yield rec
+
+    def _first_session(self) -> int:
+        cap = self.capture
+        for rec in cap.between(cap.start_ns, cap.end_ns + 1):
+            if rec.direction == TO_KERNEL:
+                return rec.session_id
+        raise ValueError(f"{cap.path}: no client->kernel records to replay")
+
+    def _load_expected(self) -> None:
+        """One pass over the recording: the reply and latency of every request."""
+        sent: Dict[int, Tuple[int, int]] = {}
+        first = last = None
+        for rec in self._records():
+            frame = rec.frame
+            if rec.direction == TO_KERNEL:
+                if first is None:
+                    first = rec.ts_ns
+                last = rec.ts_ns
+                for msg_type, msg_id, _, _ in _messages(frame):
+                    sent[msg_id] = (msg_type, rec.ts_ns)
+                    self.recorded_requests += 1
+            elif rec.direction == FROM_KERNEL:
+                for msg_type, msg_id, off, n in _messages(frame):
+                    if is_event(msg_type):
+                        self.recorded_events += 1
+                        continue
+                    req = sent.pop(msg_id, None)
+                    if req is None:
+                        continue
+                    payload = frame[off:off + n]
+                    status = reply_status(msg_type, payload)
+                    surface_id = 0
+                    if msg_type == RPL_SURFACE_CREATE and status == 0 and n >= 8:
+                        surface_id = _u32.unpack_from(payload, 4)[0]
+                    latency = rec.ts_ns - req[1]
+                    self.expected[msg_id] = RecordedReply(req[0], msg_type, status, surface_id,
+                                                          latency)
+                    self._histogram(self.recorded_latency, req[0]).record(latency)
+            frame.release()
+        if first is not None:
+            self.recorded_span_ns = last - first
+
+    @staticmethod
+    def _histogram(table: Dict[int, LatencyHistogram], msg_type: int) -> LatencyHistogram:
+        h = table.get(msg_type)
+        if h is None:
+            h = table[msg_type] = LatencyHistogram()
+        return h
+
+    # -------------------------------------------------------------------------
+    # Replies
+    # -------------------------------------------------------------------------
+
+    def _pump(self, timeout_s: float) -> int:
+        """Read and check whatever replies are queued, waiting up to timeout_s."""
+        if read_available(self._fd, self._decoder, max(timeout_s, 0.0) * 1000) == 0:
+            return 0
+        now = time.perf_counter_ns()
+        handled = 0
+        try:
+            for _, mh, payload in self._decoder:
+                self._reply(mh[0], mh[3], payload, now)
+                handled += 1
+        except FrameError:
+            self.frame_errors += 1
+        return handled
+
+    def _reply(self, msg_type: int, msg_id: int, payload, now: int) -> None:
+        if is_event(msg_type):
+            self.events += 1
+            return
+        self.replies += 1
+        req = self._pending.pop(msg_id, None)
+        if req is not None:
+            self._histogram(self.latency, req[0]).record(now - req[1])
+        exp = self.expected.get(msg_id)
+        if exp is None:
+            self.unrecorded += 1
+            return
+        status = reply_status(msg_type, payload)
+        if msg_type == exp.reply_type and status == exp.status:
+            self.matched += 1
+        else:
+            self.mismatched += 1
+            if len(self.mismatches) < self.max_mismatches:
+                self.mismatches.append({
+                    'msg_id': msg_id,
+                    'request': _name(exp.request_type),
+                    'expected': f"{_name(exp.reply_type)} status {exp.status}",
+                    'got': f"{_name(msg_type)} status {status}",
+                })
+        if exp.surface_id and self._awaiting.get(exp.surface_id) == msg_id:
+            del self._awaiting[exp.surface_id]
+            if msg_type == RPL_SURFACE_CREATE and status == 0 and len(payload) >= 8:
+                new_id = _u32.unpack_from(payload, 4)[0]
+                self.surface_map[exp.surface_id] = new_id
+                if new_id != exp.surface_id:
+                    self.remapped += 1
+
+    def _wait_for(self, done, deadline_s: float) -> bool:
+        while not done():
+            remaining = deadline_s - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._pump(remaining)
+        return True
+
+    # -------------------------------------------------------------------------
+    # Requests
+    # -------------------------------------------------------------------------
+
+    def _prepare(self, frame) -> Tuple[object, List[Tuple[int, int]]]:
+        """Rewrite surface_ids in frame; returns it and its (msg_type, msg_id) list."""
+        msgs = []
+        out = frame
+        for msg_type, msg_id, off, n in _messages(frame):
+            msgs.append((msg_type, msg_id))
+            if msg_type not in SURFACE_REQUESTS or n < 4:
+                continue
+            recorded = _u32.unpack_from(frame, off)[0]
+            create = self._awaiting.get(recorded)
+            if create is not None:
+                self._wait_for(lambda: create not in self._pending,
+                               time.monotonic() + self.timeout_s)
+            new_id = self.surface_map.get(recorded)
+            if new_id is not None and new_id != recorded:
+                if out is frame:
+                    out = bytearray(frame)
+                _u32.pack_into(out, off, new_id)
+        return out, msgs
+
+    def _write(self, frame) -> None:
+        deadline = time.monotonic() + self.timeout_s
+        while True:
+            try:
+                os.write(self._fd, frame)
+                return
+            except OSError as e:
+                # The event queue is full: read it down and try again.
+                if e.errno != errno.ENOSPC or time.monotonic() >= deadline:
+                    raise
+                self.write_retries += 1
+                self._pump(0.01)
+
+    def run(self, target) -> Dict[str, object]:
+        """Replay into target (a DrawSession or an fd). Returns report()."""
+        self._fd = getattr(target, 'fd', target)
+        interval = 1.0 / self.speed
+        first_ts = None
+        start = time.perf_counter_ns()
+        for rec in self._records():
+            if rec.direction != TO_KERNEL:
+                rec.frame.release()
+                continue
+            if first_ts is None:
+                first_ts = rec.ts_ns
+            if self.pacing != "none":
+                due = start + int((rec.ts_ns - first_ts) * interval)
+                now = time.perf_counter_ns()
+                if now < due:
+                    while now < due:
+                        self._pump((due - now) / 1e9)
+                        now = time.perf_counter_ns()
+                elif now - due > 1000000:
+                    self.late += 1
+                    self.max_lag_ns = max(self.max_lag_ns, now - due)
+
+            frame, msgs = self._prepare(rec.frame)
+            if self._pending and len(self._pending) + len(msgs) > self.window:
+                deadline = time.monotonic() + self.timeout_s
+                limit = max(self.window - len(msgs), 0)
+                self._wait_for(lambda: len(self._pending) <= limit, deadline)
+            self._write(frame)
+            sent = time.perf_counter_ns()
+            for msg_type, msg_id in msgs:
+                self._pending[msg_id] = (msg_type, sent)
+                if msg_type == REQ_SURFACE_CREATE:
+                    exp = self.expected.get(msg_id)
+                    if exp is not None and exp.surface_id:
+                        self._awaiting[exp.surface_id] = msg_id
+            self.frames += 1
+            self.requests += len(msgs)
+            del frame
+            rec.frame.release()
+
+        self._wait_for(lambda: not self._pending, time.monotonic() + self.timeout_s)
+        self.elapsed_ns = time.perf_counter_ns() - start
+        self.missing = sum(1 for msg_id in self._pending if msg_id in self.expected)
+        self._pending.clear()
+        # Pick up events that trail the last reply.
+        self._pump(0.0)
+        return self.report()
+
+    # -------------------------------------------------------------------------
+    # Report
+    # -------------------------------------------------------------------------
+
+    def report(self) -> Dict[str, object]:
+        elapsed = self.elapsed_ns / 1e9
+        span = self.recorded_span_ns / 1e9
+        latency = {}
+        for msg_type in sorted(set(self.recorded_latency) | set(self.latency)):
+            rec = self.recorded_latency.get(msg_type) or LatencyHistogram()
+            new = self.latency.get(msg_type) or LatencyHistogram()
+            row = {'recorded_count': rec.count, 'replayed_count': new.count}
+            for p in (50, 99):
+                a, b = rec.percentile(p), new.percentile(p)
+                row[f'recorded_p{p}_ns'] = a
+                row[f'replayed_p{p}_ns'] = b
+                row[f'p{p}_ratio'] = b / a if a else 0.0
+            latency[_name(msg_type)] = row
+        return {
+            'session_id': self.session_id,
+            'pacing': self.pacing,
+            'speed': self.speed,
+            'frames': self.frames,
+            'requests': self.requests,
+            'replies': self.replies,
+            'events': self.events,
+            'recorded_events': self.recorded_events,
+            'elapsed_s': elapsed,
+            'ops_per_s': self.requests / elapsed if elapsed > 0 else 0.0,
+            'recorded_elapsed_s': span,
+            'recorded_ops_per_s': self.recorded_requests / span if span > 0 else 0.0,
+            'matched': self.matched,
+            'mismatched': self.mismatched,
+            'missing': self.missing,
+            'unrecorded': self.unrecorded,
+            'remapped': self.remapped,
+            'late': self.late,
+            'max_lag_ns': self.max_lag_ns,
+            'write_retries': self.write_retries,
+            'frame_errors': self.frame_errors,
+            'latency': latency,
+            'mismatches': self.mismatches,
+        }
+
+    def format_report(self) -> str:
+        r = self.report()
+        pacing = f"scaled x{r['speed']:g}" if r['pacing'] == "scaled" else r['pacing']
+        lines = [
+            f"  session {r['session_id']}, pacing {pacing}: {r['requests']} requests in "
+            f"{r['frames']} frames, {r['elapsed_s']:.3f}s",
+            f"  {r['ops_per_s']:.0f} ops/s replayed, {r['recorded_ops_per_s']:.0f} ops/s recorded",
+            f"  replies: {r['matched']} matched, {r['mismatched']} mismatched, "
+            f"{r['missing']} missing, {r['unrecorded']} not in the recording, "
+            f"{r['frame_errors']} malformed",
+            f"  events: {r['events']} replayed, {r['recorded_events']} recorded; "
+            f"{r['remapped']} surface_id(s) remapped",
+        ]
+        if r['late']:
+            lines.append(f"  {r['late']} frame(s) sent late, max lag {r['max_lag_ns'] / 1e6:.1f} ms")
+        lines.append(f"  {'latency (us)':24s} {'count':>8s} {'rec p50':>9s} {'p50':>9s} "
+                     f"{'rec p99':>9s} {'p99':>9s}")
+        for name, row in r['latency'].items():
+            lines.append(f"  {name:24s} {row['replayed_count']:8d} "
+                         f"{row['recorded_p50_ns'] / 1000:9.1f} {row['replayed_p50_ns'] / 1000:9.1f} "
+                         f"{row['recorded_p99_ns'] / 1000:9.1f} {row['replayed_p99_ns'] / 1000:9.1f}")
+        for m in r['mismatches']:
+            lines.append(f"  mismatch msg_id {m['msg_id']} {m['request']}: "
+                         f"expected {m['expected']}, got {m['got']}")
+        return "\n".join(lines)
+
+
+def main(argv: List[str]) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay a .dfcap capture against /dev/draw")
+    parser.add_argument("path")
+    parser.add_argument("--session", type=int, help="Session to replay (default: the first)")
+    parser.add_argument("--pacing", choices=PACING_MODES, default="original")
+    parser.add_argument("--speed", type=float, default=1.0, help="Speed-up for --pacing scaled")
+    parser.add_argument("--window", type=int, default=32, help="Unanswered requests allowed")
+    parser.add_argument("--fake", action="store_true", help="Replay against a FakeDevice")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    with CaptureReader(args.path) as cap:
+        replayer = Replayer(cap, args.session, args.pacing, args.speed, args.window)
+        if args.fake:
+            from drawfs_fake import FakeDevice
+            dev = FakeDevice()
+            try:
+                replayer.run(dev.fd)
+            finally:
+                dev.close()
+        else:
+            from drawfs_test import DrawSession
+            with DrawSession() as s:
+                replayer.run(s)
+        if args.json:
+            print(json.dumps(replayer.report(), indent=2))
+        else:
+            print(f"Replay of {args.path}")
+            print(replayer.format_report())
+    if replayer.mismatched or replayer.missing or replayer.frame_errors:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+drawfs_stats.py - High-frequency DRAWFSGIOC_STATS sampling.
+
+get_stats() allocates a buffer, unpacks it and builds a dict on every
+call.  StatsSampler instead has the ioctl write each sample straight into
+the next slot of a preallocated ring and records a perf_counter_ns()
+timestamp; nothing is decoded until a window is read.  Windows are decoded
+in one pass (as a numpy structured array when numpy is available) and
+rates are computed from the whole column at once:
+
+    sampler = StatsSampler(s.fd, capacity=8192)
+    sampler.start(interval_s=0.001)        # 1 kHz background sampling
+    ... run the workload ...
+    sampler.stop()
+    print(sampler.window(seconds=1.0))     # frames/s, messages/s, bytes/s, ...
+    print(sampler.overhead())              # mean/max ns per sample
+
+sample() can also be called directly from a benchmark loop.
+"""
+
+import fcntl
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+from drawfs_test import DRAWFSGIOC_STATS, STATS_SIZE, STATS_STRUCT, STATS_FIELDS
+
+# Monotonic counters reported as per-second rates by window().
+RATE_FIELDS = (
+    ('frames_processed', 'frames_per_s'),
+    ('messages_processed', 'messages_per_s'),
+    ('bytes_in', 'bytes_in_per_s'),
+    ('bytes_out', 'bytes_out_per_s'),
+    ('events_dropped', 'events_dropped_per_s'),
+)
+
+# Gauges reported as their maximum over the window.
+GAUGE_FIELDS = ('evq_depth', 'evq_bytes', 'inbuf_bytes', 'surfaces_count', 'surfaces_bytes')
+
+
+def _stats_dtype(np):
+    return np.dtype([(name, '<u4' if STATS_STRUCT.format[1 + i] == 'I' else '<u8')
+                     for i, name in enumerate(STATS_FIELDS)])
+
+
+class StatsSampler:
+    """Ring buffer of raw stats samples for one session (or its fd)."""
+
+    def __init__(self, fd, capacity: int = 4096):
+        self.fd = getattr(fd, 'fd', fd)
+        self.capacity = capacity
+        self._ring = bytearray(capacity * STATS_SIZE)
+        view = memoryview(self._ring)
+        self._slots = [view[i * STATS_SIZE:(i + 1) * STATS_SIZE] for i in range(capacity)]
+        self._ts = array('Q', bytes(8 * capacity))
+        self.count = 0
+        self.overhead_ns = 0
+        self.overhead_max_ns = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def __len__(self) -> int:
+        """Samples currently held (at most capacity)."""
+        return min(self.count, self.capacity)
+
+    def _read_into(self, slot: memoryview) -> None:
+        fcntl.ioctl(self.fd, DRAWFSGIOC_STATS, slot, True)
+
+    def sample(self) -> None:
+        """Take one sample into the ring."""
+        t0 = time.perf_counter_ns()
+        i = self.count % self.capacity
+        self._read_into(self._slots[i])
+        self._ts[i] = t0
+        self.count += 1
+        cost = time.perf_counter_ns() - t0
+        self.overhead_ns += cost
+        if cost > self.overhead_max_ns:
+            self.overhead_max_ns = cost
+
+    def start(self, interval_s: float = 0.001) -> None:
+        """Sample every interval_s from a background thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval_s,),
+                                        name="drawfs-stats", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self, interval_s: float) -> None:
+        next_t = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except OSError:
+                return
+            next_t += interval_s
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                next_t = time.monotonic()
+
+    def overhead(self) -> Dict[str, float]:
+        """Mean and maximum cost of sample() in nanoseconds."""
+        return {
+            'samples': self.count,
+            'mean_ns': self.overhead_ns / self.count if self.count else 0.0,
+            'max_ns': self.overhead_max_ns,
+        }
+
+    # -------------------------------------------------------------------------
+    # Reading windows
+    # -------------------------------------------------------------------------
+
+    def _indices(self, seconds: Optional[float]) -> List[int]:
+        """Ring slots of the window, oldest first."""
+        end = self.count                # samples below this are complete
+        n = min(end, self.capacity)
+        if not n:
+            return []
+        cap = self.capacity
+        start = (end - n) % cap
+        stop = (end - 1) % cap + 1      # one past the newest slot
+        # A wrapped window is _ts[start:cap] then _ts[:stop]; timestamps
+        # are monotonic, so each segment is sorted and can be bisected.
+        segments = [(start, stop)] if start < stop else [(start, cap), (0, stop)]
+        if seconds is not None:
+            ts = self._ts
+            cutoff = ts[stop - 1] - int(seconds * 1e9)
+            if len(segments) == 2 and ts[cap - 1] < cutoff:
+                del segments[0]
+            lo, hi = segments[0]
+            segments[0] = (bisect_left(ts, cutoff, lo, hi), hi)
+        return [i for lo, hi in segments for i in range(lo, hi)]
+
+    def columns(self, seconds: Optional[float] = None) -> Dict[str, object]:
+        """
+        Decode the window into columns: 'ts_ns' plus one per stats field.
+        Values are numpy arrays when numpy is installed, else array('Q').
+        """
+        idx = self._indices(seconds)
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        if np is not None:
+            records = np.frombuffer(self._ring, dtype=_stats_dtype(np))[idx]
+            cols = {name: records[name].astype(np.uint64) for name in STATS_FIELDS}
+            cols['ts_ns'] = np.frombuffer(self._ts, dtype=np.uint64)[idx]
+            return cols
+        cols = {name: array('Q') for name in STATS_FIELDS}
+        unpack_from = STATS_STRUCT.unpack_from
+        for i in idx:
+            for name, value in zip(STATS_FIELDS, unpack_from(self._ring, i * STATS_SIZE)):
+                cols[name].append(value)
+        cols['ts_ns'] = array('Q', (self._ts[i] for i in idx))
+        return cols
+
+    def window(self, seconds: Optional[float] = None) -> Dict[str, float]:
+        """
+        Rates over the last `seconds` of samples (or everything held):
+        the average and the peak per-interval rate of each counter in
+        RATE_FIELDS, and the maximum of each gauge in GAUGE_FIELDS.
+        """
+        cols = self.columns(seconds)
+        ts = cols['ts_ns']
+        n = len(ts)
+        out: Dict[str, float] = {'samples': n, 'elapsed_s': 0.0}
+        if n < 2:
+            return out
+        elapsed = (int(ts[-1]) - int(ts[0])) / 1e9
+        out['elapsed_s'] = elapsed
+        vectorized = not isinstance(ts, array)
+        if vectorized:
+            import numpy as np
+            dt = np.diff(ts.astype(np.int64)) / 1e9
+            dt[dt <= 0] = np.nan
+        for field, name in RATE_FIELDS:
+            col = cols[field]
+            out[name] = (int(col[-1]) - int(col[0])) / elapsed if elapsed > 0 else 0.0
+            if vectorized:
+                rates = np.diff(col.astype(np.int64)) / dt
+                out['peak_' + name] = float(np.nanmax(rates)) if np.isfinite(rates).any() else 0.0
+            else:
+                out['peak_' + name] = max(
+                    ((col[k + 1] - col[k]) * 1e9 / (ts[k + 1] - ts[k])
+                     for k in range(n - 1) if ts[k + 1] > ts[k]), default=0.0)
+        for field in GAUGE_FIELDS:
+            out['max_' + field] = int(max(cols[field]))
+        return out
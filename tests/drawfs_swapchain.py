@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+drawfs_swapchain.py - Double/triple buffered presentation for DrawSession.
+
+A Swapchain owns `depth` surfaces of the same size.  acquire() hands out a
+buffer that is not queued for display, present() submits it without
+waiting, and the buffer only becomes free again when the
+EVT_SURFACE_PRESENTED carrying its cookie arrives.  Rendering the next
+frame therefore overlaps presentation of the previous ones:
+
+    with DrawSession() as s:
+        s.hello()
+        s.display_open()
+        with Swapchain(s, 640, 480, depth=3) as chain:
+            for frame in range(100):
+                buf = chain.acquire()
+                render(buf.surface)          # a MappedSurface
+                chain.present(buf)
+        print(chain.stalls)
+
+Each surface has at most one present outstanding, so kernel event
+coalescing (hw.drawfs.coalesce_events) never hides a buffer's cookie.
+"""
+
+import time
+from collections import deque
+from typing import Deque, List, Optional
+
+from drawfs_test import (
+    DrawSession, MappedSurface, PendingReply, EVT_SURFACE_PRESENTED,
+    FMT_XRGB8888,
+)
+
+
+class SwapchainBuffer:
+    """One surface of a swapchain."""
+
+    __slots__ = ("chain", "index", "surface_id", "stride", "total", "cookie", "pending")
+
+    def __init__(self, chain: 'Swapchain', index: int, surface_id: int, stride: int, total: int):
+        self.chain = chain
+        self.index = index
+        self.surface_id = surface_id
+        self.stride = stride
+        self.total = total
+        self.cookie: Optional[int] = None         # set while queued for display
+        self.pending: Optional[PendingReply] = None
+
+    @property
+    def busy(self) -> bool:
+        return self.cookie is not None
+
+    @property
+    def surface(self) -> MappedSurface:
+        """The buffer's mapping, from the session's SurfaceMapper."""
+        return self.chain.session.mapped(self.surface_id)
+
+
+class Swapchain:
+    """
+    `depth` surfaces cycled through presentation.
+
+    Stats: frames presented, stalls (acquire() calls that had to wait for a
+    buffer), stall_time (seconds spent waiting) and present_errors.
+    """
+
+    def __init__(self, session: DrawSession, width: int, height: int,
+                 depth: int = 2, fmt: int = FMT_XRGB8888):
+        if depth < 2:
+            raise ValueError(f"Swapchain depth must be at least 2, got {depth}")
+        self.session = session
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.frames = 0
+        self.stalls = 0
+        self.stall_time = 0.0
+        self.present_errors = 0
+        self._cookie = 0
+        self.buffers: List[SwapchainBuffer] = []
+        self._free: Deque[SwapchainBuffer] = deque()
+        self._by_surface = {}
+
+        with session.batch() as b:
+            creates = [b.surface_create(width, height, fmt) for _ in range(depth)]
+        failed = 0
+        for i, p in enumerate(creates):
+            status, sid, stride, total = p.result()
+            if status != 0:
+                failed = failed or status
+                continue
+            buf = SwapchainBuffer(self, i, sid, stride, total)
+            self.buffers.append(buf)
+            self._free.append(buf)
+            self._by_surface[sid] = buf
+        if failed:
+            self.close()
+            raise OSError(failed, f"Swapchain surface create failed ({width}x{height})")
+
+    def __enter__(self) -> 'Swapchain':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    @property
+    def busy(self) -> int:
+        """Buffers currently queued for display."""
+        return self.depth - len(self._free)
+
+    def _release(self, buf: SwapchainBuffer) -> None:
+        buf.cookie = None
+        buf.pending = None
+        self._free.append(buf)
+
+    def _presented(self, msg_type: int, msg_id: int, payload: bytes) -> bool:
+        """True for the SURFACE_PRESENTED event of a queued buffer's cookie."""
+        if msg_type != EVT_SURFACE_PRESENTED or len(payload) < 16:
+            return False
+        buf = self._by_surface.get(int.from_bytes(payload[0:4], "little"))
+        return buf is not None and buf.cookie == int.from_bytes(payload[8:16], "little")
+
+    def _collect(self) -> None:
+        """Free buffers whose present event arrived or whose present failed."""
+        for _, _, payload in self.session.take_events(self._presented):
+            self._release(self._by_surface[int.from_bytes(payload[0:4], "little")])
+        for buf in self.buffers:
+            p = buf.pending
+            if p is not None and p.done():
+                try:
+                    failed = p.result()[0] != 0
+                except (OSError, TimeoutError, RuntimeError):
+                    failed = True
+                if failed:
+                    self.present_errors += 1
+                    self._release(buf)
+                else:
+                    buf.pending = None
+
+    def acquire(self, timeout_ms: int = 2000) -> SwapchainBuffer:
+        """Return the next buffer not queued for display, waiting for one if needed."""
+        if not self._free:
+            self._collect()
+        if self._free:
+            return self._free.popleft()
+
+        self.stalls += 1
+        start = time.monotonic()
+        deadline = start + timeout_ms / 1000.0
+        try:
+            while not self._free:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No swapchain buffer became free ({timeout_ms}ms)")
+                self.session.pump(int(remaining * 1000))
+                self._collect()
+        finally:
+            self.stall_time += time.monotonic() - start
+        return self._free.popleft()
+
+    def present(self, buf: SwapchainBuffer, timeout_ms: int = 2000) -> int:
+        """Queue buf for display. Returns the cookie its event will carry."""
+        if buf.busy:
+            raise RuntimeError(f"Swapchain buffer {buf.index} is already queued")
+        self._cookie += 1
+        buf.cookie = self._cookie
+        try:
+            buf.pending = self.session.submit_surface_present(buf.surface_id, buf.cookie, timeout_ms)
+        except OSError:
+            self._release(buf)
+            raise
+        self.frames += 1
+        return buf.cookie
+
+    def wait_idle(self, timeout_ms: int = 2000) -> None:
+        """Wait until every presented buffer is free again."""
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        self._collect()
+        while self.busy:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{self.busy} swapchain buffers still queued ({timeout_ms}ms)")
+            self.session.pump(int(remaining * 1000))
+            self._collect()
+
+    def close(self) -> None:
+        """Destroy the swapchain's surfaces."""
+        if not self.buffers:
+            return
+        self.session.flush()
+        self._collect()
+        with self.session.batch() as b:
+            destroys = [b.surface_destroy(buf.surface_id) for buf in self.buffers]
+        for p in destroys:
+            p.result()
+        self.buffers = []
+        self._free.clear()
+        self._by_surface.clear()
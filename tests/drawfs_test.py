@@ -4,18 +4,29 @@ drawfs test helpers - common protocol encoding/decoding for all step tests.
 
 This module provides:
 - Protocol constants (magic, version, message types)
-- Frame and message building functions
-- Frame and message parsing functions
+- Frame and message building functions (and a reusable FrameBuilder)
+- Frame and message parsing functions (and an incremental FrameDecoder)
 - Common operation helpers (hello, display_open, surface_create, etc.)
 - ioctl helpers (stats, map_surface)
-- Select-based read utilities
+- A per-session cache of surface mappings (SurfaceMapper)
+- Select-based read utilities, including a drain-to-EWOULDBLOCK bulk reader
+- Pipelined requests with msg_id correlation (DrawSession.submit_*)
+- An opt-in background reader thread per DrawSession (reader=True)
 """
 
 import os
+import errno
+import mmap
+import time
+import contextlib
 import struct
 import select
+import selectors
 import fcntl
-from typing import Optional, Tuple, List, Dict, Any
+import threading
+import subprocess
+from collections import deque, OrderedDict
+from typing import Optional, Tuple, List, Dict, Any, Callable, Deque, Iterable
 
 # Device path
 DEV = "/dev/draw"
@@ -48,6 +59,23 @@ EVT_SURFACE_PRESENTED = 0x9002
 # Pixel formats
 FMT_XRGB8888 = 1
 
+# Error codes (enum drawfs_err_code)
+ERR_OK                  = 0
+ERR_INVALID_FRAME       = 1
+ERR_INVALID_MSG         = 2
+ERR_UNSUPPORTED_VERSION = 3
+ERR_UNSUPPORTED_CAP     = 4
+ERR_PERMISSION          = 5
+ERR_NOT_FOUND           = 6
+ERR_BUSY                = 7
+ERR_NO_MEMORY           = 8
+ERR_INVALID_HANDLE      = 9
+ERR_INVALID_STATE       = 10
+ERR_INVALID_ARG         = 11
+ERR_OVERFLOW            = 12
+ERR_IO                  = 13
+ERR_INTERNAL            = 14
+
 # Header format strings
 FH_FMT = "<IHHII"   # frame header: magic, version, header_bytes, frame_bytes, frame_id
 MH_FMT = "<HHIII"   # msg header: msg_type, msg_flags, msg_bytes, msg_id, reserved
@@ -55,12 +83,188 @@ MH_FMT = "<HHIII"   # msg header: msg_type, msg_flags, msg_bytes, msg_id, reserv
 FH_SIZE = struct.calcsize(FH_FMT)
 MH_SIZE = struct.calcsize(MH_FMT)
 
+# Precompiled header layouts
+FH_STRUCT = struct.Struct(FH_FMT)
+MH_STRUCT = struct.Struct(MH_FMT)
+
+# Precompiled request payload layouts
+HELLO_REQ = struct.Struct("<HHII")            # client_major, client_minor, flags, max_reply
+DISPLAY_OPEN_REQ = struct.Struct("<I")        # display_id
+SURFACE_CREATE_REQ = struct.Struct("<IIII")   # width, height, format, flags
+SURFACE_DESTROY_REQ = struct.Struct("<I")     # surface_id
+SURFACE_PRESENT_REQ = struct.Struct("<IIQ")   # surface_id, flags, cookie
+
+# Precompiled reply and event payload layouts
+HELLO_RPL = struct.Struct("<iHHII")           # status, server_major, server_minor, flags, max_reply_bytes
+DISPLAY_LIST_RPL = struct.Struct("<iI")       # status, display_count; DISPLAY_INFO entries follow
+DISPLAY_INFO = struct.Struct("<IIIII")        # display_id, width, height, refresh_mhz, flags
+DISPLAY_OPEN_RPL = struct.Struct("<iII")      # status, display_handle, active_display_id
+SURFACE_CREATE_RPL = struct.Struct("<iIII")   # status, surface_id, stride_bytes, bytes_total
+SURFACE_DESTROY_RPL = struct.Struct("<iI")    # status, surface_id
+SURFACE_PRESENT_RPL = struct.Struct("<iIQ")   # status, surface_id, cookie
+SURFACE_PRESENTED_EVT = struct.Struct("<IIQ") # surface_id, reserved, cookie
+ERROR_RPL = struct.Struct("<III")             # err_code, err_detail, err_offset
+_STATUS = struct.Struct("<i")                 # leading status of every other reply
+
+# Kernel limits (from drawfs.h)
+DRAWFS_MAX_FRAME_BYTES = 1024 * 1024
+DRAWFS_MAX_EVENT_BYTES = 64 * 1024
+DRAWFS_MAX_EVQ_BYTES = 8 * 1024          # default hw.drawfs.max_evq_bytes
+DRAWFS_MAX_SURFACES = 64                 # default hw.drawfs.max_surfaces
+DRAWFS_MAX_SESSION_SURFACE_BYTES = 256 * 1024 * 1024   # default hw.drawfs.max_session_surface_bytes
+
+# The kernel hands back exactly one queued frame per read(2) and truncates
+# it if the buffer is short, so every read asks for the largest possible one.
+READ_SIZE = DRAWFS_MAX_EVENT_BYTES
+
 
 def align4(n: int) -> int:
     """Align value to 4-byte boundary."""
     return (n + 3) & ~3
 
 
+# =============================================================================
+# Payload Codecs
+# =============================================================================
+
+MSG_NAMES = {
+    REQ_HELLO: "REQ_HELLO",
+    REQ_DISPLAY_LIST: "REQ_DISPLAY_LIST",
+    REQ_DISPLAY_OPEN: "REQ_DISPLAY_OPEN",
+    REQ_SURFACE_CREATE: "REQ_SURFACE_CREATE",
+    REQ_SURFACE_DESTROY: "REQ_SURFACE_DESTROY",
+    REQ_SURFACE_PRESENT: "REQ_SURFACE_PRESENT",
+    RPL_OK: "RPL_OK",
+    RPL_HELLO: "RPL_HELLO",
+    RPL_DISPLAY_LIST: "RPL_DISPLAY_LIST",
+    RPL_DISPLAY_OPEN: "RPL_DISPLAY_OPEN",
+    RPL_SURFACE_CREATE: "RPL_SURFACE_CREATE",
+    RPL_SURFACE_DESTROY: "RPL_SURFACE_DESTROY",
+    RPL_SURFACE_PRESENT: "RPL_SURFACE_PRESENT",
+    RPL_ERROR: "RPL_ERROR",
+    EVT_SURFACE_PRESENTED: "EVT_SURFACE_PRESENTED",
+}
+
+ERROR_NAMES = {
+    ERR_OK: "OK",
+    ERR_INVALID_FRAME: "INVALID_FRAME",
+    ERR_INVALID_MSG: "INVALID_MSG",
+    ERR_UNSUPPORTED_VERSION: "UNSUPPORTED_VERSION",
+    ERR_UNSUPPORTED_CAP: "UNSUPPORTED_CAP",
+    ERR_PERMISSION: "PERMISSION",
+    ERR_NOT_FOUND: "NOT_FOUND",
+    ERR_BUSY: "BUSY",
+    ERR_NO_MEMORY: "NO_MEMORY",
+    ERR_INVALID_HANDLE: "INVALID_HANDLE",
+    ERR_INVALID_STATE: "INVALID_STATE",
+    ERR_INVALID_ARG: "INVALID_ARG",
+    ERR_OVERFLOW: "OVERFLOW",
+    ERR_IO: "IO",
+    ERR_INTERNAL: "INTERNAL",
+}
+
+FORMAT_NAMES = {
+    FMT_XRGB8888: "XRGB8888",
+}
+
+
+class PayloadCodec:
+    """
+    One message type's payload: a precompiled Struct, its field names and a
+    formatter that turns the unpacked values into description lines (the
+    ones drawfs_dump.py prints).  Look codecs up in CODECS by msg_type.
+    """
+
+    __slots__ = ("msg_type", "name", "layout", "fields", "formatter", "size", "_unpack_from")
+
+    def __init__(self, msg_type: int, layout: struct.Struct, fields: Tuple[str, ...],
+                 formatter: Callable[[tuple, Any], List[str]]):
+        self.msg_type = msg_type
+        self.name = MSG_NAMES[msg_type]
+        self.layout = layout
+        self.fields = fields
+        self.formatter = formatter
+        self.size = layout.size
+        self._unpack_from = layout.unpack_from
+
+    def decode(self, payload, offset: int = 0) -> Optional[tuple]:
+        """Unpack the fixed part of payload, or None if it is too short."""
+        if len(payload) - offset < self.size:
+            return None
+        return self._unpack_from(payload, offset)
+
+    def as_dict(self, payload) -> Optional[Dict[str, int]]:
+        values = self.decode(payload)
+        return None if values is None else dict(zip(self.fields, values))
+
+    def encode(self, *values) -> bytes:
+        return self.layout.pack(*values)
+
+    def format(self, payload) -> List[str]:
+        """Description lines for payload; empty if it is too short to decode."""
+        if len(payload) < self.size:
+            return []
+        return self.formatter(self._unpack_from(payload, 0), payload)
+
+
+def _status(status: int) -> str:
+    return f"status: {status} ({os.strerror(status) if status else 'OK'})"
+
+
+def _fmt_display_list(v, payload) -> List[str]:
+    lines = [_status(v[0]), f"display_count: {v[1]}"]
+    off = DISPLAY_LIST_RPL.size
+    for i in range(v[1]):
+        if off + DISPLAY_INFO.size > len(payload):
+            break
+        did, w, h, refresh, flags = DISPLAY_INFO.unpack_from(payload, off)
+        lines.append(f"  display[{i}]: id={did} {w}x{h} @ {refresh/1000:.1f}Hz flags=0x{flags:x}")
+        off += DISPLAY_INFO.size
+    return lines
+
+
+CODECS: Dict[int, PayloadCodec] = {c.msg_type: c for c in (
+    PayloadCodec(REQ_HELLO, HELLO_REQ,
+                 ("client_major", "client_minor", "flags", "max_reply_bytes"),
+                 lambda v, p: [f"client_version: {v[0]}.{v[1]}", f"flags: 0x{v[2]:08x}",
+                               f"max_reply_bytes: {v[3]}"]),
+    PayloadCodec(RPL_HELLO, HELLO_RPL,
+                 ("status", "server_major", "server_minor", "flags", "max_reply_bytes"),
+                 lambda v, p: [_status(v[0]), f"server_version: {v[1]}.{v[2]}",
+                               f"flags: 0x{v[3]:08x}", f"max_reply_bytes: {v[4]}"]),
+    PayloadCodec(REQ_DISPLAY_OPEN, DISPLAY_OPEN_REQ, ("display_id",),
+                 lambda v, p: [f"display_id: {v[0]}"]),
+    PayloadCodec(RPL_DISPLAY_LIST, DISPLAY_LIST_RPL, ("status", "display_count"),
+                 _fmt_display_list),
+    PayloadCodec(RPL_DISPLAY_OPEN, DISPLAY_OPEN_RPL,
+                 ("status", "display_handle", "active_display_id"),
+                 lambda v, p: [_status(v[0]), f"display_handle: {v[1]}",
+                               f"active_display_id: {v[2]}"]),
+    PayloadCodec(REQ_SURFACE_CREATE, SURFACE_CREATE_REQ, ("width", "height", "format", "flags"),
+                 lambda v, p: [f"size: {v[0]}x{v[1]}",
+                               f"format: {FORMAT_NAMES.get(v[2], f'unknown({v[2]})')}",
+                               f"flags: 0x{v[3]:08x}"]),
+    PayloadCodec(RPL_SURFACE_CREATE, SURFACE_CREATE_RPL,
+                 ("status", "surface_id", "stride_bytes", "bytes_total"),
+                 lambda v, p: [_status(v[0]), f"surface_id: {v[1]}", f"stride_bytes: {v[2]}",
+                               f"bytes_total: {v[3]}"]),
+    PayloadCodec(REQ_SURFACE_DESTROY, SURFACE_DESTROY_REQ, ("surface_id",),
+                 lambda v, p: [f"surface_id: {v[0]}"]),
+    PayloadCodec(RPL_SURFACE_DESTROY, SURFACE_DESTROY_RPL, ("status", "surface_id"),
+                 lambda v, p: [_status(v[0]), f"surface_id: {v[1]}"]),
+    PayloadCodec(REQ_SURFACE_PRESENT, SURFACE_PRESENT_REQ, ("surface_id", "flags", "cookie"),
+                 lambda v, p: [f"surface_id: {v[0]}", f"cookie: 0x{v[2]:016x}"]),
+    PayloadCodec(RPL_SURFACE_PRESENT, SURFACE_PRESENT_RPL, ("status", "surface_id", "cookie"),
+                 lambda v, p: [_status(v[0]), f"surface_id: {v[1]}", f"cookie: 0x{v[2]:016x}"]),
+    PayloadCodec(EVT_SURFACE_PRESENTED, SURFACE_PRESENTED_EVT,
+                 ("surface_id", "reserved", "cookie"),
+                 lambda v, p: [f"surface_id: {v[0]}", f"cookie: 0x{v[2]:016x}"]),
+    PayloadCodec(RPL_ERROR, ERROR_RPL, ("err_code", "err_detail", "err_offset"),
+                 lambda v, p: [f"err_code: {v[0]} ({ERROR_NAMES.get(v[0], f'unknown({v[0]})')})",
+                               f"err_detail: {v[1]}", f"err_offset: {v[2]}"]),
+)}
+
+
 # =============================================================================
 # Frame/Message Building
 # =============================================================================
@@ -92,6 +296,198 @@ def make_frame(frame_id: int, msgs: List[bytes]) -> bytes:
     return frame
 
 
+_ZERO_PAD = bytes(4)
+_msg_layouts: Dict[struct.Struct, Tuple[struct.Struct, int]] = {}
+
+
+def _compile_msg_layout(layout: struct.Struct) -> Tuple[struct.Struct, int]:
+    """Fuse the message header, a payload layout and its padding into one Struct."""
+    msg_bytes = align4(MH_SIZE + layout.size)
+    pad = msg_bytes - MH_SIZE - layout.size
+    combined = struct.Struct(MH_FMT + layout.format.lstrip("<") + "x" * pad)
+    entry = _msg_layouts[layout] = (combined, msg_bytes)
+    return entry
+
+
+_create_msg_pack_into = _compile_msg_layout(SURFACE_CREATE_REQ)[0].pack_into
+_destroy_msg_pack_into = _compile_msg_layout(SURFACE_DESTROY_REQ)[0].pack_into
+_present_msg_pack_into = _compile_msg_layout(SURFACE_PRESENT_REQ)[0].pack_into
+_CREATE_MSG_BYTES = _msg_layouts[SURFACE_CREATE_REQ][1]
+_DESTROY_MSG_BYTES = _msg_layouts[SURFACE_DESTROY_REQ][1]
+_PRESENT_MSG_BYTES = _msg_layouts[SURFACE_PRESENT_REQ][1]
+
+
+class FrameBuilder:
+    """
+    Reusable frame encoder that packs headers and payloads in place.
+
+    Messages are packed straight into one preallocated bytearray using
+    precompiled structs; frame_bytes is patched into the frame header by
+    finish(), which returns a memoryview suitable for os.write().  The
+    returned view is only valid until the next begin().  next_frame()
+    closes the current frame and starts another right behind it, so one
+    write can carry several frames.
+
+    Usage:
+        fb = FrameBuilder()
+        fb.begin(frame_id)
+        for i, sid in enumerate(surfaces):
+            fb.add_surface_present(first_msg_id + i, sid, cookie)
+        fb.write(fd)
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self._buf = bytearray(align4(max(capacity, FH_SIZE)))
+        self._view = memoryview(self._buf)
+        self._len = FH_SIZE
+        self._frame_start = 0
+        self._frame_id = 0
+        self.msg_count = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def frame_len(self) -> int:
+        """Bytes in the frame currently being built, header included."""
+        return self._len - self._frame_start
+
+    def _reserve(self, n: int) -> None:
+        need = self._len + n
+        if need <= len(self._buf):
+            return
+        cap = len(self._buf)
+        while cap < need:
+            cap *= 2
+        # Allocate a new buffer rather than resizing so that views handed
+        # out by an earlier finish() stay valid.
+        buf = bytearray(cap)
+        buf[:self._len] = self._view[:self._len]
+        self._buf = buf
+        self._view = memoryview(buf)
+
+    def begin(self, frame_id: int) -> 'FrameBuilder':
+        """Start a new frame, discarding any previous contents."""
+        self._len = FH_SIZE
+        self._frame_start = 0
+        self._frame_id = frame_id
+        self.msg_count = 0
+        return self
+
+    def next_frame(self, frame_id: int) -> None:
+        """Close the current frame and start another one after it."""
+        self._patch_header()
+        self._reserve(FH_SIZE)
+        self._frame_start = self._len
+        self._len += FH_SIZE
+        self._frame_id = frame_id
+
+    def _patch_header(self) -> None:
+        FH_STRUCT.pack_into(self._buf, self._frame_start, DRAWFS_MAGIC, DRAWFS_VERSION,
+                            FH_SIZE, self._len - self._frame_start, self._frame_id)
+
+    def add_msg(self, msg_type: int, msg_id: int, payload: bytes = b"", msg_flags: int = 0) -> None:
+        """Append a message with an already-encoded payload."""
+        plen = len(payload)
+        msg_bytes = align4(MH_SIZE + plen)
+        self._reserve(msg_bytes)
+        off = self._len
+        end = off + msg_bytes
+        MH_STRUCT.pack_into(self._buf, off, msg_type, msg_flags, msg_bytes, msg_id, 0)
+        pos = off + MH_SIZE
+        if plen:
+            self._view[pos:pos + plen] = payload
+            pos += plen
+        if pos < end:
+            self._view[pos:end] = _ZERO_PAD[:end - pos]
+        self._len = end
+        self.msg_count += 1
+
+    def add_packed(self, msg_type: int, msg_id: int, layout: struct.Struct, *values) -> None:
+        """Append a message whose payload is packed in place from layout and values."""
+        entry = _msg_layouts.get(layout)
+        if entry is None:
+            entry = _compile_msg_layout(layout)
+        combined, msg_bytes = entry
+        off = self._len
+        end = off + msg_bytes
+        if end > len(self._buf):
+            self._reserve(msg_bytes)
+        combined.pack_into(self._buf, off, msg_type, 0, msg_bytes, msg_id, 0, *values)
+        self._len = end
+        self.msg_count += 1
+
+    def add(self, msg_type: int, msg_id: int, *values) -> None:
+        """Append a message whose payload layout comes from CODECS[msg_type]."""
+        self.add_packed(msg_type, msg_id, CODECS[msg_type].layout, *values)
+
+    def add_surface_create(self, msg_id: int, width: int, height: int,
+                           fmt: int = FMT_XRGB8888, flags: int = 0) -> None:
+        """Append a SURFACE_CREATE request (fused header+payload pack)."""
+        off = self._len
+        end = off + _CREATE_MSG_BYTES
+        if end > len(self._buf):
+            self._reserve(_CREATE_MSG_BYTES)
+        _create_msg_pack_into(self._buf, off, REQ_SURFACE_CREATE, 0, _CREATE_MSG_BYTES,
+                              msg_id, 0, width, height, fmt, flags)
+        self._len = end
+        self.msg_count += 1
+
+    def add_surface_destroy(self, msg_id: int, surface_id: int) -> None:
+        """Append a SURFACE_DESTROY request (fused header+payload pack)."""
+        off = self._len
+        end = off + _DESTROY_MSG_BYTES
+        if end > len(self._buf):
+            self._reserve(_DESTROY_MSG_BYTES)
+        _destroy_msg_pack_into(self._buf, off, REQ_SURFACE_DESTROY, 0, _DESTROY_MSG_BYTES,
+                               msg_id, 0, surface_id)
+        self._len = end
+        self.msg_count += 1
+
+    def add_surface_present(self, msg_id: int, surface_id: int, cookie: int = 0, flags: int = 0) -> None:
+        """Append a SURFACE_PRESENT request (fused header+payload pack)."""
+        off = self._len
+        end = off + _PRESENT_MSG_BYTES
+        if end > len(self._buf):
+            self._reserve(_PRESENT_MSG_BYTES)
+        _present_msg_pack_into(self._buf, off, REQ_SURFACE_PRESENT, 0, _PRESENT_MSG_BYTES,
+                               msg_id, 0, surface_id, flags, cookie)
+        self._len = end
+        self.msg_count += 1
+
+    def finish(self) -> memoryview:
+        """Patch the frame header and return a view of the encoded frame(s)."""
+        self._patch_header()
+        return self._view[:self._len]
+
+    def write(self, fd: int, recorder=None) -> int:
+        """Finish the frame and write it to fd. Returns bytes written."""
+        data = self.finish()
+        n = os.write(fd, data)
+        if recorder is not None:
+            recorder.outbound(data)
+        return n
+
+
+_local = threading.local()
+
+
+def _builder() -> FrameBuilder:
+    """Return this thread's FrameBuilder for the request helpers."""
+    fb = getattr(_local, "builder", None)
+    if fb is None:
+        fb = _local.builder = FrameBuilder()
+    return fb
+
+
+def send_packed(fd: int, frame_id: int, msg_type: int, msg_id: int, layout: struct.Struct, *values,
+                recorder=None) -> None:
+    """Encode a single-message frame in place and write it to fd."""
+    fb = _builder().begin(frame_id)
+    fb.add_packed(msg_type, msg_id, layout, *values)
+    fb.write(fd, recorder)
+
+
 # =============================================================================
 # Frame/Message Parsing
 # =============================================================================
@@ -122,54 +518,339 @@ def parse_first_msg(frame: bytes) -> Tuple[int, int, bytes]:
     return msg_type, msg_id, payload
 
 
+class FrameError(ValueError):
+    """A frame or message failed validation; mirrors drawfs_frame_validate()."""
+
+    def __init__(self, err_code: int, err_offset: int, message: str):
+        super().__init__(message)
+        self.err_code = err_code
+        self.err_offset = err_offset
+
+
+_fh_unpack_from = FH_STRUCT.unpack_from
+_mh_unpack_from = MH_STRUCT.unpack_from
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for the kernel-to-client byte stream.
+
+    Bytes are appended with feed() or read straight into the buffer with
+    readfrom(); complete messages are then pulled with next_msg() (or by
+    iterating the decoder) as (frame_hdr, msg_hdr, payload) tuples, where
+    payload is a memoryview into the decoder's buffer.  Partial frames are
+    kept across chunks and the buffer is compacted in place, so views
+    handed out are only valid until the next feed()/readfrom().
+
+    Usage:
+        dec = FrameDecoder()
+        dec.feed(chunk)
+        for frame_hdr, msg_hdr, payload in dec:
+            ...
+
+    When recorder is set (see drawfs_capture.TrafficRecorder), every
+    complete frame is passed to recorder.inbound() as it is reached, and
+    the request helpers that take this decoder pass the frames they write
+    to recorder.outbound().
+    """
+
+    def __init__(self, capacity: int = 2 * READ_SIZE):
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._head = 0           # first byte not yet handed out
+        self._end = 0            # end of buffered data
+        self._frame_start = 0    # frame currently being walked
+        self._frame_end = 0
+        self._frame_hdr: Optional[Tuple[int, int, int, int, int]] = None
+        self.frames = 0
+        self.messages = 0
+        self.recorder = None
+        self.eof = False         # readall() saw end of stream
+
+    def __len__(self) -> int:
+        """Number of buffered bytes not yet handed out."""
+        return self._end - self._head
+
+    def __iter__(self):
+        while True:
+            msg = self.next_msg()
+            if msg is None:
+                return
+            yield msg
+
+    def reset(self) -> None:
+        """Discard all buffered bytes."""
+        self._head = self._end = 0
+        self._frame_start = self._frame_end = 0
+        self._frame_hdr = None
+        self.eof = False
+
+    def _make_room(self, n: int) -> None:
+        if self._end + n <= len(self._buf):
+            return
+        # Keep the frame being walked intact so current_frame stays whole.
+        keep = self._frame_start if self._head < self._frame_end else self._head
+        used = self._end - keep
+        if used + n > len(self._buf):
+            cap = len(self._buf)
+            while cap < used + n:
+                cap *= 2
+            buf = bytearray(cap)
+            buf[:used] = self._view[keep:self._end]
+            self._buf = buf
+            self._view = memoryview(buf)
+        elif keep:
+            self._view[:used] = self._view[keep:self._end]
+        self._head -= keep
+        self._end -= keep
+        self._frame_start = max(self._frame_start - keep, 0)
+        self._frame_end = max(self._frame_end - keep, 0)
+
+    def feed(self, data) -> None:
+        """Append a chunk of bytes from the stream."""
+        n = len(data)
+        self._make_room(n)
+        self._view[self._end:self._end + n] = data
+        self._end += n
+
+    def readfrom(self, fd: int, size: int = READ_SIZE) -> int:
+        """Read once from fd directly into the buffer. Returns bytes read."""
+        self._make_room(size)
+        n = os.readv(fd, [self._view[self._end:self._end + size]])
+        self._end += n
+        return n
+
+    def readall(self, fd: int, max_reads: int = 4096, size: int = READ_SIZE) -> int:
+        """
+        Read from a non-blocking fd until it reports EWOULDBLOCK (or EOF, or
+        max_reads reads), appending everything to the buffer.  drawfs_read()
+        returns one frame per call, so this empties the session's queue in
+        one pass.  Returns the number of reads that returned data; eof is
+        set if the fd reported end of stream.
+        """
+        reads = 0
+        while reads < max_reads:
+            self._make_room(size)
+            try:
+                n = os.readv(fd, [self._view[self._end:self._end + size]])
+            except BlockingIOError:
+                break
+            if n == 0:
+                self.eof = True
+                break
+            self._end += n
+            reads += 1
+        return reads
+
+    def _start_frame(self) -> bool:
+        """Validate the next buffered frame header. False if more bytes are needed."""
+        head = self._head
+        avail = self._end - head
+        if avail < FH_SIZE:
+            return False
+
+        fh = _fh_unpack_from(self._buf, head)
+        magic, version, header_bytes, frame_bytes, _ = fh
+        err = None
+        if magic != DRAWFS_MAGIC:
+            err = (ERR_INVALID_FRAME, 0, f"bad magic 0x{magic:08x}")
+        elif version != DRAWFS_VERSION:
+            err = (ERR_UNSUPPORTED_VERSION, 4, f"unsupported version 0x{version:04x}")
+        elif header_bytes != FH_SIZE:
+            err = (ERR_INVALID_FRAME, 6, f"header_bytes {header_bytes} != {FH_SIZE}")
+        elif frame_bytes < header_bytes or frame_bytes > DRAWFS_MAX_FRAME_BYTES:
+            err = (ERR_INVALID_FRAME, 8, f"frame_bytes {frame_bytes} out of range")
+        elif frame_bytes & 3:
+            err = (ERR_INVALID_FRAME, 8, f"frame_bytes {frame_bytes} not 4-byte aligned")
+        if err is not None:
+            # Like the kernel, drop everything buffered: there is no way to
+            # find the next frame boundary once a header is corrupt.
+            self.reset()
+            raise FrameError(*err)
+
+        if frame_bytes > avail:
+            return False
+
+        self._frame_hdr = fh
+        self._frame_start = head
+        self._frame_end = head + frame_bytes
+        self._head = head + header_bytes
+        self.frames += 1
+        if self.recorder is not None:
+            self.recorder.inbound(self._view[head:head + frame_bytes])
+        return True
+
+    def next_msg(self):
+        """
+        Return the next complete (frame_hdr, msg_hdr, payload) or None.
+        Raises FrameError for a malformed frame or message.
+        """
+        while True:
+            pos = self._head
+            frame_end = self._frame_end
+            if pos < frame_end:
+                if pos + MH_SIZE > frame_end:
+                    # Trailing padding shorter than a header ends the frame.
+                    self._head = frame_end
+                    continue
+                mh = _mh_unpack_from(self._buf, pos)
+                msg_end = pos + mh[2]
+                if mh[2] < MH_SIZE or msg_end > frame_end:
+                    self._head = frame_end
+                    raise FrameError(ERR_INVALID_MSG, pos - self._frame_start,
+                                     f"msg_bytes {mh[2]} invalid at offset {pos - self._frame_start}")
+                self._head = (msg_end + 3) & ~3
+                self.messages += 1
+                return self._frame_hdr, mh, self._view[pos + MH_SIZE:msg_end]
+            if not self._start_frame():
+                return None
+
+    def next_frame(self):
+        """
+        Return the next complete (frame_hdr, frame) or None, consuming all of
+        its messages.  If a frame is partly walked by next_msg(), that frame
+        is returned.
+        """
+        if self._head >= self._frame_end and not self._start_frame():
+            return None
+        self._head = self._frame_end
+        return self._frame_hdr, self.current_frame
+
+    @property
+    def current_frame(self) -> memoryview:
+        """The frame that the last returned message belongs to."""
+        return self._view[self._frame_start:self._frame_end]
+
+
 # =============================================================================
 # Read Utilities
 # =============================================================================
 
-def read_frame(fd: int, timeout_ms: int = 2000) -> bytes:
-    """Read one frame from fd, using select to avoid indefinite blocking."""
-    deadline_s = timeout_ms / 1000.0
-    readable, _, _ = select.select([fd], [], [], deadline_s)
-    if fd not in readable:
+if hasattr(select, "poll"):
+    def _wait_readable(fd: int, timeout_s: float) -> bool:
+        # poll() has no FD_SETSIZE limit, so this works for fd >= 1024.
+        p = select.poll()
+        p.register(fd, select.POLLIN)
+        return bool(p.poll(max(timeout_s, 0.0) * 1000.0))
+else:
+    def _wait_readable(fd: int, timeout_s: float) -> bool:
+        readable, _, _ = select.select([fd], [], [], timeout_s)
+        return fd in readable
+
+
+def _read_decoded(fd: int, decoder: FrameDecoder, timeout_ms: int, take):
+    """Return take() from decoder, reading from fd until it yields or the timeout hits."""
+    item = take()
+    if item is not None:
+        return item
+    deadline = time.monotonic() + timeout_ms / 1000.0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not _wait_readable(fd, remaining):
+            raise TimeoutError(f"Timeout waiting for frame ({timeout_ms}ms)")
+        if decoder.readfrom(fd) == 0:
+            raise EOFError("End of stream while waiting for frame")
+        item = take()
+        if item is not None:
+            return item
+
+
+def read_frame(fd: int, timeout_ms: int = 2000, decoder: Optional[FrameDecoder] = None) -> bytes:
+    """
+    Read one frame from fd, using select to avoid indefinite blocking.
+    With a decoder, frames already buffered by earlier reads come first.
+    """
+    if decoder is not None:
+        _, frame = _read_decoded(fd, decoder, timeout_ms, decoder.next_frame)
+        return bytes(frame)
+    if not _wait_readable(fd, timeout_ms / 1000.0):
         raise TimeoutError(f"Timeout waiting for frame ({timeout_ms}ms)")
-    return os.read(fd, 4096)
+    return os.read(fd, READ_SIZE)
 
 
-def read_msg(fd: int, timeout_ms: int = 2000) -> Tuple[int, int, bytes]:
-    """Read one frame and parse the first message, returns (msg_type, msg_id, payload)."""
-    frame = read_frame(fd, timeout_ms)
-    return parse_first_msg(frame)
+def read_msg(fd: int, timeout_ms: int = 2000, decoder: Optional[FrameDecoder] = None) -> Tuple[int, int, bytes]:
+    """
+    Read the next message, returns (msg_type, msg_id, payload).
+    Pass the session's decoder so that later messages of a multi-message
+    frame are returned by later calls instead of being lost.
+    """
+    if decoder is None:
+        decoder = FrameDecoder(READ_SIZE)
+    _, mh, payload = _read_decoded(fd, decoder, timeout_ms, decoder.next_msg)
+    return mh[0], mh[3], bytes(payload)
 
 
-def drain_until(fd: int, msg_type: int, timeout_ms: int = 2000, max_msgs: int = 20) -> Tuple[int, bytes]:
+def drain_until(fd: int, msg_type: int, timeout_ms: int = 2000, max_msgs: int = 20,
+                decoder: Optional[FrameDecoder] = None) -> Tuple[int, bytes]:
     """
     Read messages until we find one with the given msg_type.
     Returns (msg_id, payload) of the matching message.
-    Raises if not found within max_msgs reads.
+    Raises if not found within max_msgs messages.
     """
+    if decoder is None:
+        decoder = FrameDecoder(READ_SIZE)
     for _ in range(max_msgs):
-        mt, mid, payload = read_msg(fd, timeout_ms)
-        if mt == msg_type:
-            return mid, payload
+        _, mh, payload = _read_decoded(fd, decoder, timeout_ms, decoder.next_msg)
+        if mh[0] == msg_type:
+            return mh[3], bytes(payload)
     raise RuntimeError(f"Did not find msg_type 0x{msg_type:04x} within {max_msgs} messages")
 
 
-def drain_all(fd: int, max_msgs: int = 500, timeout_s: float = 5.0) -> int:
+def read_available(fd: int, decoder: FrameDecoder, timeout_ms: int = 0,
+                   max_reads: int = 4096) -> int:
+    """
+    Wait up to timeout_ms for fd to become readable, then read every queued
+    frame into decoder without further selects: the fd is switched to
+    O_NONBLOCK for the burst and read until EWOULDBLOCK.  Returns the number
+    of reads that returned data (0 on timeout).
     """
-    Drain all available messages from fd using select.
+    if not _wait_readable(fd, timeout_ms / 1000.0):
+        return 0
+    blocking = os.get_blocking(fd)
+    if blocking:
+        os.set_blocking(fd, False)
+    try:
+        return decoder.readall(fd, max_reads)
+    finally:
+        if blocking:
+            os.set_blocking(fd, True)
+
+
+def drain_batch(fd: int, timeout_ms: int = 0, decoder: Optional[FrameDecoder] = None,
+                max_reads: int = 4096) -> List[Tuple[int, int, bytes]]:
+    """
+    Read everything the kernel has queued with one select and return it as
+    a list of (msg_type, msg_id, payload).  Messages already buffered in
+    decoder come first.
+    """
+    if decoder is None:
+        decoder = FrameDecoder()
+    if len(decoder) == 0:
+        read_available(fd, decoder, timeout_ms, max_reads)
+    else:
+        read_available(fd, decoder, 0, max_reads)
+    return [(mh[0], mh[3], bytes(payload)) for _, mh, payload in decoder]
+
+
+def drain_all(fd: int, max_msgs: int = 500, timeout_s: float = 5.0,
+              decoder: Optional[FrameDecoder] = None) -> int:
+    """
+    Drain all available messages from fd, one select per burst.
     Returns count of messages drained.
     """
-    import time
+    if decoder is None:
+        decoder = FrameDecoder(READ_SIZE)
     drained = 0
-    start = time.time()
-    while drained < max_msgs and (time.time() - start) < timeout_s:
-        readable, _, _ = select.select([fd], [], [], 0.1)
-        if fd not in readable:
-            break
-        data = os.read(fd, 4096)
-        if not data:
+    start = time.monotonic()
+    while drained < max_msgs and (time.monotonic() - start) < timeout_s:
+        try:
+            if decoder.next_msg() is not None:
+                drained += 1
+                continue
+        except FrameError:
+            continue
+        if read_available(fd, decoder, 100) == 0:
             break
-        drained += 1
     return drained
 
 
@@ -177,30 +858,41 @@ def drain_all(fd: int, max_msgs: int = 500, timeout_s: float = 5.0) -> int:
 # Common Protocol Operations
 # =============================================================================
 
-def send(fd: int, frame: bytes) -> None:
+def _recorder(decoder: Optional[FrameDecoder]):
+    return None if decoder is None else decoder.recorder
+
+
+def send(fd: int, frame: bytes, recorder=None) -> None:
     """Write a frame to fd."""
     os.write(fd, frame)
+    if recorder is not None:
+        recorder.outbound(frame)
 
 
-def hello(fd: int, frame_id: int = 1, msg_id: int = 1) -> bytes:
-    """Send HELLO and read reply. Returns reply payload."""
-    payload = struct.pack("<HHII", 1, 0, 0, 65536)  # client_major, minor, flags, max_reply
-    send(fd, make_frame(frame_id, [make_msg(REQ_HELLO, msg_id, payload)]))
-    return read_frame(fd)
+def hello(fd: int, frame_id: int = 1, msg_id: int = 1,
+          decoder: Optional[FrameDecoder] = None) -> bytes:
+    """Send HELLO and read reply. Returns the reply frame."""
+    send_packed(fd, frame_id, REQ_HELLO, msg_id, HELLO_REQ, 1, 0, 0, 65536,
+                recorder=_recorder(decoder))
+    return read_frame(fd, decoder=decoder)
 
 
-def display_list(fd: int, frame_id: int = 2, msg_id: int = 2) -> Tuple[int, bytes]:
+def display_list(fd: int, frame_id: int = 2, msg_id: int = 2,
+                 decoder: Optional[FrameDecoder] = None) -> Tuple[int, bytes]:
     """Send DISPLAY_LIST and read reply. Returns (msg_type, payload)."""
-    send(fd, make_frame(frame_id, [make_msg(REQ_DISPLAY_LIST, msg_id, b"")]))
-    mt, mid, payload = read_msg(fd)
+    fb = _builder().begin(frame_id)
+    fb.add_msg(REQ_DISPLAY_LIST, msg_id)
+    fb.write(fd, _recorder(decoder))
+    mt, mid, payload = read_msg(fd, decoder=decoder)
     return mt, payload
 
 
-def display_open(fd: int, display_id: int = 1, frame_id: int = 3, msg_id: int = 3) -> Tuple[int, bytes]:
+def display_open(fd: int, display_id: int = 1, frame_id: int = 3, msg_id: int = 3,
+                 decoder: Optional[FrameDecoder] = None) -> Tuple[int, bytes]:
     """Send DISPLAY_OPEN and read reply. Returns (msg_type, payload)."""
-    payload = struct.pack("<I", display_id)
-    send(fd, make_frame(frame_id, [make_msg(REQ_DISPLAY_OPEN, msg_id, payload)]))
-    mt, mid, payload = read_msg(fd)
+    send_packed(fd, frame_id, REQ_DISPLAY_OPEN, msg_id, DISPLAY_OPEN_REQ, display_id,
+                recorder=_recorder(decoder))
+    mt, mid, payload = read_msg(fd, decoder=decoder)
     return mt, payload
 
 
@@ -212,26 +904,28 @@ def surface_create(
     flags: int = 0,
     frame_id: int = 4,
     msg_id: int = 4,
-    skip_events: bool = False
+    skip_events: bool = False,
+    decoder: Optional[FrameDecoder] = None
 ) -> Tuple[int, int, int, int]:
     """
     Send SURFACE_CREATE and read reply.
     Returns (status, surface_id, stride, total_bytes).
     If skip_events=True, uses drain_until to skip any pending events.
     """
-    payload = struct.pack("<IIII", width, height, fmt, flags)
-    send(fd, make_frame(frame_id, [make_msg(REQ_SURFACE_CREATE, msg_id, payload)]))
+    fb = _builder().begin(frame_id)
+    fb.add_surface_create(msg_id, width, height, fmt, flags)
+    fb.write(fd, _recorder(decoder))
     if skip_events:
-        _, reply_payload = drain_until(fd, RPL_SURFACE_CREATE)
+        _, reply_payload = drain_until(fd, RPL_SURFACE_CREATE, decoder=decoder)
     else:
-        mt, mid, reply_payload = read_msg(fd)
+        mt, mid, reply_payload = read_msg(fd, decoder=decoder)
         if mt == RPL_ERROR:
             # Parse error: err_code, err_detail, err_offset
-            err_code, _, _ = struct.unpack_from("<III", reply_payload, 0)
+            err_code, _, _ = ERROR_RPL.unpack_from(reply_payload, 0)
             return err_code, 0, 0, 0
         if mt != RPL_SURFACE_CREATE:
             raise RuntimeError(f"Expected SURFACE_CREATE reply, got 0x{mt:04x}")
-    status, sid, stride, total = struct.unpack_from("<iIII", reply_payload, 0)
+    status, sid, stride, total = SURFACE_CREATE_RPL.unpack_from(reply_payload, 0)
     return status, sid, stride, total
 
 
@@ -240,25 +934,27 @@ def surface_destroy(
     surface_id: int,
     frame_id: int = 5,
     msg_id: int = 5,
-    skip_events: bool = False
+    skip_events: bool = False,
+    decoder: Optional[FrameDecoder] = None
 ) -> int:
     """
     Send SURFACE_DESTROY and read reply.
     Returns status.
     If skip_events=True, uses drain_until to skip any pending events.
     """
-    payload = struct.pack("<I", surface_id)
-    send(fd, make_frame(frame_id, [make_msg(REQ_SURFACE_DESTROY, msg_id, payload)]))
+    fb = _builder().begin(frame_id)
+    fb.add_surface_destroy(msg_id, surface_id)
+    fb.write(fd, _recorder(decoder))
     if skip_events:
-        _, reply_payload = drain_until(fd, RPL_SURFACE_DESTROY)
+        _, reply_payload = drain_until(fd, RPL_SURFACE_DESTROY, decoder=decoder)
     else:
-        mt, mid, reply_payload = read_msg(fd)
+        mt, mid, reply_payload = read_msg(fd, decoder=decoder)
         if mt == RPL_ERROR:
-            err_code, _, _ = struct.unpack_from("<III", reply_payload, 0)
+            err_code, _, _ = ERROR_RPL.unpack_from(reply_payload, 0)
             return err_code
         if mt != RPL_SURFACE_DESTROY:
             raise RuntimeError(f"Expected SURFACE_DESTROY reply, got 0x{mt:04x}")
-    status, = struct.unpack_from("<i", reply_payload, 0)
+    status, _ = SURFACE_DESTROY_RPL.unpack_from(reply_payload, 0)
     return status
 
 
@@ -268,37 +964,40 @@ def surface_present(
     cookie: int = 0,
     frame_id: int = 6,
     msg_id: int = 6,
-    skip_events: bool = False
+    skip_events: bool = False,
+    decoder: Optional[FrameDecoder] = None
 ) -> Tuple[int, int, int]:
     """
     Send SURFACE_PRESENT and read reply (not event).
     Returns (status, surface_id, cookie) from reply.
     If skip_events=True, uses drain_until to skip any pending events.
     """
-    payload = struct.pack("<IIQ", surface_id, 0, cookie)
-    send(fd, make_frame(frame_id, [make_msg(REQ_SURFACE_PRESENT, msg_id, payload)]))
+    fb = _builder().begin(frame_id)
+    fb.add_surface_present(msg_id, surface_id, cookie)
+    fb.write(fd, _recorder(decoder))
     if skip_events:
-        _, reply_payload = drain_until(fd, RPL_SURFACE_PRESENT)
+        _, reply_payload = drain_until(fd, RPL_SURFACE_PRESENT, decoder=decoder)
     else:
-        mt, mid, reply_payload = read_msg(fd)
+        mt, mid, reply_payload = read_msg(fd, decoder=decoder)
         if mt == RPL_ERROR:
-            err_code, _, _ = struct.unpack_from("<III", reply_payload, 0)
+            err_code, _, _ = ERROR_RPL.unpack_from(reply_payload, 0)
             return err_code, surface_id, cookie
         if mt != RPL_SURFACE_PRESENT:
             raise RuntimeError(f"Expected SURFACE_PRESENT reply, got 0x{mt:04x}")
-    status, sid, cookie_out = struct.unpack_from("<iIQ", reply_payload, 0)
+    status, sid, cookie_out = SURFACE_PRESENT_RPL.unpack_from(reply_payload, 0)
     return status, sid, cookie_out
 
 
-def read_presented_event(fd: int, timeout_ms: int = 2000) -> Tuple[int, int, int]:
+def read_presented_event(fd: int, timeout_ms: int = 2000,
+                         decoder: Optional[FrameDecoder] = None) -> Tuple[int, int, int]:
     """
     Read SURFACE_PRESENTED event.
     Returns (surface_id, reserved, cookie).
     """
-    mt, mid, payload = read_msg(fd, timeout_ms)
+    mt, mid, payload = read_msg(fd, timeout_ms, decoder)
     if mt != EVT_SURFACE_PRESENTED:
         raise RuntimeError(f"Expected SURFACE_PRESENTED event, got 0x{mt:04x}")
-    sid, reserved, cookie = struct.unpack_from("<IIQ", payload, 0)
+    sid, reserved, cookie = SURFACE_PRESENTED_EVT.unpack_from(payload, 0)
     return sid, reserved, cookie
 
 
@@ -324,6 +1023,13 @@ def _iowr(group: str, num: int, size: int) -> int:
 
 # Stats ioctl: _IOR('D', 0x01, struct drawfs_stats) - 96 bytes
 STATS_SIZE = 96  # 9 uint64s + 4 uint32s + 1 uint64
+STATS_STRUCT = struct.Struct("<QQQQQQQQQIIIIQ")
+STATS_FIELDS = (
+    'frames_received', 'frames_processed', 'frames_invalid',
+    'messages_processed', 'messages_unsupported',
+    'events_enqueued', 'events_dropped', 'bytes_in', 'bytes_out',
+    'evq_depth', 'inbuf_bytes', 'evq_bytes', 'surfaces_count', 'surfaces_bytes',
+)
 DRAWFSGIOC_STATS = _ior('D', 0x01, STATS_SIZE)
 
 def get_stats(fd: int) -> Dict[str, int]:
@@ -336,23 +1042,41 @@ def get_stats(fd: int) -> Dict[str, int]:
     """
     buf = bytearray(STATS_SIZE)
     fcntl.ioctl(fd, DRAWFSGIOC_STATS, buf)
-    vals = struct.unpack("<QQQQQQQQQIIIIQ", buf)
-    return {
-        'frames_received': vals[0],
-        'frames_processed': vals[1],
-        'frames_invalid': vals[2],
-        'messages_processed': vals[3],
-        'messages_unsupported': vals[4],
-        'events_enqueued': vals[5],
-        'events_dropped': vals[6],
-        'bytes_in': vals[7],
-        'bytes_out': vals[8],
-        'evq_depth': vals[9],
-        'inbuf_bytes': vals[10],
-        'evq_bytes': vals[11],
-        'surfaces_count': vals[12],
-        'surfaces_bytes': vals[13],
-    }
+    return dict(zip(STATS_FIELDS, STATS_STRUCT.unpack(buf)))
+
+
+def read_sysctl(name: str) -> Optional[int]:
+    """Read an integer sysctl such as hw.drawfs.max_evq_bytes. None if unavailable."""
+    try:
+        result = subprocess.run(["sysctl", "-n", name], capture_output=True, text=True)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    try:
+        return int(result.stdout.strip())
+    except ValueError:
+        return None
+
+
+def read_sysctls(prefix: str = "hw.drawfs") -> Dict[str, int]:
+    """Read every integer sysctl under prefix in one sysctl(8) call. Empty if unavailable."""
+    try:
+        result = subprocess.run(["sysctl", "-e", prefix], capture_output=True, text=True)
+    except OSError:
+        return {}
+    if result.returncode != 0:
+        return {}
+    values = {}
+    for line in result.stdout.splitlines():
+        name, sep, value = line.partition("=")
+        if not sep:
+            continue
+        try:
+            values[name.strip()] = int(value.strip())
+        except ValueError:
+            pass
+    return values
 
 
 # Map surface ioctl: _IOWR('D', 0x02, struct drawfs_map_surface) - 16 bytes
@@ -371,6 +1095,344 @@ def map_surface(fd: int, surface_id: int) -> Tuple[int, int, int, int]:
     return status, sid, stride, total
 
 
+# =============================================================================
+# Surface Mappings
+# =============================================================================
+
+DEFAULT_MAX_MAPPED_BYTES = DRAWFS_MAX_SESSION_SURFACE_BYTES
+
+
+class MappedSurface:
+    """
+    A live shared mapping of one surface.
+
+    `view` is a writable memoryview over the whole surface; rows are
+    `stride` bytes apart and the first `width * 4` bytes of each row are
+    visible pixels (XRGB8888).
+    """
+
+    __slots__ = ("surface_id", "width", "height", "stride", "total", "mmap", "view")
+
+    def __init__(self, surface_id: int, stride: int, total: int, mm: mmap.mmap):
+        self.surface_id = surface_id
+        self.stride = stride
+        self.total = total
+        self.width = stride // 4
+        self.height = total // stride if stride else 0
+        self.mmap = mm
+        self.view = memoryview(mm)
+
+    def row(self, y: int) -> memoryview:
+        """The visible pixels of row y."""
+        off = y * self.stride
+        return self.view[off:off + self.width * 4]
+
+    def close(self) -> bool:
+        """Unmap. False if views handed out are still alive (retry later)."""
+        self.view.release()
+        try:
+            self.mmap.close()
+        except BufferError:
+            return False
+        return True
+
+
+class SurfaceMapper:
+    """
+    Keeps one mapping per surface_id for a session so repeated access to a
+    surface costs no ioctl, mmap or fresh page faults.
+
+    Mappings are evicted least-recently-used first once more than
+    max_bytes are mapped, and dropped when the surface is destroyed or the
+    session closes.  A mapping whose memoryviews are still referenced
+    cannot be unmapped yet; it is parked and retried on the next eviction.
+
+        surf = s.mapped(sid)
+        surf.view[:surf.width * 4] = b"\xff\x00\x00\x00" * surf.width
+    """
+
+    def __init__(self, session: 'DrawSession', max_bytes: int = DEFAULT_MAX_MAPPED_BYTES):
+        self.session = session
+        self.max_bytes = max_bytes
+        self.mapped_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._maps: "OrderedDict[int, MappedSurface]" = OrderedDict()
+        self._parked: List[MappedSurface] = []
+
+    def __len__(self) -> int:
+        return len(self._maps)
+
+    def __contains__(self, surface_id: int) -> bool:
+        return surface_id in self._maps
+
+    def _open(self, surface_id: int) -> MappedSurface:
+        fd = self.session.fd
+        status, _, stride, total = map_surface(fd, surface_id)
+        if status != 0:
+            raise OSError(status, f"MAP_SURFACE failed for surface {surface_id}")
+        mm = mmap.mmap(fd, total, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=0)
+        return MappedSurface(surface_id, stride, total, mm)
+
+    def map(self, surface_id: int) -> MappedSurface:
+        """Return the surface's mapping, creating it on first use."""
+        surf = self._maps.get(surface_id)
+        if surf is not None:
+            self._maps.move_to_end(surface_id)
+            self.hits += 1
+            return surf
+        self.misses += 1
+        surf = self._open(surface_id)
+        self._reclaim(surf.total)
+        self._maps[surface_id] = surf
+        self.mapped_bytes += surf.total
+        return surf
+
+    def _reclaim(self, incoming: int) -> None:
+        if self._parked:
+            self._parked = [p for p in self._parked if not p.close()]
+        while self._maps and self.mapped_bytes + incoming > self.max_bytes:
+            _, surf = self._maps.popitem(last=False)
+            self._release(surf)
+            self.evictions += 1
+
+    def _release(self, surf: MappedSurface) -> None:
+        self.mapped_bytes -= surf.total
+        if not surf.close():
+            self._parked.append(surf)
+
+    def unmap(self, surface_id: int) -> None:
+        """Drop the surface's mapping if there is one."""
+        surf = self._maps.pop(surface_id, None)
+        if surf is not None:
+            self._release(surf)
+
+    def close(self) -> None:
+        """Unmap everything (mappings still referenced are left to the GC)."""
+        while self._maps:
+            self._release(self._maps.popitem()[1])
+        self._parked = [p for p in self._parked if not p.close()]
+
+
+# =============================================================================
+# Pipelined Requests
+# =============================================================================
+
+def is_event(msg_type: int) -> bool:
+    """True for asynchronous event types (0x9000+)."""
+    return msg_type >= 0x9000
+
+
+def reply_status(msg_type: int, payload) -> int:
+    """A reply's status: err_code for RPL_ERROR, else its leading int32 (0 if none)."""
+    if msg_type == RPL_ERROR:
+        return ERROR_RPL.unpack_from(payload, 0)[0] if len(payload) >= ERROR_RPL.size else -1
+    return _STATUS.unpack_from(payload, 0)[0] if len(payload) >= 4 else 0
+
+
+def _decode_generic_reply(mt: int, payload, req) -> Tuple[int, bytes]:
+    return mt, bytes(payload)
+
+
+def _decode_create_reply(mt: int, payload, req) -> Tuple[int, int, int, int]:
+    if mt == RPL_ERROR:
+        err_code, _, _ = ERROR_RPL.unpack_from(payload, 0)
+        return err_code, 0, 0, 0
+    if mt != RPL_SURFACE_CREATE:
+        raise RuntimeError(f"Expected SURFACE_CREATE reply, got 0x{mt:04x}")
+    return SURFACE_CREATE_RPL.unpack_from(payload, 0)
+
+
+def _decode_destroy_reply(mt: int, payload, req) -> int:
+    if mt == RPL_ERROR:
+        err_code, _, _ = ERROR_RPL.unpack_from(payload, 0)
+        return err_code
+    if mt != RPL_SURFACE_DESTROY:
+        raise RuntimeError(f"Expected SURFACE_DESTROY reply, got 0x{mt:04x}")
+    return SURFACE_DESTROY_RPL.unpack_from(payload, 0)[0]
+
+
+def _decode_present_reply(mt: int, payload, req) -> Tuple[int, int, int]:
+    if mt == RPL_ERROR:
+        err_code, _, _ = ERROR_RPL.unpack_from(payload, 0)
+        return err_code, req[0], req[1]
+    if mt != RPL_SURFACE_PRESENT:
+        raise RuntimeError(f"Expected SURFACE_PRESENT reply, got 0x{mt:04x}")
+    return SURFACE_PRESENT_RPL.unpack_from(payload, 0)
+
+
+class PendingReply:
+    """
+    Handle for a request submitted with DrawSession.submit_*().
+
+    The reply is matched by msg_id and decoded into the same value the
+    blocking DrawSession method returns.  result() drives the session
+    until the reply arrives or the request's deadline passes.  When the
+    session runs a reader thread, result() instead sleeps on a per-request
+    threading.Event that the reader sets as soon as the reply is decoded.
+    """
+
+    __slots__ = ("session", "msg_id", "request", "deadline",
+                 "_decode", "_done", "_value", "_error", "_ready")
+
+    def __init__(self, session: 'DrawSession', msg_id: int, decode: Callable,
+                 request: tuple, deadline: float):
+        self.session = session
+        self.msg_id = msg_id
+        self.request = request
+        self.deadline = deadline
+        self._decode = decode
+        self._done = False
+        self._value: Any = None
+        self._error: Optional[BaseException] = None
+        self._ready = threading.Event() if session._reader is not None else None
+
+    def done(self) -> bool:
+        return self._done
+
+    def result(self) -> Any:
+        """Return the decoded reply, waiting for it if needed."""
+        if not self._done:
+            self.session.wait(self)
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def _resolve(self, msg_type: int, payload) -> None:
+        try:
+            self._value = self._decode(msg_type, payload, self.request)
+        except Exception as e:
+            self._error = e
+        self._done = True
+        if self._ready is not None:
+            self._ready.set()
+
+    def _fail(self, error: BaseException) -> None:
+        self._error = error
+        self._done = True
+        if self._ready is not None:
+            self._ready.set()
+
+
+class RequestBatch:
+    """
+    Collects requests and sends them as multi-message frames in one write().
+
+    Returned by DrawSession.batch(); each call returns a PendingReply that
+    resolves once the matching reply has been read.  Frames are split at
+    DRAWFS_MAX_FRAME_BYTES and writes at the same limit, which is the most
+    drawfs_write() accepts.  A batch is not limited by the session window,
+    but all of its replies share the kernel event queue (hw.drawfs.max_evq_bytes),
+    so very large batches should be paced.
+    """
+
+    def __init__(self, session: 'DrawSession', timeout_ms: int = 2000):
+        self.session = session
+        self.timeout_ms = timeout_ms
+        self._builder = FrameBuilder()
+        self._frame_starts: List[int] = []     # byte offset of each frame
+        self._frame_firsts: List[int] = []     # index in _pending of each frame's first request
+        self._pending: List[PendingReply] = []
+        self._msg_types: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _add(self, msg_type: int, msg_bytes: int, encode: Callable, decode: Callable,
+             request: tuple) -> PendingReply:
+        s = self.session
+        fb = self._builder
+        s._frame_id += 1
+        s._msg_id += 1
+        if not self._pending:
+            fb.begin(s._frame_id)
+            self._frame_starts = [0]
+            self._frame_firsts = [0]
+        elif fb.frame_len + msg_bytes > DRAWFS_MAX_FRAME_BYTES:
+            self._frame_starts.append(len(fb))
+            self._frame_firsts.append(len(self._pending))
+            fb.next_frame(s._frame_id)
+        encode(fb, s._msg_id)
+        if s.latency is not None:
+            self._msg_types.append(msg_type)
+        pending = PendingReply(s, s._msg_id, decode, request, float("inf"))
+        self._pending.append(pending)
+        return pending
+
+    def surface_create(self, width: int, height: int, fmt: int = FMT_XRGB8888) -> PendingReply:
+        return self._add(REQ_SURFACE_CREATE, _CREATE_MSG_BYTES,
+                         lambda fb, mid: fb.add_surface_create(mid, width, height, fmt),
+                         _decode_create_reply, (width, height, fmt))
+
+    def surface_destroy(self, surface_id: int) -> PendingReply:
+        self.session.mapper.unmap(surface_id)
+        return self._add(REQ_SURFACE_DESTROY, _DESTROY_MSG_BYTES,
+                         lambda fb, mid: fb.add_surface_destroy(mid, surface_id),
+                         _decode_destroy_reply, (surface_id,))
+
+    def surface_present(self, surface_id: int, cookie: int = 0) -> PendingReply:
+        return self._add(REQ_SURFACE_PRESENT, _PRESENT_MSG_BYTES,
+                         lambda fb, mid: fb.add_surface_present(mid, surface_id, cookie),
+                         _decode_present_reply, (surface_id, cookie))
+
+    def flush(self) -> int:
+        """
+        Send everything collected so far. Returns the number of write() calls.
+
+        If a write fails, the requests in it and in every later write fail
+        with the error, which is then raised; requests from the writes that
+        succeeded were accepted by the kernel and stay in flight.
+        """
+        if not self._pending:
+            return 0
+        s = self.session
+        data = self._builder.finish()
+        deadline = time.monotonic() + self.timeout_ms / 1000.0
+        for p in self._pending:
+            p.deadline = deadline
+            s._inflight[p.msg_id] = p
+        if s._poller is not None:
+            s._poller._schedule(s, deadline)
+        pending, self._pending = self._pending, []
+        if s.latency is not None:
+            s._stamp_sent(pending, self._msg_types)
+            self._msg_types = []
+
+        # Group whole frames into writes of at most DRAWFS_MAX_FRAME_BYTES.
+        bounds = self._frame_starts + [len(data)]
+        writes = []
+        first = 0
+        for i in range(1, len(bounds)):
+            if bounds[i] - bounds[first] > DRAWFS_MAX_FRAME_BYTES:
+                writes.append((first, i - 1))
+                first = i - 1
+        writes.append((first, len(bounds) - 1))
+
+        firsts = self._frame_firsts
+        for first, last in writes:
+            try:
+                os.write(s.fd, data[bounds[first]:bounds[last]])
+            except OSError as e:
+                for p in pending[firsts[first]:]:
+                    if s._inflight.pop(p.msg_id, None) is not None:
+                        if s.latency is not None:
+                            s.latency.request_abandoned(p.msg_id)
+                        p._fail(e)
+                raise
+            if s.recorder is not None:
+                for i in range(first, last):
+                    s.recorder.outbound(data[bounds[i]:bounds[i + 1]])
+        return len(writes)
+
+    def discard(self) -> None:
+        """Drop everything collected and not yet sent."""
+        for p in self._pending:
+            p._fail(RuntimeError("Batch discarded before it was sent"))
+        self._pending = []
+        self._msg_types = []
+
+
 # =============================================================================
 # Session Context Manager
 # =============================================================================
@@ -384,64 +1446,498 @@ class DrawSession:
             s.hello()
             s.display_open()
             status, sid, stride, total = s.surface_create(256, 256)
+
+    Pipelined requests are written back-to-back with up to `window` in
+    flight; replies are matched by msg_id and events that arrive in between
+    are queued on `events`.  Replies nobody is waiting for any more (the
+    request timed out) are dropped and counted in stray_replies:
+        with DrawSession(window=32) as s:
+            s.hello()
+            s.display_open()
+            pending = [s.submit_surface_present(sid, i) for i in range(100)]
+            statuses = [p.result()[0] for p in pending]
+
+    With reader=True a background thread owns the fd: replies wake their
+    callers directly and events are kept in a deque bounded by max_events
+    (the oldest are dropped and counted in events_dropped).
+
+    s.mapped(sid) returns a cached MappedSurface; mappings are dropped on
+    surface_destroy and when the session closes.
+
+    latency takes a drawfs_latency.LatencyRecorder; the session then stamps
+    time.perf_counter_ns() per msg_id and per present cookie and records
+    request->reply and present->SURFACE_PRESENTED times into it.
+
+    recorder takes a drawfs_capture.TrafficRecorder; every frame the
+    session writes or decodes is handed to it (see FrameDecoder.recorder).
     """
 
-    def __init__(self, dev: str = DEV):
+    def __init__(self, dev: str = DEV, window: int = 16, reader: bool = False,
+                 max_events: int = 4096, max_mapped_bytes: int = DEFAULT_MAX_MAPPED_BYTES,
+                 latency=None, recorder=None):
         self.dev = dev
         self.fd: Optional[int] = None
+        self.decoder = FrameDecoder()
+        self.window = window
+        self.reader = reader
+        self.max_events = max_events
+        self.events: Deque[Tuple[int, int, bytes]] = deque()
+        self.events_dropped = 0
+        self.events_high_water = 0
+        self.stray_replies = 0
+        self._inflight: Dict[int, PendingReply] = {}
+        self._batch: Optional[RequestBatch] = None
+        self._reader: Optional[threading.Thread] = None
+        self._poller = None                 # the SessionPoller servicing this session
+        self._reader_error: Optional[BaseException] = None
+        self._wake_fds: Optional[Tuple[int, int]] = None
+        self._events_ready = threading.Event()
+        self._events_lock = threading.Lock()    # the reader appends while callers take
+        self.mapper = SurfaceMapper(self, max_mapped_bytes)
+        self.latency = latency
+        self.recorder = recorder
+        self.decoder.recorder = recorder
+        self._builder = FrameBuilder()
         self._frame_id = 0
         self._msg_id = 0
 
     def __enter__(self) -> 'DrawSession':
         self.fd = os.open(self.dev, os.O_RDWR)
+        self.decoder.reset()
+        self.events.clear()
+        self._inflight.clear()
+        if self.reader:
+            self.start_reader()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop_reader()
+        self.mapper.close()
         if self.fd is not None:
             os.close(self.fd)
             self.fd = None
         return False
 
     def _next_ids(self) -> Tuple[int, int]:
+        if self._inflight:
+            # Blocking helpers read replies directly, so settle the
+            # pipeline first to keep its replies out of their way.
+            self.flush()
         self._frame_id += 1
         self._msg_id += 1
         return self._frame_id, self._msg_id
 
+    # -------------------------------------------------------------------------
+    # Pipelined requests
+    # -------------------------------------------------------------------------
+
+    def _submit(self, msg_type: int, encode: Callable, decode: Callable, request: tuple,
+                timeout_ms: int) -> PendingReply:
+        if self._reader_error is not None:
+            raise self._reader_error
+        if self._poller is not None and len(self._inflight) >= self.window:
+            # Only the poller may read the fd; waiting here would steal its replies.
+            raise BlockingIOError(errno.EAGAIN, f"Window of {self.window} requests is full")
+        while len(self._inflight) >= self.window:
+            self.pump(timeout_ms)
+        self._frame_id += 1
+        self._msg_id += 1
+        mid = self._msg_id
+        fb = self._builder.begin(self._frame_id)
+        encode(fb, mid)
+        pending = PendingReply(self, mid, decode, request,
+                               time.monotonic() + timeout_ms / 1000.0)
+        self._inflight[mid] = pending
+        if self.latency is not None:
+            self._stamp_sent((pending,), (msg_type,))
+        try:
+            fb.write(self.fd, self.recorder)
+        except OSError:
+            del self._inflight[mid]
+            if self.latency is not None:
+                self.latency.request_abandoned(mid)
+            raise
+        if self._poller is not None:
+            self._poller._schedule(self, pending.deadline)
+        return pending
+
+    def _stamp_sent(self, pending: Iterable[PendingReply], msg_types: Iterable[int]) -> None:
+        rec = self.latency
+        now = time.perf_counter_ns()
+        for p, msg_type in zip(pending, msg_types):
+            rec.request_sent(p.msg_id, msg_type, now)
+            if msg_type == REQ_SURFACE_PRESENT:
+                rec.present_sent(p.request[0], p.request[1], now)
+
+    def submit_surface_create(self, width: int, height: int, fmt: int = FMT_XRGB8888,
+                              timeout_ms: int = 2000) -> PendingReply:
+        """Send SURFACE_CREATE without waiting. result() is (status, surface_id, stride, total_bytes)."""
+        return self._submit(REQ_SURFACE_CREATE,
+                            lambda fb, mid: fb.add_surface_create(mid, width, height, fmt),
+                            _decode_create_reply, (width, height, fmt), timeout_ms)
+
+    def submit_surface_destroy(self, surface_id: int, timeout_ms: int = 2000) -> PendingReply:
+        """Send SURFACE_DESTROY without waiting. result() is status."""
+        self.mapper.unmap(surface_id)
+        return self._submit(REQ_SURFACE_DESTROY,
+                            lambda fb, mid: fb.add_surface_destroy(mid, surface_id),
+                            _decode_destroy_reply, (surface_id,), timeout_ms)
+
+    def submit_surface_present(self, surface_id: int, cookie: int = 0,
+                               timeout_ms: int = 2000) -> PendingReply:
+        """Send SURFACE_PRESENT without waiting. result() is (status, surface_id, cookie)."""
+        return self._submit(REQ_SURFACE_PRESENT,
+                            lambda fb, mid: fb.add_surface_present(mid, surface_id, cookie),
+                            _decode_present_reply, (surface_id, cookie), timeout_ms)
+
+    @contextlib.contextmanager
+    def batch(self, timeout_ms: int = 2000):
+        """
+        Collect surface_create/destroy/present calls and send them as
+        multi-message frames in one write() when the block exits.
+
+            with s.batch() as b:
+                handles = [b.surface_destroy(sid) for sid in sids]
+            statuses = [h.result() for h in handles]
+        """
+        b = RequestBatch(self, timeout_ms)
+        self._batch = b
+        try:
+            yield b
+        except BaseException:
+            b.discard()
+            raise
+        else:
+            b.flush()
+        finally:
+            self._batch = None
+
+    @property
+    def inflight(self) -> int:
+        """Number of submitted requests still waiting for a reply."""
+        return len(self._inflight)
+
+    def _take_reply(self, msg_type: int, msg_id: int) -> Optional[PendingReply]:
+        """
+        Remove and return the request a reply answers, timing it.  None
+        (counted in stray_replies) when no request is waiting.
+        """
+        pending = self._inflight.pop(msg_id, None)
+        if pending is None:
+            # A late reply to a request that timed out or failed to send.
+            self.stray_replies += 1
+        elif self.latency is not None:
+            self.latency.reply_received(msg_id, time.perf_counter_ns())
+            if msg_type == RPL_SURFACE_DESTROY:
+                # Every event for the surface was queued before this reply.
+                self.latency.surface_destroyed(pending.request[0])
+        return pending
+
+    def _event_arrived(self, msg_type: int, payload) -> None:
+        """Time a SURFACE_PRESENTED event against its present."""
+        if msg_type == EVT_SURFACE_PRESENTED and self.latency is not None and len(payload) >= 16:
+            sid, _, cookie = SURFACE_PRESENTED_EVT.unpack_from(payload, 0)
+            self.latency.presented(sid, cookie, time.perf_counter_ns())
+
+    def _dispatch(self, msg_type: int, msg_id: int, payload) -> None:
+        """Route a reply to its pending request and an event to the event queue."""
+        if not is_event(msg_type):
+            pending = self._take_reply(msg_type, msg_id)
+            if pending is not None:
+                pending._resolve(msg_type, payload)
+            return
+        self._event_arrived(msg_type, payload)
+        events = self.events
+        with self._events_lock:
+            if self._reader is not None and len(events) >= self.max_events:
+                events.popleft()
+                self.events_dropped += 1
+            events.append((msg_type, msg_id, bytes(payload)))
+            if len(events) > self.events_high_water:
+                self.events_high_water = len(events)
+        self._events_ready.set()
+
+    def _expire(self) -> List[PendingReply]:
+        """Fail every request past its deadline. Returns the ones that expired."""
+        now = time.monotonic()
+        expired = [p for p in list(self._inflight.values()) if p.deadline <= now]
+        for p in expired:
+            if self._inflight.pop(p.msg_id, None) is not None:
+                if self.latency is not None:
+                    self.latency.request_abandoned(p.msg_id)
+                p._fail(TimeoutError(f"No reply for msg_id {p.msg_id}"))
+        return expired
+
+    # -------------------------------------------------------------------------
+    # Reader thread
+    # -------------------------------------------------------------------------
+
+    def start_reader(self) -> None:
+        """
+        Hand the fd to a background thread that dispatches every message as
+        it arrives.  Blocking calls then wait for their own reply instead of
+        reading, and events are never discarded while looking for a reply.
+        """
+        if self._reader is not None:
+            return
+        self.reader = True
+        self._reader_error = None
+        self._wake_fds = os.pipe()
+        self._reader = threading.Thread(target=self._reader_loop, name="drawfs-reader",
+                                        daemon=True)
+        self._reader.start()
+
+    def stop_reader(self) -> None:
+        """Stop the reader thread; in-flight requests are left for pump()."""
+        if self._reader is None:
+            return
+        rfd, wfd = self._wake_fds
+        os.write(wfd, b"x")
+        self._reader.join()
+        os.close(rfd)
+        os.close(wfd)
+        self._reader = None
+        self._wake_fds = None
+
+    def _reader_loop(self) -> None:
+        fd = self.fd
+        wake = self._wake_fds[0]
+        decoder = self.decoder
+        sel = selectors.DefaultSelector()
+        sel.register(fd, selectors.EVENT_READ)
+        sel.register(wake, selectors.EVENT_READ)
+        try:
+            while True:
+                if any(key.fd == wake for key, _ in sel.select()):
+                    return
+                if decoder.readfrom(fd) == 0:
+                    raise EOFError("End of stream")
+                for _, mh, payload in decoder:
+                    self._dispatch(mh[0], mh[3], payload)
+        except (OSError, EOFError, FrameError) as e:
+            self._reader_error = e
+            inflight, self._inflight = self._inflight, {}
+            for p in inflight.values():
+                p._fail(e)
+            self._events_ready.set()
+        finally:
+            sel.close()
+
+    def _await(self, pending: PendingReply) -> None:
+        """Sleep until the reader thread resolves pending or its deadline passes."""
+        if pending._ready.wait(max(pending.deadline - time.monotonic(), 0.0)):
+            return
+        if self._inflight.pop(pending.msg_id, None) is not None:
+            if self.latency is not None:
+                self.latency.request_abandoned(pending.msg_id)
+            pending._fail(TimeoutError(f"No reply for msg_id {pending.msg_id}"))
+        else:
+            # The reader took it just as the deadline passed.
+            pending._ready.wait()
+
+    def _wait_event(self, timeout_s: float) -> bool:
+        """Reader mode: wait until an event is queued. False on timeout."""
+        deadline = time.monotonic() + timeout_s
+        while not self.events:
+            self._events_ready.clear()
+            if self.events:
+                break
+            if self._reader_error is not None:
+                raise self._reader_error
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._events_ready.wait(remaining):
+                return False
+        return True
+
+    def pump(self, timeout_ms: int = 2000) -> int:
+        """
+        Read and dispatch whatever the kernel has queued, waiting up to
+        timeout_ms for the first frame.  Returns messages dispatched.
+
+        With the reader thread running this waits for the oldest in-flight
+        request instead (or for an event when nothing is in flight).
+        """
+        if self._poller is not None:
+            raise RuntimeError("pump() is unavailable while a SessionPoller services the session")
+        if self._reader is not None:
+            oldest = next(iter(list(self._inflight.values())), None)
+            if oldest is not None:
+                self._await(oldest)
+                return 1
+            return int(self._wait_event(timeout_ms / 1000.0))
+
+        dispatched = 0
+        for _, mh, payload in self.decoder:
+            self._dispatch(mh[0], mh[3], payload)
+            dispatched += 1
+        if not dispatched:
+            timeout_s = timeout_ms / 1000.0
+            if self._inflight:
+                next_deadline = min(p.deadline for p in self._inflight.values())
+                timeout_s = max(min(timeout_s, next_deadline - time.monotonic()), 0.0)
+            if read_available(self.fd, self.decoder, timeout_s * 1000) > 0:
+                for _, mh, payload in self.decoder:
+                    self._dispatch(mh[0], mh[3], payload)
+                    dispatched += 1
+        self._expire()
+        return dispatched
+
+    def wait(self, pending: PendingReply) -> None:
+        """Pump the session until pending has a result or has timed out."""
+        if self._batch is not None:
+            self._batch.flush()
+        if pending._ready is not None and self._reader is not None:
+            self._await(pending)
+            return
+        while not pending.done():
+            self.pump(max(int((pending.deadline - time.monotonic()) * 1000), 0))
+
+    def flush(self) -> None:
+        """Wait until every submitted request has been answered or has timed out."""
+        while self._inflight:
+            self.pump()
+
+    def drain_batch(self, timeout_ms: int = 0) -> List[Tuple[int, int, bytes]]:
+        """
+        Read everything queued in one burst, resolve any pending replies and
+        return (and dequeue) all queued events.
+        """
+        self.pump(timeout_ms)
+        with self._events_lock:
+            events = list(self.events)
+            self.events.clear()
+        return events
+
+    def take_events(self, match: Callable[[int, int, bytes], bool]) -> List[Tuple[int, int, bytes]]:
+        """
+        Dequeue and return the queued events for which match(msg_type,
+        msg_id, payload) is true, without reading.  The rest stay queued in
+        order; safe while the reader thread is queueing events.
+        """
+        taken = []
+        kept = []
+        with self._events_lock:
+            for ev in self.events:
+                (taken if match(*ev) else kept).append(ev)
+            if taken:
+                self.events.clear()
+                self.events.extend(kept)
+        return taken
+
+    def next_event(self, timeout_ms: int = 2000) -> Tuple[int, int, bytes]:
+        """Return the next queued event (msg_type, msg_id, payload), reading if needed."""
+        if self._reader is not None:
+            if not self._wait_event(timeout_ms / 1000.0):
+                raise TimeoutError(f"Timeout waiting for event ({timeout_ms}ms)")
+            return self.events.popleft()
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        while not self.events:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Timeout waiting for event ({timeout_ms}ms)")
+            self.pump(int(remaining * 1000))
+        return self.events.popleft()
+
+    # -------------------------------------------------------------------------
+    # Blocking requests
+    # -------------------------------------------------------------------------
+
     def send(self, frame: bytes) -> None:
-        send(self.fd, frame)
+        send(self.fd, frame, self.recorder)
 
     def read_frame(self, timeout_ms: int = 2000) -> bytes:
-        return read_frame(self.fd, timeout_ms)
+        if self._reader is not None:
+            raise RuntimeError("read_frame() is unavailable while the reader thread owns the fd")
+        return read_frame(self.fd, timeout_ms, self.decoder)
 
     def read_msg(self, timeout_ms: int = 2000) -> Tuple[int, int, bytes]:
-        return read_msg(self.fd, timeout_ms)
+        if self._reader is not None:
+            return self.next_event(timeout_ms)
+        if self.events:
+            return self.events.popleft()
+        return read_msg(self.fd, timeout_ms, self.decoder)
+
+    def _decode_frame(self, mt: int, payload, req) -> bytes:
+        # Runs on the reader thread while the reply's frame is current.
+        return bytes(self.decoder.current_frame)
+
+    def _blocking(self, msg_type: int, call: Callable, *args):
+        """Run a blocking request helper, timing it when latency is recorded."""
+        rec = self.latency
+        if rec is None:
+            return call(*args)
+        t0 = time.perf_counter_ns()
+        result = call(*args)
+        rec.record_request(msg_type, time.perf_counter_ns() - t0)
+        return result
 
     def hello(self) -> bytes:
+        if self._reader is not None:
+            return self._submit(REQ_HELLO,
+                                lambda fb, mid: fb.add(REQ_HELLO, mid, 1, 0, 0, 65536),
+                                self._decode_frame, (), 2000).result()
         fid, mid = self._next_ids()
-        return hello(self.fd, fid, mid)
+        return self._blocking(REQ_HELLO, hello, self.fd, fid, mid, self.decoder)
 
     def display_list(self) -> Tuple[int, bytes]:
+        if self._reader is not None:
+            return self._submit(REQ_DISPLAY_LIST,
+                                lambda fb, mid: fb.add_msg(REQ_DISPLAY_LIST, mid),
+                                _decode_generic_reply, (), 2000).result()
         fid, mid = self._next_ids()
-        return display_list(self.fd, fid, mid)
+        return self._blocking(REQ_DISPLAY_LIST, display_list, self.fd, fid, mid, self.decoder)
 
     def display_open(self, display_id: int = 1) -> Tuple[int, bytes]:
+        if self._reader is not None:
+            return self._submit(REQ_DISPLAY_OPEN,
+                                lambda fb, mid: fb.add(REQ_DISPLAY_OPEN, mid, display_id),
+                                _decode_generic_reply, (), 2000).result()
         fid, mid = self._next_ids()
-        return display_open(self.fd, display_id, fid, mid)
+        return self._blocking(REQ_DISPLAY_OPEN, display_open, self.fd, display_id, fid, mid,
+                              self.decoder)
 
     def surface_create(self, width: int, height: int, fmt: int = FMT_XRGB8888, skip_events: bool = False) -> Tuple[int, int, int, int]:
+        if self._reader is not None:
+            return self.submit_surface_create(width, height, fmt).result()
         fid, mid = self._next_ids()
-        return surface_create(self.fd, width, height, fmt, 0, fid, mid, skip_events)
+        return self._blocking(REQ_SURFACE_CREATE, surface_create, self.fd, width, height, fmt, 0,
+                              fid, mid, skip_events, self.decoder)
 
     def surface_destroy(self, surface_id: int, skip_events: bool = False) -> int:
+        self.mapper.unmap(surface_id)
+        if self._reader is not None:
+            return self.submit_surface_destroy(surface_id).result()
         fid, mid = self._next_ids()
-        return surface_destroy(self.fd, surface_id, fid, mid, skip_events)
+        status = self._blocking(REQ_SURFACE_DESTROY, surface_destroy, self.fd, surface_id, fid, mid,
+                                skip_events, self.decoder)
+        if self.latency is not None:
+            self.latency.surface_destroyed(surface_id)
+        return status
 
     def surface_present(self, surface_id: int, cookie: int = 0, skip_events: bool = False) -> Tuple[int, int, int]:
+        if self._reader is not None:
+            return self.submit_surface_present(surface_id, cookie).result()
         fid, mid = self._next_ids()
-        return surface_present(self.fd, surface_id, cookie, fid, mid, skip_events)
+        if self.latency is not None:
+            self.latency.present_sent(surface_id, cookie, time.perf_counter_ns())
+        return self._blocking(REQ_SURFACE_PRESENT, surface_present, self.fd, surface_id, cookie,
+                              fid, mid, skip_events, self.decoder)
 
     def read_presented_event(self, timeout_ms: int = 2000) -> Tuple[int, int, int]:
-        return read_presented_event(self.fd, timeout_ms)
+        if self._reader is not None:
+            mt, _, payload = self.next_event(timeout_ms)
+            if mt != EVT_SURFACE_PRESENTED:
+                raise RuntimeError(f"Expected SURFACE_PRESENTED event, got 0x{mt:04x}")
+            return SURFACE_PRESENTED_EVT.unpack_from(payload, 0)
+        if self.events:
+            mt, _, payload = self.events.popleft()
+            if mt != EVT_SURFACE_PRESENTED:
+                raise RuntimeError(f"Expected SURFACE_PRESENTED event, got 0x{mt:04x}")
+            return SURFACE_PRESENTED_EVT.unpack_from(payload, 0)
+        event = read_presented_event(self.fd, timeout_ms, self.decoder)
+        if self.latency is not None:
+            self.latency.presented(event[0], event[2], time.perf_counter_ns())
+        return event
 
     def get_stats(self) -> Dict[str, int]:
         return get_stats(self.fd)
@@ -449,5 +1945,20 @@ class DrawSession:
     def map_surface(self, surface_id: int) -> Tuple[int, int, int, int]:
         return map_surface(self.fd, surface_id)
 
+    def mapped(self, surface_id: int) -> MappedSurface:
+        """Cached mapping of surface_id (see SurfaceMapper)."""
+        return self.mapper.map(surface_id)
+
     def drain_all(self, max_msgs: int = 500, timeout_s: float = 5.0) -> int:
-        return drain_all(self.fd, max_msgs, timeout_s)
+        if self._reader is not None:
+            # Replies never reach the event queue, so only events are drained;
+            # stop after 100ms of quiet like the select-based version.
+            drained = 0
+            deadline = time.monotonic() + timeout_s
+            while drained < max_msgs and time.monotonic() < deadline:
+                if not self._wait_event(min(0.1, max(deadline - time.monotonic(), 0.0))):
+                    break
+                self.events.popleft()
+                drained += 1
+            return drained
+        return drain_all(self.fd, max_msgs, timeout_s, self.decoder)
@@ -6,8 +6,14 @@ This test exercises session isolation and concurrent access by:
 - Running multiple sessions in parallel
 - Interleaving operations across sessions
 - Rapidly opening and closing sessions
+- Driving hundreds of sessions from one asyncio event loop
+- Driving 1,000+ sessions from one SessionPoller (epoll/kqueue)
 - Verifying no cross-session interference
 
+With --latency FILE the parallel and interleaved tests record request and
+present latency per session, print p50/p99/p99.9 and dump the merged
+histograms to FILE (see drawfs_latency.py).
+
 Note: Python's GIL limits true parallelism, but this still exercises
 the kernel's session isolation and locking.
 """
@@ -15,24 +21,30 @@ the kernel's session isolation and locking.
 import os
 import sys
 import time
+import asyncio
 import random
 import threading
 import argparse
-from typing import List
+from typing import List, Optional
 
 # Add tests directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from drawfs_test import DrawSession, DEV
+from drawfs_async import AsyncDrawSession
+from drawfs_poller import SessionPoller
+from drawfs_latency import LatencyRecorder
 
 
 class SessionWorker:
     """Worker that performs operations in a single session."""
 
-    def __init__(self, worker_id: int, iterations: int, verbose: bool = False):
+    def __init__(self, worker_id: int, iterations: int, verbose: bool = False,
+                 latency: Optional[LatencyRecorder] = None):
         self.worker_id = worker_id
         self.iterations = iterations
         self.verbose = verbose
+        self.latency = latency
         self.results = {
             'created': 0,
             'destroyed': 0,
@@ -53,7 +65,7 @@ class SessionWorker:
             self.results['errors'] += 1
 
     def _do_work(self):
-        with DrawSession() as s:
+        with DrawSession(latency=self.latency) as s:
             s.hello()
             s.display_open()
 
@@ -96,11 +108,14 @@ class SessionWorker:
                 s.surface_destroy(sid, skip_events=True)
 
 
-def stress_parallel_sessions(num_workers: int, iterations: int, verbose: bool = False):
+def stress_parallel_sessions(num_workers: int, iterations: int, verbose: bool = False,
+                             latency: Optional[LatencyRecorder] = None):
     """Run multiple sessions in parallel threads."""
     print(f"== Stress: {num_workers} parallel sessions, {iterations} ops each ==")
 
-    workers = [SessionWorker(i, iterations, verbose) for i in range(num_workers)]
+    workers = [SessionWorker(i, iterations, verbose,
+                             LatencyRecorder() if latency is not None else None)
+               for i in range(num_workers)]
     threads = [threading.Thread(target=w.run) for w in workers]
 
     start = time.time()
@@ -127,6 +142,9 @@ def stress_parallel_sessions(num_workers: int, iterations: int, verbose: bool =
     print(f"  total errors: {total['errors']}")
     print(f"  elapsed: {elapsed:.2f}s")
     print(f"  throughput: {(total['created'] + total['presented']) / elapsed:.0f} ops/s")
+    if latency is not None:
+        for w in workers:
+            latency.merge(w.latency)
 
 
 def stress_session_churn(iterations: int, verbose: bool = False):
@@ -160,7 +178,8 @@ def stress_session_churn(iterations: int, verbose: bool = False):
     print(f"  elapsed: {elapsed:.2f}s, rate: {rate:.0f} sessions/s")
 
 
-def stress_interleaved_sessions(num_sessions: int, iterations: int, verbose: bool = False):
+def stress_interleaved_sessions(num_sessions: int, iterations: int, verbose: bool = False,
+                                latency: Optional[LatencyRecorder] = None):
     """Interleave operations across multiple open sessions."""
     print(f"== Stress: interleaved ops across {num_sessions} sessions ==")
 
@@ -170,7 +189,7 @@ def stress_interleaved_sessions(num_sessions: int, iterations: int, verbose: boo
     try:
         # Open all sessions
         for i in range(num_sessions):
-            s = DrawSession()
+            s = DrawSession(latency=LatencyRecorder() if latency is not None else None)
             s.__enter__()
             s.hello()
             s.display_open()
@@ -232,6 +251,170 @@ def stress_interleaved_sessions(num_sessions: int, iterations: int, verbose: boo
                 s.__exit__(None, None, None)
             except:
                 pass
+            if latency is not None:
+                latency.merge(s.latency)
+
+
+async def _async_worker(worker_id: int, iterations: int, results: dict, verbose: bool):
+    try:
+        async with AsyncDrawSession() as s:
+            await s.hello()
+            await s.display_open()
+
+            surfaces = []
+            for i in range(iterations):
+                r = random.random()
+
+                if r < 0.4 and len(surfaces) < 10:
+                    status, sid, _, _ = await s.surface_create(
+                        random.randint(32, 128), random.randint(32, 128))
+                    if status == 0:
+                        surfaces.append(sid)
+                        results['created'] += 1
+
+                elif r < 0.6 and surfaces:
+                    sid = surfaces.pop(random.randint(0, len(surfaces) - 1))
+                    if await s.surface_destroy(sid) == 0:
+                        results['destroyed'] += 1
+
+                elif surfaces:
+                    status, _, _ = await s.present(random.choice(surfaces), i)
+                    if status == 0:
+                        results['presented'] += 1
+
+                # Events are queued by the reader callback; discard them
+                # periodically instead of reading them one by one.
+                if i % 50 == 0:
+                    s.event_queue.clear()
+
+            for sid in surfaces:
+                await s.surface_destroy(sid)
+    except Exception as e:
+        results['errors'] += 1
+        if verbose:
+            print(f"  session {worker_id} error: {e}")
+
+
+def stress_async_sessions(num_sessions: int, iterations: int, verbose: bool = False):
+    """Drive many sessions concurrently from a single asyncio event loop."""
+    print(f"== Stress: {num_sessions} async sessions on one loop, {iterations} ops each ==")
+
+    results = {'created': 0, 'destroyed': 0, 'presented': 0, 'errors': 0}
+
+    async def run_all():
+        await asyncio.gather(*(
+            _async_worker(i, iterations, results, verbose) for i in range(num_sessions)
+        ))
+
+    start = time.time()
+    asyncio.run(run_all())
+    elapsed = time.time() - start
+
+    print(f"  total created: {results['created']}")
+    print(f"  total destroyed: {results['destroyed']}")
+    print(f"  total presented: {results['presented']}")
+    print(f"  total errors: {results['errors']}")
+    print(f"  threads: {threading.active_count()}")
+    print(f"  elapsed: {elapsed:.2f}s")
+    print(f"  throughput: {(results['created'] + results['presented']) / elapsed:.0f} ops/s")
+
+
+def _raise_fd_limit(needed: int) -> None:
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def stress_poller_sessions(num_sessions: int, iterations: int, verbose: bool = False):
+    """Drive many sessions from one SessionPoller on a single thread."""
+    print(f"== Stress: {num_sessions} sessions on one SessionPoller, {iterations} presents each ==")
+
+    _raise_fd_limit(num_sessions + 64)
+
+    sessions: List[DrawSession] = []
+    state = {}
+    results = {'created': 0, 'destroyed': 0, 'presented': 0, 'events': 0, 'errors': 0}
+
+    def on_reply(s, pending):
+        st = state[s]
+        try:
+            value = pending.result()
+        except Exception as e:
+            results['errors'] += 1
+            st['done'] = True
+            if verbose:
+                print(f"  session fd {s.fd} error: {e}")
+            return
+        if st['sid'] is None:
+            if value[0] != 0:
+                results['errors'] += 1
+                st['done'] = True
+                return
+            st['sid'] = value[1]
+            results['created'] += 1
+        elif st['presents'] < iterations:
+            if value[0] == 0:
+                results['presented'] += 1
+            else:
+                results['errors'] += 1
+            st['presents'] += 1
+        else:
+            if value == 0:
+                results['destroyed'] += 1
+            st['done'] = True
+            return
+        if st['presents'] < iterations:
+            s.submit_surface_present(st['sid'], st['presents'])
+        else:
+            s.submit_surface_destroy(st['sid'])
+
+    def on_event(s, msg_type, msg_id, payload):
+        results['events'] += 1
+
+    poller = SessionPoller()
+    try:
+        for i in range(num_sessions):
+            s = DrawSession()
+            s.__enter__()
+            sessions.append(s)
+            s.hello()
+            s.display_open()
+            state[s] = {'sid': None, 'presents': 0, 'done': False}
+            poller.register(s, on_reply, on_event)
+
+        cpu_start = time.process_time()
+        start = time.time()
+        for s in sessions:
+            s.submit_surface_create(64, 64)
+        completed = poller.run(lambda: all(st['done'] for st in state.values()))
+        elapsed = time.time() - start
+        cpu = time.process_time() - cpu_start
+
+        counts = poller.readiness()
+        print(f"  selector: {poller.selector_name}")
+        print(f"  sessions: {len(sessions)} (highest fd {max(s.fd for s in sessions)})")
+        print(f"  completed: {sum(st['done'] for st in state.values())}/{num_sessions}"
+              f"{'' if completed else ' (stalled)'}")
+        print(f"  created: {results['created']}, presented: {results['presented']}, "
+              f"destroyed: {results['destroyed']}, events: {results['events']}")
+        print(f"  errors: {results['errors']}")
+        print(f"  wakeups: {poller.wakeups}, readiness per fd: "
+              f"min {min(counts.values())} max {max(counts.values())}")
+        print(f"  elapsed: {elapsed:.2f}s, cpu: {cpu:.2f}s")
+        print(f"  throughput: {results['presented'] / elapsed:.0f} presents/s")
+
+    finally:
+        poller.close()
+        for s in sessions:
+            try:
+                s.__exit__(None, None, None)
+            except:
+                pass
 
 
 def main():
@@ -242,18 +425,26 @@ def main():
                         help="Number of parallel workers")
     parser.add_argument("--sessions", "-s", type=int, default=5,
                         help="Number of interleaved sessions")
+    parser.add_argument("--async-sessions", "-a", type=int, default=200,
+                        help="Number of sessions for the asyncio test")
+    parser.add_argument("--poller-sessions", "-p", type=int, default=1000,
+                        help="Number of sessions for the SessionPoller test")
     parser.add_argument("--verbose", "-v", action="store_true",
                         help="Verbose output")
+    parser.add_argument("--latency", metavar="FILE",
+                        help="Record latency histograms and dump them to FILE")
     parser.add_argument("--test", "-t",
-                        choices=["parallel", "churn", "interleaved", "all"],
+                        choices=["parallel", "churn", "interleaved", "async", "poller", "all"],
                         default="all", help="Which test to run")
     args = parser.parse_args()
 
     print(f"Multi-session stress test")
     print()
 
+    latency = LatencyRecorder() if args.latency else None
+
     if args.test in ("parallel", "all"):
-        stress_parallel_sessions(args.workers, args.iterations, args.verbose)
+        stress_parallel_sessions(args.workers, args.iterations, args.verbose, latency)
         print()
 
     if args.test in ("churn", "all"):
@@ -261,7 +452,22 @@ def main():
         print()
 
     if args.test in ("interleaved", "all"):
-        stress_interleaved_sessions(args.sessions, args.iterations, args.verbose)
+        stress_interleaved_sessions(args.sessions, args.iterations, args.verbose, latency)
+        print()
+
+    if args.test in ("async", "all"):
+        stress_async_sessions(args.async_sessions, args.iterations, args.verbose)
+        print()
+
+    if args.test in ("poller", "all"):
+        stress_poller_sessions(args.poller_sessions, args.iterations, args.verbose)
+        print()
+
+    if latency is not None:
+        print("== Latency (parallel + interleaved) ==")
+        print(latency.format_report())
+        latency.dump_file(args.latency)
+        print(f"  histograms written to {args.latency}")
         print()
 
     print("OK: multi-session stress tests completed")
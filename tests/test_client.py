@@ -0,0 +1,1150 @@
+#!/usr/bin/env python3
+"""
+test_client.py - DrawSession client behaviour against a stand-in device
+
+These tests run DrawSession over drawfs_fake.FakeDevice and do not need
+/dev/draw.
+
+Tests:
+  - Pipelined requests resolve by msg_id with events queued
+  - Pipelined requests time out at their deadline and late replies are dropped
+  - Blocking calls settle the pipeline first
+  - Batches send many requests in one write and resolve every handle
+  - A failed batch write fails only its own and later requests
+  - AsyncDrawSession drives many sessions from one event loop
+  - AsyncDrawSession drops replies that arrive after their request timed out
+  - The reader thread keeps events that arrive ahead of a reply
+  - The reader thread bounds the event queue and counts overflow
+  - SessionPoller drives many sessions with per-session handlers
+  - SessionPoller expires silent sessions, waits out split frames, never reads from handlers
+  - SurfaceMapper caches mappings, evicts LRU and unmaps on destroy
+  - Swapchain never hands out a buffer still queued for display, also under the reader thread
+  - PresentPacer holds presents to the queue budget and target rate
+  - StatsSampler rates over a wrapped ring, with and without numpy
+  - MetricsExporter serves cached OpenMetrics snapshots over HTTP and textfile
+  - LatencyHistogram percentiles stay within bucket precision, merge and round-trip
+  - DrawSession records request and present latency per type
+  - SurfacePool recycles by size and format within the session limits
+  - SessionPool hands out warm sessions, refills, and drops dirty returns
+  - TrafficRecorder captures every frame in both directions and counts drops
+  - Replayer re-sends a capture with remapped surface_ids and checks every reply
+"""
+
+import asyncio
+import errno
+import json
+import mmap
+import random
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from drawfs_test import (
+    DrawSession, SurfaceMapper, MappedSurface, EVT_SURFACE_PRESENTED,
+    parse_first_msg, RPL_HELLO, STATS_STRUCT, STATS_FIELDS,
+    REQ_HELLO, REQ_SURFACE_CREATE, REQ_SURFACE_PRESENT, REQ_SURFACE_DESTROY, FH_SIZE,
+    RPL_SURFACE_PRESENT, RPL_SURFACE_DESTROY, SURFACE_PRESENT_REQ, SURFACE_PRESENT_RPL, make_frame, make_msg
+)
+from drawfs_async import AsyncDrawSession
+from drawfs_fake import FakeDevice
+from drawfs_poller import SessionPoller
+from drawfs_swapchain import Swapchain
+from drawfs_pacing import PresentPacer, PRESENT_COST, PRESENTED_EVENT_BYTES
+from drawfs_stats import StatsSampler
+from drawfs_metrics import MetricsExporter, CONTENT_TYPE
+from drawfs_latency import LatencyHistogram, LatencyRecorder
+from drawfs_capture import TrafficRecorder, CaptureReader, CaptureWriter, TO_KERNEL, FROM_KERNEL
+from drawfs_replay import Replayer
+from drawfs_pool import PooledSurface, SurfacePool, SessionPool
+
+
+def _session(dev: FakeDevice, **kwargs) -> DrawSession:
+    s = DrawSession(**kwargs)
+    s.fd = dev.fd
+    return s
+
+
+def test_pipelined_window():
+    """Pipelined presents resolve in order and their events are queued."""
+    dev = FakeDevice()
+    try:
+        s = _session(dev, window=4)
+        s.hello()
+        s.display_open()
+        status, sid, _, _ = s.surface_create(64, 64)
+        assert status == 0
+
+        pending = []
+        for i in range(40):
+            pending.append(s.submit_surface_present(sid, 1000 + i))
+            assert s.inflight <= 4, f"window exceeded: {s.inflight}"
+        results = [p.result() for p in pending]
+        assert results == [(0, sid, 1000 + i) for i in range(40)]
+        assert s.inflight == 0
+
+        # The device coalesces SURFACE_PRESENTED events it has not sent
+        # yet, so only the newest cookie is certain; the rest stay in order.
+        cookies = []
+        while s.events:
+            mt, _, payload = s.events.popleft()
+            assert mt == EVT_SURFACE_PRESENTED
+            cookies.append(int.from_bytes(payload[8:16], "little"))
+        assert cookies and cookies[-1] == 1039, "newest event missing"
+        assert cookies == sorted(set(cookies)), "events reordered"
+
+        errors = [s.submit_surface_present(999, i) for i in range(3)]
+        assert all(p.result()[0] != 0 for p in errors)
+        print(f"  40 presents with window 4, {len(cookies)} events queued")
+    finally:
+        dev.close()
+
+
+def test_pipelined_deadline():
+    """A request with no reply fails with TimeoutError at its deadline."""
+    client, server = socket.socketpair()
+    try:
+        s = DrawSession()
+        s.fd = client.fileno()
+        p = s.submit_surface_destroy(1, timeout_ms=50)
+        try:
+            p.result()
+        except TimeoutError:
+            pass
+        else:
+            raise AssertionError("Expected TimeoutError")
+        assert s.inflight == 0
+
+        # The reply turns up after the deadline: dropped, not queued as an event.
+        server.sendall(make_frame(9, [make_msg(RPL_SURFACE_DESTROY, p.msg_id,
+                                               struct.pack("<iI", 0, 1))]))
+        try:
+            s.next_event(timeout_ms=100)
+        except TimeoutError:
+            pass
+        else:
+            raise AssertionError("late reply was queued as an event")
+        assert s.stray_replies == 1 and not s.events
+        print("  unanswered request timed out, its late reply dropped")
+    finally:
+        client.close()
+        server.close()
+
+
+def test_blocking_after_pipeline():
+    """Blocking helpers wait for in-flight requests before reading."""
+    dev = FakeDevice()
+    try:
+        s = _session(dev)
+        s.hello()
+        s.display_open()
+        creates = [s.submit_surface_create(16, 16) for _ in range(5)]
+        reply = s.hello()
+        msg_type, _, _ = parse_first_msg(reply)
+        assert msg_type == RPL_HELLO
+        assert all(p.done() for p in creates)
+        assert [p.result()[1] for p in creates] == [1, 2, 3, 4, 5]
+        print("  pipeline settled before blocking HELLO")
+    finally:
+        dev.close()
+
+
+def test_batch():
+    """A batch of 64 creates, presents and destroys costs one write each."""
+    dev = FakeDevice()
+    try:
+        s = _session(dev)
+        s.hello()
+        s.display_open()
+
+        with s.batch() as b:
+            creates = [b.surface_create(32, 32) for _ in range(64)]
+            assert len(b) == 64
+        assert dev.requests == 2 + 64
+        sids = [p.result()[1] for p in creates]
+        assert sids == list(range(1, 65)), sids
+
+        with s.batch() as b:
+            presents = [b.surface_present(sid, sid * 10) for sid in sids]
+        assert [p.result() for p in presents] == [(0, sid, sid * 10) for sid in sids]
+
+        with s.batch() as b:
+            destroys = [b.surface_destroy(sid) for sid in sids]
+            # result() inside the block sends what has been collected so far
+            assert destroys[0].result() == 0
+            destroys.append(b.surface_destroy(sids[0]))
+        assert [p.result() for p in destroys[:-1]] == [0] * 64
+        assert destroys[-1].result() != 0, "double destroy should fail"
+        assert len(s.events) == 64, f"expected 64 presented events, got {len(s.events)}"
+
+        try:
+            with s.batch() as b:
+                dropped = b.surface_create(8, 8)
+                raise KeyError("abort")
+        except KeyError:
+            pass
+        try:
+            dropped.result()
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("discarded batch handle should fail")
+        print(f"  {dev.requests} requests served, {len(s.events)} events queued")
+    finally:
+        dev.close()
+
+
+def test_batch_write_failure():
+    """When the second write of a batch fails, the first write's requests still resolve."""
+    import drawfs_test
+    dev = FakeDevice()
+    real_write = os.write
+    writes = []
+
+    def failing_write(fd, data):
+        writes.append(len(data))
+        if len(writes) == 2:
+            raise OSError(errno.ENOSPC, "No space left on device")
+        return real_write(fd, data)
+
+    max_frame = drawfs_test.DRAWFS_MAX_FRAME_BYTES
+    try:
+        s = _session(dev)
+        s.hello()
+        s.display_open()
+        _, sid, _, _ = s.surface_create(16, 16)
+        drawfs_test.DRAWFS_MAX_FRAME_BYTES = 4096      # ~127 presents per frame and write
+        os.write = failing_write
+        try:
+            with s.batch() as b:
+                presents = [b.surface_present(sid, i) for i in range(300)]
+        except OSError as e:
+            assert e.errno == errno.ENOSPC
+        else:
+            raise AssertionError("expected the failed write to raise")
+        finally:
+            os.write = real_write
+            drawfs_test.DRAWFS_MAX_FRAME_BYTES = max_frame
+        assert len(writes) == 2
+        sent = [p for p in presents if not isinstance(p._error, OSError)]
+        failed = presents[len(sent):]
+        assert 0 < len(sent) < 300 and all(p.done() for p in failed)
+        assert all(isinstance(p._error, OSError) for p in failed)
+        assert s.inflight == len(sent)
+        assert [p.result()[2] for p in sent] == list(range(len(sent)))
+        s.flush()
+        assert s.stray_replies == 0
+        assert all(mt == EVT_SURFACE_PRESENTED for mt, _, _ in s.events)
+        print(f"  {len(sent)} presents from the first write resolved, {len(failed)} failed")
+    finally:
+        dev.close()
+
+
+def test_async_sessions():
+    """Concurrent requests on 32 async sessions resolve by msg_id; events stream."""
+    devs = [FakeDevice() for _ in range(32)]
+
+    async def one(dev):
+        s = AsyncDrawSession()
+        s.attach(dev.fd)
+        try:
+            await s.hello()
+            await s.display_open()
+            status, sid, stride, _ = await s.surface_create(32, 16)
+            assert (status, stride) == (0, 128)
+            replies = await asyncio.gather(*(s.present(sid, c) for c in range(20)))
+            assert replies == [(0, sid, c) for c in range(20)]
+            assert await s.present(sid + 100) == (2, 0, 0), "ENOENT expected"
+
+            # Events still queued in the device are coalesced per surface,
+            # so only the newest cookie is certain to arrive.
+            cookies = []
+            async for mt, _, payload in s.events():
+                assert mt == EVT_SURFACE_PRESENTED
+                cookies.append(int.from_bytes(payload[8:16], "little"))
+                if cookies[-1] == 19:
+                    break
+            assert cookies == sorted(set(cookies)), cookies
+            assert await s.surface_destroy(sid) == 0
+            assert s.inflight == 0
+        finally:
+            s.close()
+
+    async def run():
+        await asyncio.gather(*(one(dev) for dev in devs))
+
+    try:
+        asyncio.run(run())
+        print(f"  {len(devs)} sessions, {sum(d.requests for d in devs)} requests on one loop")
+    finally:
+        for dev in devs:
+            dev.close()
+
+
+def test_async_late_reply():
+    """A reply arriving after its request timed out is dropped, not handed out as an event."""
+    client, server = socket.socketpair()
+
+    async def run():
+        s = AsyncDrawSession()
+        s.attach(client.fileno())
+        try:
+            try:
+                await s.surface_destroy(1, timeout_ms=50)
+            except TimeoutError:
+                pass
+            else:
+                raise AssertionError("Expected TimeoutError")
+            assert s.inflight == 0
+            server.sendall(make_frame(9, [
+                make_msg(RPL_SURFACE_DESTROY, 1, struct.pack("<iI", 0, 1)),
+                make_msg(EVT_SURFACE_PRESENTED, 0, struct.pack("<IIQ", 1, 0, 7)),
+            ]))
+            assert await s.presented(timeout_ms=1000) == (1, 0, 7)
+            assert s.stray_replies == 1 and not s.event_queue
+        finally:
+            s.close()
+
+    try:
+        asyncio.run(run())
+        print("  late reply dropped, the event behind it delivered")
+    finally:
+        client.close()
+        server.close()
+
+
+def test_reader_thread():
+    """Blocking calls wake on their reply; events in between are kept."""
+    dev = FakeDevice()
+    try:
+        s = _session(dev)
+        s.start_reader()
+        msg_type, _, _ = parse_first_msg(s.hello())
+        assert msg_type == RPL_HELLO
+        s.display_open()
+        status, sid, _, _ = s.surface_create(64, 64)
+        assert status == 0
+
+        # The present's event is queued before the create reply arrives.
+        s.submit_surface_present(sid, 7)
+        status, sid2, _, _ = s.surface_create(32, 32)
+        assert status == 0 and sid2 == sid + 1
+        assert s.read_presented_event(500) == (sid, 0, 7)
+
+        start = time.monotonic()
+        for i in range(50):
+            assert s.surface_present(sid, i)[0] == 0
+        elapsed = time.monotonic() - start
+        assert s.drain_all(max_msgs=100, timeout_s=1.0) == 50
+        assert s.surface_destroy(sid) == 0
+        assert s.surface_destroy(sid) != 0
+        s.stop_reader()
+
+        # Back on the calling thread once the reader is stopped.
+        assert s.surface_destroy(sid2) == 0
+        print(f"  50 blocking presents in {elapsed * 1000:.1f}ms")
+    finally:
+        dev.close()
+
+
+def test_reader_overflow():
+    """Events beyond max_events drop the oldest and are counted."""
+    dev = FakeDevice(coalesce_events=False)
+    try:
+        s = _session(dev, reader=True, max_events=8)
+        s.start_reader()
+        s.hello()
+        s.display_open()
+        _, sid, _, _ = s.surface_create(16, 16)
+        pending = [s.submit_surface_present(sid, i) for i in range(20)]
+        assert all(p.result()[0] == 0 for p in pending)
+        s.flush()
+        deadline = time.monotonic() + 1.0
+        while s.events_dropped < 12 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(s.events) == 8 and s.events_dropped == 12, (len(s.events), s.events_dropped)
+        assert s.events_high_water == 8
+        cookies = [s.read_presented_event(100)[2] for _ in range(8)]
+        assert cookies == list(range(12, 20)), cookies
+        s.stop_reader()
+        print(f"  kept {len(cookies)} newest events, dropped {s.events_dropped}")
+    finally:
+        dev.close()
+
+
+def test_session_poller():
+    """Each session creates a surface, presents 10 times and destroys it."""
+    devs = [FakeDevice() for _ in range(40)]
+    sessions = [_session(dev, latency=LatencyRecorder()) for dev in devs]
+    state = {}
+    events = {}
+
+    def on_reply(s, pending):
+        st = state[s]
+        value = pending.result()
+        if st["sid"] is None:
+            assert value[0] == 0
+            st["sid"] = value[1]
+        elif st["presents"] < 10:
+            assert value == (0, st["sid"], st["presents"])
+            st["presents"] += 1
+        else:
+            assert value == 0
+            st["done"] = True
+            return
+        if st["presents"] < 10:
+            s.submit_surface_present(st["sid"], st["presents"])
+        else:
+            s.submit_surface_destroy(st["sid"])
+
+    def on_event(s, mt, mid, payload):
+        assert mt == EVT_SURFACE_PRESENTED
+        events[s] = events.get(s, 0) + 1
+
+    try:
+        with SessionPoller() as poller:
+            for s in sessions:
+                s.hello()
+                s.display_open()
+                state[s] = {"sid": None, "presents": 0, "done": False}
+                poller.register(s, on_reply, on_event)
+                s.submit_surface_create(16, 16)
+            assert poller.run(lambda: all(st["done"] for st in state.values()), 2000)
+            assert all(events.get(s) == 10 for s in sessions), events
+            # Replies and events the poller routes are timed like pumped ones.
+            for s in sessions:
+                rec = s.latency
+                assert rec.requests[REQ_SURFACE_PRESENT].count == 10 and rec.present.count == 10
+                assert not rec._sent and not rec._presents
+            counts = poller.readiness()
+            assert len(counts) == 40 and all(c >= 1 for c in counts.values())
+            # At most one live deadline per session is kept, not one per request.
+            assert len(poller._deadlines) <= len(sessions), len(poller._deadlines)
+            print(f"  {poller.messages} messages in {poller.wakeups} wakeups "
+                  f"({poller.selector_name})")
+    finally:
+        for dev in devs:
+            dev.close()
+
+
+def test_session_poller_timeouts():
+    """Silent sessions time out, split frames do not stop run(), handlers never read, EOF unregisters."""
+    client, server = socket.socketpair()
+    dev = FakeDevice()
+    expired = []
+    replies = []
+    try:
+        with SessionPoller() as poller:
+            quiet = DrawSession()
+            quiet.fd = client.fileno()
+            poller.register(quiet, on_reply=lambda s, p: expired.append(p))
+            p = quiet.submit_surface_destroy(1, timeout_ms=50)
+            assert poller.run(lambda: expired, 1000), "silent session never timed out"
+            assert expired == [p] and isinstance(p._error, TimeoutError) and quiet.inflight == 0
+
+            # A reply written in two halves: the first wakeup finds no whole message.
+            late = quiet.submit_surface_destroy(1, timeout_ms=2000)
+            poller.unregister(quiet)
+            poller.register(quiet, on_reply=lambda s, p: replies.append(p))
+            frame = make_frame(1, [make_msg(RPL_SURFACE_DESTROY, late.msg_id,
+                                            struct.pack("<iI", 0, 1))])
+            server.sendall(frame[:20])
+            threading.Timer(0.2, server.sendall, (frame[20:],)).start()
+            assert poller.run(lambda: replies, 1000), "partial frame ended run()"
+            assert late.result() == 0
+
+            # Handlers may not wait on the fd: a full window fails fast.
+            s = _session(dev, window=2)
+            s.hello()
+            s.display_open()
+            poller.register(s)
+            s.submit_surface_create(8, 8)
+            s.submit_surface_create(8, 8)
+            try:
+                s.submit_surface_create(8, 8)
+            except BlockingIOError:
+                pass
+            else:
+                raise AssertionError("submit into a full window should not block")
+            try:
+                s.flush()
+            except RuntimeError:
+                pass
+            else:
+                raise AssertionError("flush() should refuse to read a polled session")
+            assert poller.run(lambda: s.inflight == 0, 1000)
+
+            # A hung-up fd is unregistered instead of waking every poll.
+            server.shutdown(socket.SHUT_WR)
+            wakeups = poller.wakeups
+            assert poller.run(lambda: poller.errors, 1000)
+            assert isinstance(poller.errors[0][1], EOFError) and quiet._poller is None
+            assert poller.wakeups == wakeups + 1 and len(poller) == 1
+        print("  silent request expired, split reply delivered, full window refused, EOF dropped")
+    finally:
+        dev.close()
+        client.close()
+        server.close()
+
+
+class _AnonMapper(SurfaceMapper):
+    """SurfaceMapper over anonymous memory; FakeDevice has no MAP_SURFACE."""
+
+    def _open(self, surface_id):
+        stride = 16 * 4
+        return MappedSurface(surface_id, stride, stride * 16, mmap.mmap(-1, stride * 16))
+
+
+def test_surface_mapper():
+    """Repeated touches hit the cache; LRU and destroy release mappings."""
+    dev = FakeDevice()
+    try:
+        s = _session(dev)
+        s.mapper = _AnonMapper(s, max_bytes=3 * 1024)
+        s.hello()
+        s.display_open()
+        sids = [s.surface_create(16, 16)[1] for _ in range(4)]
+
+        for _ in range(10):
+            for sid in sids[:3]:
+                surf = s.mapped(sid)
+                surf.row(15)[:4] = b"\x01\x02\x03\x04"
+        assert (s.mapper.misses, s.mapper.hits) == (3, 27)
+        assert (surf.width, surf.height) == (16, 16)
+        assert bytes(s.mapped(sids[2]).view[15 * 64:15 * 64 + 4]) == b"\x01\x02\x03\x04"
+
+        # A fourth mapping evicts the least recently used one (sids[0]).
+        s.mapped(sids[3])
+        assert sids[0] not in s.mapper and len(s.mapper) == 3
+        assert s.mapper.evictions == 1 and s.mapper.mapped_bytes == 3 * 1024
+
+        # A mapping still referenced by a caller is parked, not torn down.
+        held = s.mapped(sids[1]).view[:8]
+        assert s.surface_destroy(sids[1]) == 0
+        assert sids[1] not in s.mapper and len(s.mapper._parked) == 1
+        held.release()
+        s.submit_surface_destroy(sids[2]).result()
+        assert sids[2] not in s.mapper
+        with s.batch() as b:
+            b.surface_destroy(sids[3])
+        assert len(s.mapper) == 0
+
+        s.mapped(sids[0])
+        s.mapper.close()
+        assert len(s.mapper) == 0 and not s.mapper._parked and s.mapper.mapped_bytes == 0
+        print(f"  {s.mapper.hits} hits, {s.mapper.misses} maps, {s.mapper.evictions} evicted")
+    finally:
+        dev.close()
+
+
+def test_swapchain():
+    """Buffers cycle only after their own cookie's event; stalls are counted."""
+    dev = FakeDevice()
+    try:
+        s = _session(dev)
+        s.mapper = _AnonMapper(s)
+        s.hello()
+        s.display_open()
+        with Swapchain(s, 16, 16, depth=3) as chain:
+            assert [b.surface_id for b in chain.buffers] == [1, 2, 3]
+            order = []
+            for frame in range(30):
+                buf = chain.acquire()
+                assert not buf.busy
+                buf.surface.row(0)[:4] = frame.to_bytes(4, "little")
+                chain.present(buf)
+                order.append(buf.surface_id)
+                assert chain.busy <= 3
+            assert order == [1, 2, 3] * 10, order
+            assert chain.frames == 30 and chain.present_errors == 0
+            # Nothing reads events between presents, so acquire had to wait
+            # at least once after the first three frames.
+            assert 0 < chain.stalls <= 27, chain.stalls
+            chain.wait_idle()
+            assert chain.busy == 0 and not s.events
+        assert dev.requests == 2 + 3 + 30 + 3
+        print(f"  30 frames on depth 3, {chain.stalls} stalls")
+
+        # With the reader thread queueing events, the chain takes only its
+        # own; another surface's events stay queued in order.
+        s = _session(dev)
+        s.mapper = _AnonMapper(s)
+        s.start_reader()
+        s.hello()
+        s.display_open()
+        _, other, _, _ = s.surface_create(16, 16)
+        with Swapchain(s, 16, 16, depth=2) as chain:
+            for frame in range(20):
+                chain.present(chain.acquire())
+                s.submit_surface_present(other, frame)
+            chain.wait_idle()
+            s.flush()
+        cookies = [int.from_bytes(p[8:16], "little") for _, _, p in s.take_events(lambda *ev: True)]
+        assert cookies and cookies == sorted(set(cookies)) and cookies[-1] == 19, cookies
+        assert not s.events
+        s.stop_reader()
+        print(f"  reader mode: {len(cookies)} events of another surface kept in order")
+    finally:
+        dev.close()
+
+
+def test_present_pacer():
+    """In-flight presents stay within the byte budget; fps is honoured."""
+    dev = FakeDevice()
+    try:
+        s = _session(dev, window=256)
+        s.hello()
+        s.display_open()
+        _, sid, _, _ = s.surface_create(16, 16)
+
+        pacer = PresentPacer(s, max_evq_bytes=10 * PRESENT_COST + PRESENTED_EVENT_BYTES,
+                             headroom=1.0)
+        assert pacer.max_inflight == 10
+        for i in range(200):
+            pacer.present(sid, i)
+            assert pacer.queued_bytes() <= pacer.max_evq_bytes
+        pacer.flush()
+        r = pacer.report()
+        assert r['frames'] == 200 and r['errors'] == 0
+        assert r['inflight_high_water'] <= 10 and r['evq_high_water'] <= pacer.max_evq_bytes
+        assert r['holds'] > 0 and r['enospc_avoided'] == r['holds']
+        assert not s.events, "presented events should have been consumed"
+
+        low = PresentPacer(s, latency_bias=1.0, max_evq_bytes=8192)
+        assert low.max_inflight == 1
+        paced = PresentPacer(s, target_fps=500)
+        for i in range(20):
+            paced.present(sid, i)
+        paced.flush()
+        fps = paced.report()['fps']
+        assert fps < 550, f"target 500 fps exceeded: {fps:.0f}"
+        print(f"  200 presents, {r['holds']} holds, high water {r['inflight_high_water']}; "
+              f"paced run {fps:.0f} fps")
+    finally:
+        dev.close()
+
+
+class _SyntheticSampler(StatsSampler):
+    """Counters advance by fixed steps per sample, 1ms of clock apart."""
+
+    def __init__(self, capacity: int):
+        super().__init__(-1, capacity)
+        self.n = 0
+
+    def _read_into(self, slot):
+        n = self.n
+        self.n += 1
+        STATS_STRUCT.pack_into(slot, 0, n, n, 0, 3 * n, 0, n, n // 10, 100 * n, 50 * n,
+                               n % 7, 0, 48 * (n % 7), 2, 4096)
+
+
+def test_stats_sampler():
+    """Rates come out right across a wrapped ring and in both decoders."""
+    sampler = _SyntheticSampler(capacity=64)
+    for _ in range(200):
+        sampler.sample()
+    assert len(sampler) == 64 and sampler.count == 200
+    # Fake a steady 1 kHz clock so the expected rates are exact.
+    base = sampler._ts[sampler.count % 64]
+    for k in range(64):
+        sampler._ts[(sampler.count + k) % 64] = base + k * 1_000_000
+
+    w = sampler.window()
+    assert w['samples'] == 64
+    assert abs(w['elapsed_s'] - 0.063) < 1e-9
+    assert abs(w['frames_per_s'] - 1000) < 1e-6
+    assert abs(w['messages_per_s'] - 3000) < 1e-6
+    assert abs(w['bytes_in_per_s'] - 100000) < 1e-3
+    assert abs(w['bytes_out_per_s'] - 50000) < 1e-3
+    assert abs(w['peak_events_dropped_per_s'] - 1000) < 1e-6
+    assert w['max_evq_bytes'] == 48 * 6 and w['max_surfaces_count'] == 2
+    assert sampler.columns()['frames_processed'][0] == 136
+
+    recent = sampler.window(seconds=0.010)
+    assert recent['samples'] == 11
+    # The ring wraps after slot 7: windows within, across and before the wrap.
+    assert sampler._indices(0.005) == list(range(2, 8))
+    assert sampler._indices(0.010) == [61, 62, 63] + list(range(8))
+    assert sampler._indices(0.060) == list(range(11, 64)) + list(range(8))
+    assert sampler._indices(1.0) == sampler._indices(None)
+
+    numpy = sys.modules.get('numpy')
+    sys.modules['numpy'] = None             # force the array('Q') decoder
+    try:
+        plain = sampler.window()
+    finally:
+        if numpy is None:
+            del sys.modules['numpy']
+        else:
+            sys.modules['numpy'] = numpy
+    assert all(abs(plain[k] - w[k]) < 1e-6 for k in w), (plain, w)
+
+    o = sampler.overhead()
+    assert o['samples'] == 200 and 0 < o['mean_ns'] <= o['max_ns']
+    print(f"  64-slot ring after 200 samples, {o['mean_ns']:.0f} ns/sample")
+
+
+class _StatsSource:
+    """Stands in for a session: get_stats() counts its calls."""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.calls = 0
+
+    def get_stats(self):
+        self.calls += 1
+        return {field: self.fd * 100 + i for i, field in enumerate(STATS_FIELDS)}
+
+
+class _FixedSysctlExporter(MetricsExporter):
+    def _read_sysctls(self):
+        return {'hw.drawfs.max_evq_bytes': 8192, 'hw.drawfs.vmobj_allocs': 12}
+
+
+def test_metrics_exporter():
+    """Scrapes are served from the snapshot without calling get_stats."""
+    a, b = _StatsSource(3), _StatsSource(4)
+    exporter = _FixedSysctlExporter(interval_s=60)
+    exporter.register(a, 'a"b')
+    exporter.register(b)
+    try:
+        exporter.start()
+        port = exporter.serve(0)
+        url = f"http://127.0.0.1:{port}/metrics"
+        for _ in range(5):
+            with urllib.request.urlopen(url) as r:
+                assert r.headers['Content-Type'] == CONTENT_TYPE
+                text = r.read().decode()
+        assert a.calls == 1 and b.calls == 1, "scrapes must not call get_stats"
+        lines = text.splitlines()
+        assert lines[-1] == "# EOF"
+        assert "drawfs_sessions 2" in lines
+        assert 'drawfs_session_frames_received_total{session="a\\"b"} 300' in lines
+        assert "# TYPE drawfs_session_evq_bytes gauge" in lines
+        assert 'drawfs_session_evq_bytes{session="4"} 411' in lines
+        assert "drawfs_max_evq_bytes 8192" in lines and "drawfs_vmobj_allocs_total 12" in lines
+
+        b.fd = None                         # closed session drops out
+        exporter.refresh()
+        assert b"drawfs_sessions 1" in exporter.snapshot() and b.calls == 1
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "drawfs.prom")
+            exporter.write_textfile(path)
+            with open(path, "rb") as f:
+                assert f.read() == exporter.snapshot()
+            assert os.listdir(tmp) == ["drawfs.prom"]
+    finally:
+        exporter.close()
+    print(f"  5 scrapes from one refresh, {len(lines)} lines")
+
+
+def test_latency_histogram():
+    """Percentiles are within 1/64 of exact; merge and dump/load preserve them."""
+    rng = random.Random(15)
+    values = [int(rng.lognormvariate(11, 1.5)) for _ in range(20000)]
+    a, b = LatencyHistogram(), LatencyHistogram()
+    for i, v in enumerate(values):
+        (a if i % 2 else b).record(v)
+    size = len(a.counts)
+    a.merge(b)
+    assert len(a.counts) == size and a.count == len(values)
+    assert a.min == min(values) and a.max == max(values)
+
+    ordered = sorted(values)
+    for p in (50, 99, 99.9):
+        exact = ordered[max(1, -(-len(values) * int(p * 10) // 1000)) - 1]
+        got = a.percentile(p)
+        assert exact <= got <= exact * (1 + 1 / 64) + 1, (p, exact, got)
+
+    small = LatencyHistogram()
+    for v in range(100):
+        small.record(v)
+    assert small.percentile(50) == 49 and small.percentile(100) == 99
+
+    restored = LatencyHistogram.load(json.loads(json.dumps(a.dump())))
+    assert restored.counts == a.counts and restored.summary() == a.summary()
+    try:
+        a.merge(LatencyHistogram(precision_bits=5))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Expected ValueError merging different layouts")
+    print(f"  {a.count} values in {size} buckets, p99 {a.percentile(99)} ns")
+
+
+def test_latency_recorder():
+    """Blocking, pipelined and batched requests and presents are all timed."""
+    dev = FakeDevice()
+    try:
+        rec = LatencyRecorder()
+        s = _session(dev, window=8, latency=rec)
+        s.hello()
+        s.display_open()
+        _, sid, _, _ = s.surface_create(16, 16)
+        s.surface_present(sid, 1)
+        s.read_presented_event()
+        pending = [s.submit_surface_present(sid, 100 + i) for i in range(20)]
+        for p in pending:
+            p.result()
+        with s.batch() as b:
+            for i in range(10):
+                b.surface_present(sid, 200 + i)
+        s.flush()
+        s.pump(100)
+        s.surface_destroy(sid)
+
+        assert rec.requests[REQ_HELLO].count == 1
+        assert rec.requests[REQ_SURFACE_CREATE].count == 1
+        assert rec.requests[REQ_SURFACE_PRESENT].count == 31
+        assert rec.requests[REQ_SURFACE_DESTROY].count == 1
+        # Coalesced SURFACE_PRESENTED events leave older cookies unmatched.
+        presents = rec.present.count
+        assert presents + rec.presents_coalesced == 31, (presents, rec.presents_coalesced)
+        assert not rec._sent and not rec._presents
+
+        # Cookies whose event never came are forgotten with their surface.
+        _, sid, _, _ = s.surface_create(16, 16)
+        rec.present_sent(sid, 300, time.perf_counter_ns())
+        s.submit_surface_destroy(sid).result()
+        assert not rec._presents and rec.presents_unmatched == 1
+
+        # Requests never answered are evicted oldest first past max_pending.
+        capped = LatencyRecorder(max_pending=4)
+        for mid in range(10):
+            capped.request_sent(mid, REQ_SURFACE_PRESENT, mid)
+        capped.reply_received(9, 19)
+        capped.reply_received(0, 10)
+        assert list(capped._sent) == [6, 7, 8] and capped.requests_evicted == 6
+        assert capped.requests[REQ_SURFACE_PRESENT].count == 1
+
+        other = LatencyRecorder.load(json.loads(json.dumps(rec.dump())))
+        merged = LatencyRecorder().merge(rec).merge(other)
+        assert merged.present.count == 2 * presents
+        report = merged.report()
+        assert report['REQ_SURFACE_PRESENT']['count'] == 62
+        assert report['present']['p99.9'] >= report['present']['p50'] > 0
+    finally:
+        dev.close()
+    print(f"  31 presents timed to reply, {presents} to SURFACE_PRESENTED")
+    print(merged.format_report())
+
+
+def test_surface_pool():
+    """Released surfaces are reused; idle ones are trimmed LRU; bad releases raise."""
+    dev = FakeDevice()
+    try:
+        s = _session(dev)
+        s.hello()
+        s.display_open()
+        pool = SurfacePool(s, max_surfaces=3)
+        a1, a2, b = pool.acquire(32, 32), pool.acquire(32, 32), pool.acquire(64, 64)
+        for surf in (a1, b, a2):
+            pool.release(surf)
+        assert pool.idle == 3 and len(dev._surfaces) == 3
+        stranger = PooledSurface(99, a1.width, a1.height, a1.fmt, a1.stride, a1.total)
+        for bad, exc in ((a1, RuntimeError), (stranger, ValueError)):
+            try:
+                pool.release(bad)
+            except exc:
+                pass
+            else:
+                raise AssertionError(f"release of {bad.surface_id} should raise {exc.__name__}")
+        assert pool.idle == 3 and pool.in_use == 0 and pool.in_use_bytes == 0
+
+        again = pool.acquire(32, 32)
+        assert again.surface_id == a2.surface_id, "most recently released comes back first"
+        assert pool.hits == 1 and pool.misses == 3
+
+        # A 48x48 needs a fourth surface: the LRU idle one (a1) makes room.
+        c = pool.acquire(48, 48)
+        assert pool.trimmed == 1 and a1.surface_id not in dev._surfaces
+        d = pool.acquire(64, 48)
+        assert b.surface_id not in dev._surfaces and pool.idle == 0
+        assert len(dev._surfaces) == 3
+
+        # Byte limit: 25600 idle + 6400 new is over 30000, so `again` goes.
+        for surf in (again, c, d):
+            pool.release(surf)
+        pool.max_surfaces = 10
+        pool.max_session_bytes = 30000
+        e = pool.acquire(40, 40)
+        assert again.surface_id not in dev._surfaces
+        assert pool.in_use_bytes + pool.idle_bytes <= pool.max_session_bytes
+        pool.release(e)
+
+        for _ in range(20):
+            pool.release(pool.acquire(48, 48))
+        r = pool.report()
+        assert r['hits'] == 21 and r['creates_saved'] == 21 and r['in_use'] == 0
+        assert r['trimmed'] == 3
+        pool.close()
+        assert not dev._surfaces and pool.idle == 0
+        print(f"  hit rate {r['hit_rate']:.2f}, {r['trimmed']} trimmed to stay in limits")
+    finally:
+        dev.close()
+
+
+class _FakeSessionPool(SessionPool):
+    """Pools sessions on FakeDevices; stats come from the fake's state."""
+
+    def __init__(self, *args, fail_opens: int = 0, **kwargs):
+        self.devices = {}
+        self.fail_opens = fail_opens
+        super().__init__(*args, **kwargs)
+
+    def _open(self):
+        if self.fail_opens:
+            self.fail_opens -= 1
+            raise RuntimeError("warm-up helper failed")
+        dev = FakeDevice()
+        s = _session(dev)
+        self.devices[id(s)] = dev
+        return s
+
+    def _close(self, session):
+        session.fd = None
+        self.devices.pop(id(session)).close()
+
+    def _stats(self, session):
+        dev = self.devices[id(session)]
+        return {'surfaces_count': len(dev._surfaces), 'evq_bytes': 0, 'inbuf_bytes': 0}
+
+
+def test_session_pool():
+    """Pooled sessions skip HELLO/DISPLAY_OPEN; dirty sessions are not reused."""
+    with _FakeSessionPool(size=3, fail_opens=1) as pool:
+        deadline = time.monotonic() + 2.0
+        while pool.idle < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert pool.idle == 3, "refill thread did not warm the pool"
+        assert pool.open_errors == 1 and isinstance(pool.last_error, RuntimeError)
+
+        with pool.session() as s:
+            requests = pool.devices[id(s)].requests
+            status, sid, _, _ = s.surface_create(16, 16)
+            assert status == 0, "pooled session should already have a display open"
+            assert requests == 2, "HELLO and DISPLAY_OPEN happened before acquire"
+            s.surface_destroy(sid)
+        assert pool.reused == 1
+
+        dirty = pool.acquire()
+        dirty.surface_create(16, 16)
+        assert not pool.release(dirty), "session holding a surface must not be reused"
+        unread = pool.acquire()
+        unread.decoder.feed(make_frame(1, [make_msg(RPL_SURFACE_DESTROY, 9, bytes(8))]))
+        assert not pool.release(unread), "session with a buffered reply must not be reused"
+        assert pool.discarded == 2
+
+        taken = [pool.acquire(timeout_s=2.0) for _ in range(5)]
+        for s in taken:
+            pool.release(s)
+        r = pool.report()
+        assert r['hits'] >= 3 and r['hits'] + r['misses'] == 8
+        assert pool.idle <= 3 and len(pool.devices) <= 3 + 1
+    assert not pool.devices, "close() should close every idle session"
+    print(f"  {r['hits']} hits, {r['misses']} misses, {r['opened']} opened, "
+          f"{r['discarded']} discarded")
+
+
+def test_traffic_recorder():
+    """Blocking, pipelined, batched and reader-thread traffic all reach the capture."""
+    dev = FakeDevice()
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "session.dfcap")
+    try:
+        rec = TrafficRecorder(path, session_id=7)
+        s = _session(dev, recorder=rec)
+        s.hello()
+        s.display_open()
+        _, sid, _, _ = s.surface_create(32, 32)
+        pending = [s.submit_surface_present(sid, i) for i in range(10)]
+        s.flush()
+        with s.batch() as b:
+            handles = [b.surface_present(sid, 100 + i) for i in range(5)]
+        assert all(h.result()[0] == 0 for h in handles)
+        s.start_reader()
+        s.surface_present(sid, 200)
+        s.stop_reader()
+        s.drain_all(timeout_s=0.2)
+        s.surface_destroy(sid)
+        rec.close()
+
+        r = rec.report()
+        summary = f"{r['outbound']} frames out, {r['inbound']} in"
+        assert r['outbound'] == 3 + 10 + 1 + 1 + 1, r      # one batch frame for 5 presents
+        assert r['inbound'] == s.decoder.frames, (r, s.decoder.frames)
+        assert r['written'] == r['outbound'] + r['inbound'] and rec.dropped == 0
+
+        with CaptureReader(path) as cap:
+            assert len(cap) == r['written']
+            for direction in (TO_KERNEL, FROM_KERNEL):
+                ts = [x.ts_ns for x in cap if x.direction == direction]
+                assert ts == sorted(ts), "each direction is written oldest first"
+            assert sum(x.direction == TO_KERNEL for x in cap) == r['outbound']
+            ordered = [x.ts_ns for x in cap.between(cap.start_ns, cap.end_ns + 1)]
+            assert len(ordered) == len(cap) and ordered == sorted(ordered)
+            assert {x.session_id for x in cap} == {7}
+            create = cap.by_msg_id(3, session_id=7)
+            assert [x.direction for x in create] == [TO_KERNEL, FROM_KERNEL]
+            assert bytes(create[0].frame[FH_SIZE:FH_SIZE + 2]) == REQ_SURFACE_CREATE.to_bytes(2, "little")
+            del create
+    finally:
+        dev.close()
+        shutil.rmtree(tmp)
+
+    # A ring that is never drained fills up and drops instead of blocking.
+    tmp = tempfile.mkdtemp()
+    try:
+        rec = TrafficRecorder(os.path.join(tmp, "drop.dfcap"), ring_bytes=4096, interval_s=3600)
+        for i in range(100):
+            rec.outbound(b"x" * 62)                 # 84-byte records: 48 fit in 4096
+        rec.outbound(b"x" * 8192)
+        r = rec.report()
+        assert rec.dropped == 53 and r['oversize'] == 1 and r['ring_high_water'] == 48 * 84
+        rec.close()
+        with CaptureReader(os.path.join(tmp, "drop.dfcap")) as cap:
+            assert rec.written == len(cap) == 48
+
+        # Records of varying size wrap around a small ring, drained as they go.
+        rec = TrafficRecorder(os.path.join(tmp, "wrap.dfcap"), ring_bytes=4096, interval_s=3600)
+        frames = [bytes([i & 0xff]) * (1 + (i * 37) % 301) for i in range(400)]
+        for i, frame in enumerate(frames):
+            (rec.outbound if i % 3 else rec.inbound)(frame)
+            if i % 7 == 6:
+                rec._drain()
+        rec.close()
+        assert rec.dropped == 0
+        with CaptureReader(os.path.join(tmp, "wrap.dfcap")) as cap:
+            got = [bytes(x.frame) for x in cap.between(cap.start_ns, cap.end_ns + 1)]
+        assert got == frames, "wrapped records come back intact and in order"
+    finally:
+        shutil.rmtree(tmp)
+    print(f"  {summary}, 53 dropped on a full ring (1 oversize)")
+
+
+
+def test_replay():
+    """A recorded session replays with remapped surface_ids and matching replies."""
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "replay.dfcap")
+    try:
+        dev = FakeDevice()
+        try:
+            rec = TrafficRecorder(path, session_id=3)
+            s = _session(dev, recorder=rec)
+            s.hello()
+            s.display_open()
+            _, a, _, _ = s.surface_create(32, 32)
+            _, b, _, _ = s.surface_create(64, 64)
+            for p in [s.submit_surface_present(a if i % 2 else b, i) for i in range(20)]:
+                p.result()
+            time.sleep(0.05)
+            s.surface_destroy(a)
+            assert s.surface_present(a, 99)[0] != 0, "present after destroy fails"
+            s.surface_destroy(b)
+            s.drain_all(timeout_s=0.1)
+            rec.close()
+        finally:
+            dev.close()
+
+        reports = {}
+        with CaptureReader(path) as cap:
+            for pacing, speed in (("none", 1.0), ("original", 1.0), ("scaled", 10.0)):
+                dev = FakeDevice()
+                try:
+                    # Surfaces created before the replay shift the ids the device hands out.
+                    s = _session(dev)
+                    s.hello()
+                    s.display_open()
+                    s.surface_create(16, 16)
+                    s.surface_create(16, 16)
+                    replayer = Replayer(cap, pacing=pacing, speed=speed)
+                    r = replayer.run(dev.fd)
+                finally:
+                    dev.close()
+                assert r['session_id'] == 3
+                assert r['requests'] == 2 + 2 + 20 + 3, r
+                assert r['matched'] == r['requests'] and r['mismatched'] == 0, r['mismatches']
+                assert r['missing'] == 0 and r['unrecorded'] == 0
+                assert r['remapped'] == 2 and replayer.surface_map == {a: 3, b: 4}
+                # Coalescing keeps at least the newest event per surface.
+                assert 2 <= r['events'] <= 20 and 2 <= r['recorded_events'] <= 20, r
+                assert r['latency']['REQ_SURFACE_PRESENT']['replayed_count'] == 21
+                reports[pacing] = r
+        span = reports['none']['recorded_elapsed_s']
+        assert span >= 0.05 and reports['original']['elapsed_s'] >= span * 0.95
+        assert reports['scaled']['elapsed_s'] < reports['original']['elapsed_s']
+
+        # A reply that differs from the recording is reported.
+        bad = os.path.join(tmp, "bad.dfcap")
+        with CaptureWriter(bad) as cap:
+            cap.write(TO_KERNEL, 0, make_frame(1, [make_msg(REQ_SURFACE_PRESENT, 5,
+                                                            SURFACE_PRESENT_REQ.pack(9, 0, 1))]))
+            cap.write(FROM_KERNEL, 0, make_frame(1, [make_msg(RPL_SURFACE_PRESENT, 5,
+                                                              SURFACE_PRESENT_RPL.pack(0, 9, 1))]))
+        dev = FakeDevice()
+        try:
+            with CaptureReader(bad) as cap:
+                r = Replayer(cap, pacing="none").run(dev.fd)
+        finally:
+            dev.close()
+        assert r['mismatched'] == 1 and r['matched'] == 0
+        assert r['mismatches'][0]['request'] == "REQ_SURFACE_PRESENT", r['mismatches']
+    finally:
+        shutil.rmtree(tmp)
+    print(f"  {reports['none']['requests']} requests: {reports['none']['ops_per_s']:.0f} ops/s "
+          f"unpaced, {reports['original']['elapsed_s']:.3f}s at original pacing "
+          f"({span:.3f}s recorded)")
+
+
+def main():
+    tests = [
+        ("Pipelined window", test_pipelined_window),
+        ("Pipelined deadline", test_pipelined_deadline),
+        ("Blocking after pipeline", test_blocking_after_pipeline),
+        ("Batch", test_batch),
+        ("Batch write failure", test_batch_write_failure),
+        ("Async sessions", test_async_sessions),
+        ("Async late reply", test_async_late_reply),
+        ("Reader thread", test_reader_thread),
+        ("Reader overflow", test_reader_overflow),
+        ("Session poller", test_session_poller),
+        ("Session poller timeouts", test_session_poller_timeouts),
+        ("Surface mapper", test_surface_mapper),
+        ("Swapchain", test_swapchain),
+        ("Present pacer", test_present_pacer),
+        ("Stats sampler", test_stats_sampler),
+        ("Metrics exporter", test_metrics_exporter),
+        ("Latency histogram", test_latency_histogram),
+        ("Latency recorder", test_latency_recorder),
+        ("Surface pool", test_surface_pool),
+        ("Session pool", test_session_pool),
+        ("Traffic recorder", test_traffic_recorder),
+        ("Replay", test_replay),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_fn in tests:
+        try:
+            print(f"[TEST] {name}")
+            test_fn()
+            print(f"[PASS] {name}\n")
+            passed += 1
+        except Exception as e:
+            print(f"[FAIL] {name}: {e}\n")
+            failed += 1
+
+    print(f"Results: {passed} passed, {failed} failed")
+    if failed > 0:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
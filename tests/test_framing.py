@@ -0,0 +1,606 @@
+#!/usr/bin/env python3
+"""
+test_framing.py - Client-side frame encoding tests
+
+These tests exercise the client helpers only and do not need /dev/draw.
+
+Tests:
+  - FrameBuilder output matches make_frame
+  - FrameBuilder reuse across frames and buffer growth
+  - FrameBuilder packs several frames back-to-back
+  - FrameDecoder output does not depend on chunking
+  - FrameDecoder rejects malformed frames with kernel error codes
+  - Read helpers keep later messages of a frame
+  - Bulk drain empties the queue with one select
+  - Payload codecs round-trip and describe every message type
+  - Capture scanning splits frames and resyncs on DRW1 after corruption
+  - .dfcap captures index records by time, frame_id and msg_id
+  - Capture summaries pair replies by session and msg_id in bounded memory
+  - Columnar decode matches per-message decoding, with side columns
+  - Parallel summaries match the serial pass for any section size or worker count
+"""
+
+import io
+import os
+import struct
+import tempfile
+import time
+from drawfs_test import (
+    FrameBuilder, FrameDecoder, FrameError, make_frame, make_msg,
+    parse_frame_header, parse_msg_header, read_msg, drain_until, drain_batch, drain_all,
+    RPL_SURFACE_CREATE, RPL_SURFACE_PRESENT, EVT_SURFACE_PRESENTED,
+    ERR_INVALID_FRAME, ERR_INVALID_MSG, ERR_UNSUPPORTED_VERSION,
+    REQ_HELLO, REQ_DISPLAY_LIST, REQ_SURFACE_CREATE, REQ_SURFACE_DESTROY,
+    REQ_SURFACE_PRESENT, FMT_XRGB8888, HELLO_REQ, SURFACE_PRESENT_REQ, FH_SIZE, MH_SIZE,
+    CODECS, MSG_NAMES, RPL_ERROR, RPL_DISPLAY_LIST, DISPLAY_INFO, ERR_INVALID_HANDLE,
+)
+
+
+def test_builder_matches_make_frame():
+    """FrameBuilder encodes byte-for-byte the same frame as make_frame."""
+    fb = FrameBuilder()
+    fb.begin(7)
+    fb.add_packed(REQ_HELLO, 1, HELLO_REQ, 1, 0, 0, 65536)
+    fb.add_msg(REQ_DISPLAY_LIST, 2)
+    fb.add_msg(0x7777, 3, b"\x01\x02\x03")  # unaligned payload gets padded
+    fb.add_packed(REQ_SURFACE_PRESENT, 4, SURFACE_PRESENT_REQ, 5, 0, 0x1234)
+    fb.add_surface_create(5, 64, 32)
+    fb.add_surface_destroy(6, 9)
+    fb.add_surface_present(7, 5, 0x1234)
+    built = bytes(fb.finish())
+
+    expected = make_frame(7, [
+        make_msg(REQ_HELLO, 1, struct.pack("<HHII", 1, 0, 0, 65536)),
+        make_msg(REQ_DISPLAY_LIST, 2, b""),
+        make_msg(0x7777, 3, b"\x01\x02\x03"),
+        make_msg(REQ_SURFACE_PRESENT, 4, struct.pack("<IIQ", 5, 0, 0x1234)),
+        make_msg(REQ_SURFACE_CREATE, 5, struct.pack("<IIII", 64, 32, FMT_XRGB8888, 0)),
+        make_msg(REQ_SURFACE_DESTROY, 6, struct.pack("<I", 9)),
+        make_msg(REQ_SURFACE_PRESENT, 7, struct.pack("<IIQ", 5, 0, 0x1234)),
+    ])
+    assert built == expected, "FrameBuilder output differs from make_frame"
+    assert fb.msg_count == 7
+    print(f"  {len(built)} byte frame matches make_frame")
+
+
+def test_builder_reuse_and_growth():
+    """Reused builders zero their padding and grow past the initial capacity."""
+    fb = FrameBuilder(capacity=32)
+
+    fb.begin(1)
+    fb.add_msg(0x7777, 1, b"\xff" * 11)
+    first = fb.finish()
+    first_copy = bytes(first)
+
+    # Second frame overwrites the same bytes with a shorter payload; the
+    # padding must not leak 0xff from the previous frame.
+    fb.begin(2)
+    fb.add_msg(0x7777, 2, b"\xaa")
+    assert bytes(fb.finish()) == make_frame(2, [make_msg(0x7777, 2, b"\xaa")])
+
+    # Growing keeps earlier views intact.
+    fb.begin(3)
+    held = fb.finish()
+    for i in range(100):
+        fb.add_packed(REQ_SURFACE_PRESENT, i, SURFACE_PRESENT_REQ, 1, 0, i)
+    frame = fb.finish()
+    assert len(held) == FH_SIZE
+    assert len(frame) == FH_SIZE + 100 * (MH_SIZE + SURFACE_PRESENT_REQ.size)
+
+    _, _, hdr_bytes, frame_bytes, frame_id = parse_frame_header(frame)
+    assert (hdr_bytes, frame_bytes, frame_id) == (FH_SIZE, len(frame), 3)
+    msg_size = MH_SIZE + SURFACE_PRESENT_REQ.size
+    msg_type, _, _, msg_id, _ = parse_msg_header(frame, FH_SIZE + 99 * msg_size)
+    assert (msg_type, msg_id) == (REQ_SURFACE_PRESENT, 99)
+    assert first_copy[:4] == b"DRW1"
+    print(f"  grew to {len(frame)} bytes over 100 messages")
+
+
+def test_builder_multi_frame():
+    """next_frame() closes a frame and starts the next one in the same buffer."""
+    fb = FrameBuilder(capacity=16)
+    fb.begin(1)
+    fb.add_surface_present(1, 5, 100)
+    fb.add_surface_present(2, 5, 101)
+    fb.next_frame(2)
+    assert fb.frame_len == FH_SIZE
+    fb.add_surface_destroy(3, 5)
+    data = bytes(fb.finish())
+
+    expected = make_frame(1, [
+        make_msg(REQ_SURFACE_PRESENT, 1, struct.pack("<IIQ", 5, 0, 100)),
+        make_msg(REQ_SURFACE_PRESENT, 2, struct.pack("<IIQ", 5, 0, 101)),
+    ]) + make_frame(2, [make_msg(REQ_SURFACE_DESTROY, 3, struct.pack("<I", 5))])
+    assert data == expected, "multi-frame output differs from make_frame"
+    print(f"  two frames in {len(data)} bytes")
+
+
+def _reply_stream():
+    """Three frames: a create reply, then a present reply + event in one frame."""
+    f1 = make_frame(1, [make_msg(RPL_SURFACE_CREATE, 10, struct.pack("<iIII", 0, 1, 256, 16384))])
+    f2 = make_frame(2, [
+        make_msg(RPL_SURFACE_PRESENT, 11, struct.pack("<iIQ", 0, 1, 0xabc)),
+        make_msg(EVT_SURFACE_PRESENTED, 0, struct.pack("<IIQ", 1, 0, 0xabc)),
+    ])
+    f3 = make_frame(3, [make_msg(0x7777, 12, b"\x01\x02\x03")])
+    return f1 + f2 + f3
+
+
+def test_decoder_chunking():
+    """Every message is decoded regardless of how the stream is chunked."""
+    stream = _reply_stream()
+    expected = [
+        (1, RPL_SURFACE_CREATE, 10, struct.pack("<iIII", 0, 1, 256, 16384)),
+        (2, RPL_SURFACE_PRESENT, 11, struct.pack("<iIQ", 0, 1, 0xabc)),
+        (2, EVT_SURFACE_PRESENTED, 0, struct.pack("<IIQ", 1, 0, 0xabc)),
+        (3, 0x7777, 12, b"\x01\x02\x03\x00"),
+    ]
+
+    for chunk in (1, 3, 7, 16, len(stream)):
+        # Small capacity forces compaction and growth along the way.
+        dec = FrameDecoder(capacity=24)
+        got = []
+        for off in range(0, len(stream), chunk):
+            dec.feed(stream[off:off + chunk])
+            for fh, mh, payload in dec:
+                got.append((fh[4], mh[0], mh[3], bytes(payload)))
+        assert got == expected, f"chunk={chunk}: {got}"
+        assert len(dec) == 0
+        assert (dec.frames, dec.messages) == (3, 4)
+    print(f"  decoded {len(expected)} messages at chunk sizes 1..{len(stream)}")
+
+
+def test_decoder_validation():
+    """Malformed frames raise FrameError with the kernel's error codes."""
+    good = make_frame(1, [make_msg(0x7777, 1, b"abcd")])
+    cases = [
+        ("magic", b"XXXX" + good[4:], ERR_INVALID_FRAME, 0),
+        ("version", good[:4] + struct.pack("<H", 0x0200) + good[6:], ERR_UNSUPPORTED_VERSION, 4),
+        ("header_bytes", good[:6] + struct.pack("<H", 20) + good[8:], ERR_INVALID_FRAME, 6),
+        ("frame_bytes align", good[:8] + struct.pack("<I", 34) + good[12:], ERR_INVALID_FRAME, 8),
+        ("frame_bytes short", good[:8] + struct.pack("<I", 8) + good[12:], ERR_INVALID_FRAME, 8),
+        ("msg_bytes", good[:20] + struct.pack("<I", 4) + good[24:], ERR_INVALID_MSG, 16),
+    ]
+    for name, data, code, offset in cases:
+        dec = FrameDecoder()
+        dec.feed(data)
+        try:
+            dec.next_msg()
+        except FrameError as e:
+            assert (e.err_code, e.err_offset) == (code, offset), f"{name}: {e.err_code}/{e.err_offset}"
+        else:
+            raise AssertionError(f"{name}: expected FrameError")
+        # The decoder recovers for the next well-formed frame.
+        dec.feed(good)
+        _, mh, payload = dec.next_msg()
+        assert bytes(payload) == b"abcd", name
+    print(f"  {len(cases)} malformed frames rejected")
+
+
+def test_read_helpers_with_decoder():
+    """read_msg and drain_until return later messages from the same frame."""
+    rfd, wfd = os.pipe()
+    try:
+        os.write(wfd, _reply_stream())
+        dec = FrameDecoder()
+        mt, mid, _ = read_msg(rfd, 500, dec)
+        assert (mt, mid) == (RPL_SURFACE_CREATE, 10)
+        mid, payload = drain_until(rfd, EVT_SURFACE_PRESENTED, 500, decoder=dec)
+        assert struct.unpack_from("<IIQ", payload, 0) == (1, 0, 0xabc)
+        mt, mid, payload = read_msg(rfd, 500, dec)
+        assert (mt, mid, payload) == (0x7777, 12, b"\x01\x02\x03\x00")
+        try:
+            read_msg(rfd, 50, dec)
+        except TimeoutError:
+            pass
+        else:
+            raise AssertionError("Expected TimeoutError on empty stream")
+    finally:
+        os.close(rfd)
+        os.close(wfd)
+    print("  event behind a reply in the same frame was delivered")
+
+
+def test_drain_batch():
+    """One bulk drain returns every queued frame and leaves the fd blocking."""
+    rfd, wfd = os.pipe()
+    try:
+        assert drain_batch(rfd, 10) == []
+        stream = _reply_stream()
+        for _ in range(50):
+            os.write(wfd, stream)
+        dec = FrameDecoder(capacity=64)
+        batch = drain_batch(rfd, 500, dec)
+        assert len(batch) == 200, len(batch)
+        assert [m[0] for m in batch[:4]] == [RPL_SURFACE_CREATE, RPL_SURFACE_PRESENT,
+                                             EVT_SURFACE_PRESENTED, 0x7777]
+        assert os.get_blocking(rfd), "fd must be restored to blocking"
+        assert drain_batch(rfd, 0, dec) == []
+
+        os.write(wfd, stream * 3)
+        assert drain_all(rfd, max_msgs=100, timeout_s=1.0) == 12
+    finally:
+        os.close(rfd)
+        os.close(wfd)
+    print(f"  {len(batch)} messages in one drain")
+
+
+def test_payload_codecs():
+    """Every codec round-trips through FrameBuilder.add and formats its fields."""
+    assert set(CODECS) <= set(MSG_NAMES)
+    fb = FrameBuilder()
+    fb.begin(1)
+    expected = {}
+    for msg_id, (msg_type, codec) in enumerate(sorted(CODECS.items()), 1):
+        values = tuple(range(1, len(codec.fields) + 1))
+        fb.add(msg_type, msg_id, *values)
+        expected[msg_id] = (msg_type, values)
+
+    dec = FrameDecoder()
+    dec.feed(fb.finish())
+    seen = 0
+    for _, mh, payload in dec:
+        msg_type, values = expected[mh[3]]
+        codec = CODECS[msg_type]
+        assert mh[0] == msg_type
+        assert codec.decode(payload) == values, (codec.name, codec.decode(payload))
+        assert codec.as_dict(payload) == dict(zip(codec.fields, values))
+        assert codec.encode(*values) == bytes(payload[:codec.size])
+        assert codec.format(payload), codec.name
+        assert codec.format(payload[:codec.size - 1]) == []
+        seen += 1
+    assert seen == len(CODECS)
+
+    err = CODECS[RPL_ERROR].format(CODECS[RPL_ERROR].encode(ERR_INVALID_HANDLE, 0, 16))
+    assert err[0] == f"err_code: {ERR_INVALID_HANDLE} (INVALID_HANDLE)", err
+    listing = (CODECS[RPL_DISPLAY_LIST].encode(0, 1)
+               + DISPLAY_INFO.pack(1, 1920, 1080, 60000, 0))
+    assert CODECS[RPL_DISPLAY_LIST].format(listing)[-1] == \
+        "  display[0]: id=1 1920x1080 @ 60.0Hz flags=0x0"
+    print(f"  {seen} message types round-tripped")
+
+
+def test_capture_scanning():
+    """File, buffer and stream scanning agree, skip garbage and keep memory fixed."""
+    from drawfs_dump import (FrameScanner, iter_buffer_frames, iter_file_frames,
+                             iter_stream_frames, FRAME, SKIPPED)
+
+    fb = FrameBuilder()
+    good = []
+    for i in range(20000):
+        fb.begin(i)
+        fb.add_surface_present(i, 1, i)
+        if i % 3 == 0:
+            fb.add_msg(0x7777, i, b"\x01\x02\x03")
+        good.append(bytes(fb.finish()))
+    # Corrupt the stream: garbage with a stray partial magic, a frame with a
+    # bad header_bytes, and a truncated frame at the end.
+    bad_hdr = bytearray(good[2])
+    bad_hdr[6] = 20
+    capture = (good[0] + b"junkDRW" + good[1] + bytes(bad_hdr)
+               + b"".join(good[3:]) + good[0][:24])
+
+    def collect(frames):
+        return [(off, bytes(view), kind) for off, view, kind in frames]
+
+    scanner = FrameScanner()
+    from_buffer = collect(iter_buffer_frames(capture, scanner))
+    frames = [f for f in from_buffer if f[2] == FRAME]
+    skipped = [f for f in from_buffer if f[2] == SKIPPED]
+    assert [f[1] for f in frames[:-1]] == [good[0], good[1]] + good[3:]
+    assert frames[-1][1] == good[0][:24], "truncated tail is still dumped"
+    assert [(f[0], len(f[1])) for f in skipped] == [
+        (len(good[0]), 7), (len(good[0]) + 7 + len(good[1]), len(good[2]))], skipped
+    assert scanner.resyncs == 2 and scanner.frames == len(good)
+
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(capture)
+        f.flush()
+        assert collect(iter_file_frames(f.name)) == from_buffer
+        # Stopping early releases the mapping.
+        for _ in iter_file_frames(f.name):
+            break
+
+    stream = FrameScanner()
+    assert collect(iter_stream_frames(io.BytesIO(capture), stream, 4096)) == from_buffer
+    assert (stream.resyncs, stream.skipped_bytes) == (scanner.resyncs, scanner.skipped_bytes)
+    print(f"  {scanner.frames} frames, {scanner.resyncs} resyncs, "
+          f"{scanner.skipped_bytes} bytes skipped over {len(capture)} bytes")
+
+
+def test_dfcap_index():
+    """Indexed lookups match a scan; unfinished captures are re-indexed; wall_ns() converts."""
+    from drawfs_capture import CaptureWriter, CaptureReader, TO_KERNEL, FROM_KERNEL
+
+    fb = FrameBuilder()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "run.dfcap")
+        with CaptureWriter(path, buffer_bytes=4096) as cap:
+            for i in range(3000):
+                session = i % 3
+                fb.begin(i)
+                fb.add_surface_present(i, 1, i)
+                cap.write(TO_KERNEL, session, fb.finish(), ts_ns=1000 + 10 * i)
+                fb.begin(i)
+                fb.add_msg(RPL_SURFACE_PRESENT, i, struct.pack("<iIQ", 0, 1, i))
+                fb.add_msg(EVT_SURFACE_PRESENTED, 0, struct.pack("<IIQ", 1, 0, i))
+                # One reply recorded out of order exercises the time sort.
+                cap.write(FROM_KERNEL, session, fb.finish(), ts_ns=5 if i == 7 else 1005 + 10 * i)
+            cap.write(FROM_KERNEL, 9, b"not a frame", ts_ns=10 ** 9)
+        assert cap.records == 6001
+
+        with CaptureReader(path) as r:
+            assert r.indexed and len(r) == 6001
+            records = list(r)
+            assert records[1].frame.tobytes()[:4] == b"DRW1"
+            assert len(records[-1].frame) == 11 and records[-1].session_id == 9
+            assert r.start_ns == 5 and r.end_ns == 10 ** 9
+            assert r.at_time(0).offset == records[15].offset      # reply 7, stamped 5
+            assert r.at_time(1000 + 10 * 2000).ts_ns == 1000 + 10 * 2000
+            assert r.at_time(10 ** 9 + 1) is None
+            assert [x.ts_ns for x in r.between(1000, 1030)] == [1000, 1005, 1010, 1015, 1020, 1025]
+
+            hits = r.by_msg_id(1234)
+            assert [(x.direction, x.session_id) for x in hits] == [(TO_KERNEL, 1), (FROM_KERNEL, 1)]
+            assert r.by_msg_id(1234, session_id=0) == []
+            assert len(r.by_msg_id(0)) == 3000 + 1      # every event frame, plus request 0
+            assert [x.ts_ns for x in r.by_frame_id(42, session_id=0)] == [1420, 1425]
+            del records, hits
+
+        # Drop the index and trailer and tear the last record.
+        with open(path, "rb") as f:
+            data = f.read()
+        torn = os.path.join(tmp, "torn.dfcap")
+        with open(torn, "wb") as f:
+            f.write(data[:data.index(b"not a frame") + 4])
+        with CaptureReader(torn) as r:
+            assert not r.indexed and len(r) == 6000
+            assert [x.ts_ns for x in r.by_frame_id(42, session_id=0)] == [1420, 1425]
+            assert r.at_time(1000 + 10 * 2999 + 1).ts_ns == 1005 + 10 * 2999
+
+        # Records stamped by the writer convert to wall-clock time.
+        before = time.time_ns()
+        live = os.path.join(tmp, "live.dfcap")
+        with CaptureWriter(live, background=False) as cap:
+            fb.begin(1)
+            fb.add_surface_present(1, 1, 1)
+            cap.write(TO_KERNEL, 0, fb.finish())
+        after = time.time_ns()
+        with CaptureReader(live) as r:
+            assert r.wall_ns(r.start_mono_ns) == r.start_wall_ns
+            assert before <= r.wall_ns(next(iter(r)).ts_ns) <= after + 10 ** 9
+    print("  6001 records, indexed and rebuilt lookups agree")
+
+
+def test_capture_summary():
+    """--summary counts, pairs and times every request, with bounded pending state."""
+    from drawfs_capture import CaptureWriter, TO_KERNEL, FROM_KERNEL
+    from drawfs_dump import (summarize_capture, summarize_frames, iter_buffer_frames,
+                             CaptureSummary)
+
+    fb = FrameBuilder()
+    raw = bytearray()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "run.dfcap")
+        with CaptureWriter(path, background=False) as cap:
+            for i in range(1000):
+                for session, latency in ((0, 2000), (1, 5000)):
+                    t = 10000 * i
+                    fb.begin(i)
+                    fb.add_surface_present(i, 1, i)
+                    request = bytes(fb.finish())
+                    fb.begin(i)
+                    fb.add_msg(RPL_SURFACE_PRESENT, i, struct.pack("<iIQ", 0, 1, i))
+                    if i % 2 == 0:      # every other event coalesced away
+                        fb.add_msg(EVT_SURFACE_PRESENTED, 0, struct.pack("<IIQ", 1, 0, i))
+                    reply = bytes(fb.finish())
+                    # Some replies land in the file ahead of their request.
+                    order = ((FROM_KERNEL, reply, t + latency), (TO_KERNEL, request, t))
+                    for direction, frame, ts in (order if i % 10 == 0 else order[::-1]):
+                        cap.write(direction, session, frame, ts_ns=ts)
+                    if session == 0:
+                        raw += request + reply
+            fb.begin(5000)
+            fb.add_surface_destroy(5000, 77)
+            cap.write(TO_KERNEL, 0, fb.finish(), ts_ns=10 ** 8)
+            fb.begin(5000)
+            fb.add_msg(RPL_ERROR, 5000, struct.pack("<III", ERR_INVALID_HANDLE, 0, 16))
+            cap.write(FROM_KERNEL, 0, fb.finish(), ts_ns=10 ** 8 + 100)
+            fb.begin(5001)
+            fb.add_surface_destroy(5001, 78)
+            cap.write(TO_KERNEL, 0, fb.finish(), ts_ns=10 ** 8 + 200)
+
+        r = summarize_capture(path).report()
+        assert r['frames'] == {'client_to_kernel': 2002, 'kernel_to_client': 2001}, r['frames']
+        assert r['messages']['REQ_SURFACE_PRESENT'] == 2000
+        assert r['messages']['EVT_SURFACE_PRESENTED'] == 1000
+        assert r['paired'] == 2001 and r['unanswered'] == 1 and r['orphaned_replies'] == 0
+        present = r['latency_ns']['REQ_SURFACE_PRESENT']
+        assert present['count'] == 2000 and present['min'] == 2000 and present['max'] == 5000
+        assert abs(present['p50'] - 2000) <= 2000 * 0.02 and present['p99'] == 5000, present
+        assert r['errors'] == {'INVALID_HANDLE': 1}
+        assert r['presents_ok'] == 2000 and r['coalescing_ratio'] == 0.5
+        assert r['bytes']['client_to_kernel'] == 2000 * 48 + 2 * 36
+
+    # Raw captures carry no timestamps: counts and pairing only.
+    raw_summary = summarize_frames(iter_buffer_frames(bytes(raw)))
+    rr = raw_summary.report()
+    assert rr['frames'] == {'client_to_kernel': 1000, 'kernel_to_client': 1000}
+    assert rr['paired'] == 1000 and rr['latency_ns'] == {}
+
+    # Requests that are never answered are evicted once max_pending are held.
+    s = CaptureSummary(max_pending=8)
+    for i in range(100):
+        fb.begin(i)
+        fb.add_surface_present(i, 1, i)
+        s.add(fb.finish(), TO_KERNEL, i)
+    assert s.unanswered == 92 and s.pending_high_water == 8
+    s.finish()
+    assert s.unanswered == 100
+    print(f"  {r['paired']} paired, p50 {present['p50']} ns, "
+          f"coalesced {r['coalescing_ratio']:.0%}, 92 evicted at max_pending=8")
+
+
+def test_columns():
+    """load_columns() agrees with message-by-message decoding of the same capture."""
+    try:
+        import numpy as np
+    except ImportError:
+        print("  numpy not installed, skipped")
+        return
+    from drawfs_capture import CaptureWriter, TO_KERNEL, FROM_KERNEL
+    from drawfs_columns import load_columns
+
+    fb = FrameBuilder()
+    raw = bytearray()
+    expected = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "run.dfcap")
+        with CaptureWriter(path, background=False) as cap:
+            for i in range(300):
+                t = 1000 * i
+                fb.begin(i)
+                for k in range(i % 4 + 1):      # 1-4 messages per frame
+                    fb.add_surface_present(4 * i + k, 1 + k, 7 * i + k)
+                request = bytes(fb.finish())
+                fb.begin(i)
+                if i % 50 == 0:
+                    fb.add_msg(RPL_ERROR, 4 * i, struct.pack("<III", ERR_INVALID_HANDLE, 0, 16))
+                else:
+                    fb.add_msg(RPL_SURFACE_PRESENT, 4 * i, struct.pack("<iIQ", 0, 1, 7 * i))
+                reply = bytes(fb.finish())
+                cap.write(FROM_KERNEL, 2, reply, ts_ns=t + 500)
+                cap.write(TO_KERNEL, 2, request, ts_ns=t)
+                raw += request + b"junk" * (i % 3 == 0) + reply
+                for frame, ts in ((request, t), (reply, t + 500)):
+                    pos = FH_SIZE
+                    while pos < len(frame):
+                        mt, _, size, mid, _ = parse_msg_header(frame, pos)
+                        expected.append((ts, i, mt, mid))
+                        pos += (size + 3) & ~3
+
+        cols = load_columns(path)
+        assert cols.malformed == 0
+        m = cols.messages
+        assert len(cols) == len(expected) == 300 * 3.5, len(cols)
+        got = list(zip(m['ts_ns'].tolist(), m['frame_id'].tolist(), m['msg_type'].tolist(),
+                       m['msg_id'].tolist()))
+        assert got == expected
+        assert set(m['session_id'].tolist()) == {2}
+        assert (m['direction'] == np.where(m['msg_type'] < 0x8000, TO_KERNEL, FROM_KERNEL)).all()
+
+        presents = cols.select(m['msg_type'] == REQ_SURFACE_PRESENT)
+        assert presents.has('surface_id').all() and presents.has('cookie').all()
+        assert presents['cookie'][:5].tolist() == [0, 7, 8, 14, 15]
+        groups = presents.group_by('surface_id', 'cookie')
+        assert sorted(groups) == [1, 2, 3, 4] and len(groups[1]) == 300
+        assert groups[4].tolist() == [7 * i + 3 for i in range(3, 300, 4)]
+        errors = cols.select(cols.has('status') & (cols['status'] != 0))
+        assert len(errors) == 6 and set(errors['status'].tolist()) == {ERR_INVALID_HANDLE}
+        assert cols.counts('msg_type') == {REQ_SURFACE_PRESENT: 750, RPL_SURFACE_PRESENT: 294,
+                                           RPL_ERROR: 6}
+
+    # Raw captures decode the same messages in file order, skipping garbage.
+    raw_cols = load_columns(bytes(raw))
+    assert len(raw_cols) == len(cols)
+    assert sorted(raw_cols['msg_id'].tolist()) == sorted(m['msg_id'].tolist())
+    assert raw_cols.counts('msg_type') == cols.counts('msg_type')
+    assert not raw_cols['ts_ns'].any()
+
+    # Frame bounds of damaged raw captures match FrameScanner: false
+    # magics, headers with bad sizes, stray bytes and a torn tail.
+    from drawfs_columns import _frame_bounds
+    from drawfs_dump import FrameScanner, FRAME
+    fake = struct.pack("<IHHII", 0x31575244, 0x0100, FH_SIZE, 17, 0)
+    damaged = bytearray(raw)
+    for k, at in enumerate(range(100, len(damaged), 997)):
+        damaged[at:at] = (b"DRW1", fake, b"\x00" * (k % 5))[k % 3]
+    for data in (bytes(damaged), bytes(damaged[:-7]), bytes(damaged[:13]), b""):
+        want = [(o, n) for o, n, kind in FrameScanner().scan(data, len(data)) if kind == FRAME]
+        starts, lengths = _frame_bounds(np, data)
+        assert list(zip(starts.tolist(), lengths.tolist())) == want
+    print(f"  {len(cols)} messages in {cols.frames} frames, {len(errors)} errors, "
+          f"{len(groups)} surfaces")
+
+
+def test_parallel_summary():
+    """Sections resync on DRW1, including false magics in payloads, and merge in file order."""
+    from drawfs_capture import CaptureWriter, TO_KERNEL, FROM_KERNEL
+    from drawfs_dump import (summarize_capture, summarize_frames, summarize_parallel,
+                             iter_file_frames)
+
+    fb = FrameBuilder()
+    fake_header = struct.pack("<IHHII", 0x31575244, 0x0100, FH_SIZE, 64, 9)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "run.dfcap")
+        raw_path = os.path.join(tmp, "run.bin")
+        with CaptureWriter(path, background=False) as cap, open(raw_path, "wb") as raw:
+            for i in range(400):
+                fb.begin(i)
+                fb.add_surface_present(2 * i, 1, i)
+                if i % 7 == 0:                  # a 'DRW1' header inside a payload
+                    fb.add_msg(0x7777, 2 * i + 1, fake_header)
+                request = bytes(fb.finish())
+                fb.begin(i)
+                fb.add_msg(RPL_SURFACE_PRESENT, 2 * i, struct.pack("<iIQ", -(i % 5 == 0), 1, i))
+                reply = bytes(fb.finish())
+                order = ((FROM_KERNEL, reply, 1000 * i + 300 + i), (TO_KERNEL, request, 1000 * i))
+                for direction, frame, ts in (order if i % 3 == 0 else order[::-1]):
+                    cap.write(direction, 1, frame, ts_ns=ts)
+                raw.write(request + (b"\xee" * 12 if i % 11 == 0 else b"") + reply)
+
+        def report(summary):
+            r = summary.report()
+            del r['pending_high_water']
+            return r
+
+        serial = report(summarize_capture(path))
+        serial_raw = report(summarize_frames(iter_file_frames(raw_path)))
+        assert serial['paired'] == 400 and serial['unanswered'] == 58
+        assert serial_raw['malformed'] == 37
+        for chunk in (64, 250, 1000, 4099):
+            assert report(summarize_parallel(path, 1, chunk)) == serial, chunk
+            assert report(summarize_parallel(raw_path, 1, chunk)) == serial_raw, chunk
+        assert report(summarize_parallel(path, 2, 250)) == serial
+        assert report(summarize_parallel(raw_path, 2, 250)) == serial_raw
+    print(f"  {serial['paired']} paired, {serial['unanswered']} unanswered, "
+          f"{serial_raw['malformed']} resyncs in the raw capture, same for every section size")
+
+
+def main():
+    tests = [
+        ("FrameBuilder matches make_frame", test_builder_matches_make_frame),
+        ("FrameBuilder reuse and growth", test_builder_reuse_and_growth),
+        ("FrameBuilder multiple frames", test_builder_multi_frame),
+        ("FrameDecoder chunking", test_decoder_chunking),
+        ("FrameDecoder validation", test_decoder_validation),
+        ("Read helpers with decoder", test_read_helpers_with_decoder),
+        ("Bulk drain", test_drain_batch),
+        ("Payload codecs", test_payload_codecs),
+        ("Capture scanning", test_capture_scanning),
+        ("dfcap index", test_dfcap_index),
+        ("Capture summary", test_capture_summary),
+        ("Columnar decode", test_columns),
+        ("Parallel summary", test_parallel_summary),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_fn in tests:
+        try:
+            print(f"[TEST] {name}")
+            test_fn()
+            print(f"[PASS] {name}\n")
+            passed += 1
+        except Exception as e:
+            print(f"[FAIL] {name}: {e}\n")
+            failed += 1
+
+    print(f"Results: {passed} passed, {failed} failed")
+    if failed > 0:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
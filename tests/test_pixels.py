@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+test_pixels.py - NumPy surface view tests
+
+These tests run over anonymous mmaps laid out like surfaces and do not need
+/dev/draw.  They need numpy.
+
+Tests:
+  - Array shape, stride padding and zero-copy writes
+  - fill and fill_rect clip to the visible width
+  - copy_from accepts uint32 and (h, w, 4) uint8 images, clipped
+"""
+
+import mmap
+import struct
+import numpy as np
+from drawfs_test import MappedSurface
+from drawfs_pixels import SurfacePixels, xrgb
+
+
+def _surface(width: int, height: int, stride: int) -> MappedSurface:
+    mm = mmap.mmap(-1, stride * height)
+    surf = MappedSurface(1, stride, stride * height, mm)
+    surf.width = width
+    return surf
+
+
+def test_array_layout():
+    """Pixels land at y * stride + x * 4 as little-endian XRGB."""
+    surf = _surface(10, 4, 48)
+    px = SurfacePixels(surf)
+    assert px.array.shape == (4, 12) and px.array.dtype == np.uint32
+    assert px.visible.shape == (4, 10)
+    px.visible[2, 3] = xrgb(0x11, 0x22, 0x33)
+    off = 2 * 48 + 3 * 4
+    assert bytes(surf.view[off:off + 4]) == b"\x33\x22\x11\x00"
+    assert struct.unpack_from("<I", surf.mmap, off)[0] == 0x00112233
+    print(f"  {px.array.shape} array over a {surf.total} byte mapping")
+
+
+def test_fill_clipping():
+    """fill leaves stride padding alone; fill_rect clips at every edge."""
+    surf = _surface(10, 4, 48)
+    surf.mmap[:] = b"\xee" * surf.total
+    px = SurfacePixels(surf)
+    px.fill(1)
+    assert (px.visible == 1).all()
+    assert (px.array[:, 10:] == 0xeeeeeeee).all(), "padding was overwritten"
+
+    px.fill_rect(-3, -3, 5, 5, 2)
+    px.fill_rect(8, 2, 10, 10, 3)
+    px.fill_rect(20, 20, 5, 5, 4)
+    assert (px.visible[:2, :2] == 2).all() and px.visible[2, 2] == 1
+    assert (px.visible[2:, 8:] == 3).all() and px.visible[1, 8] == 1
+    assert not (px.visible == 4).any()
+    print("  fill_rect clipped on all four sides")
+
+
+def test_copy_from():
+    """copy_from handles both source layouts and clips at the edges."""
+    px = SurfacePixels(_surface(8, 8, 32))
+    img = np.arange(16, dtype=np.uint32).reshape(4, 4)
+    px.copy_from(img, 6, -2)
+    assert (px.visible[0:2, 6:8] == img[2:4, 0:2]).all()
+    assert px.visible[2, 6] == 0
+
+    rgba = np.zeros((2, 2, 4), dtype=np.uint8)
+    rgba[..., 0] = 0x33     # blue
+    rgba[..., 2] = 0x11     # red
+    px.copy_from(rgba, 0, 6)
+    assert (px.visible[6:8, 0:2] == xrgb(0x11, 0, 0x33)).all()
+
+    try:
+        px.copy_from(np.zeros((2, 2, 3), dtype=np.uint8))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Expected ValueError for 3-channel image")
+    print("  uint32 and BGRX sources copied with clipping")
+
+
+def main():
+    tests = [
+        ("Array layout", test_array_layout),
+        ("Fill clipping", test_fill_clipping),
+        ("copy_from", test_copy_from),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_fn in tests:
+        try:
+            print(f"[TEST] {name}")
+            test_fn()
+            print(f"[PASS] {name}\n")
+            passed += 1
+        except Exception as e:
+            print(f"[FAIL] {name}: {e}\n")
+            failed += 1
+
+    print(f"Results: {passed} passed, {failed} failed")
+    if failed > 0:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ Tests:
   - Surface mmap and read/write
   - Surface present and event delivery
   - Multi-surface round-robin presentation
+  - Triple-buffered swapchain presentation
 """
 
 import errno
@@ -19,6 +20,7 @@ from drawfs_test import (
     DrawSession, FMT_XRGB8888,
     RPL_SURFACE_CREATE, RPL_ERROR
 )
+from drawfs_swapchain import Swapchain
 
 
 def test_surface_create_valid():
@@ -147,16 +149,10 @@ def test_surface_present():
         status, sid, stride, total = s.surface_create(64, 64)
         assert status == 0
 
-        st, _, _, _ = s.map_surface(sid)
-        assert st == 0
-
         # Write something
-        mm = mmap.mmap(s.fd, total, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=0)
-        try:
-            mm[:64] = b"\xff\xff\xff\x00" * 16
-            mm.flush()
-        finally:
-            mm.close()
+        surf = s.mapped(sid)
+        assert (surf.stride, surf.total) == (stride, total)
+        surf.view[:64] = b"\xff\xff\xff\x00" * 16
 
         # Present
         cookie = 0xCAFEBABE12345678
@@ -225,15 +221,7 @@ def test_multi_surface_round_robin():
         # Map and paint each with different color
         colors = [b"\xff\x00\x00\x00", b"\x00\xff\x00\x00", b"\x00\x00\xff\x00"]
         for i, (sid, stride, total) in enumerate(surfaces):
-            st, _, _, _ = s.map_surface(sid)
-            assert st == 0
-
-            mm = mmap.mmap(s.fd, total, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=0)
-            try:
-                mm[:64] = colors[i] * 16
-                mm.flush()
-            finally:
-                mm.close()
+            s.mapped(sid).view[:64] = colors[i] * 16
 
         # Present each surface 3 times in round-robin
         for round_num in range(3):
@@ -248,9 +236,35 @@ def test_multi_surface_round_robin():
                 assert ev_sid == sid
                 assert ev_cookie == cookie
 
+                # Repaint between presents through the cached mapping
+                s.mapped(sid).view[:4] = colors[i]
+
+        # Nine touches after the first three maps never remapped
+        assert s.mapper.misses == 3, f"surfaces were remapped: {s.mapper.misses} maps"
+        assert s.mapper.hits == 9
+
         print(f"  3 surfaces x 3 rounds verified")
 
 
+def test_swapchain():
+    """Swapchain buffers are reused only after their present event."""
+    with DrawSession() as s:
+        s.hello()
+        s.display_open()
+
+        with Swapchain(s, 64, 64, depth=3) as chain:
+            for frame in range(30):
+                buf = chain.acquire()
+                assert not buf.busy
+                buf.surface.view[:4] = struct.pack("<I", frame)
+                chain.present(buf)
+            chain.wait_idle()
+            assert chain.frames == 30
+            assert chain.present_errors == 0, f"{chain.present_errors} presents failed"
+
+        print(f"  30 frames, depth 3, {chain.stalls} stalls ({chain.stall_time * 1000:.1f}ms)")
+
+
 def main():
     tests = [
         ("Surface create valid", test_surface_create_valid),
@@ -263,6 +277,7 @@ def main():
         ("Surface present", test_surface_present),
         ("Present sequence", test_present_sequence),
         ("Multi-surface round-robin", test_multi_surface_round_robin),
+        ("Swapchain", test_swapchain),
     ]
 
     passed = 0